@@ -0,0 +1,58 @@
+"""Compare the in-process AST block locator with the Semgrep backend on large generated files.
+
+Usage: python benchmarks/bench_block_locators.py [--functions 100 1000 5000] [--skip-semgrep]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements")))
+
+from block_locator import DEFAULT_RULE_FILE, get_block_locator
+from synthetic import make_module
+
+RULE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements", DEFAULT_RULE_FILE))
+
+
+def time_locate(locator, path):
+    start = time.perf_counter()
+    blocks = locator.locate(path)
+    return time.perf_counter() - start, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--skip-semgrep", action="store_true")
+    args = parser.parse_args()
+
+    backends = [("ast", get_block_locator("ast"))]
+    if not args.skip_semgrep:
+        backends.append(("semgrep", get_block_locator("semgrep", rule_files=[RULE_FILE])))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for count in args.functions:
+            path = os.path.join(temp_dir, f"module_{count}.py")
+            with open(path, "w") as f:
+                f.write(make_module(count))
+
+            for name, locator in backends:
+                # Semgrep prints its findings; keep the table readable.
+                stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+                try:
+                    elapsed, blocks = time_locate(locator, path)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                rows.append((count, name, elapsed, len(blocks)))
+
+    print(f"{'functions':>10}  {'backend':<8}{'seconds':>10}{'blocks':>8}")
+    for count, name, elapsed, found in rows:
+        print(f"{count:>10}  {name:<8}{elapsed:>10.4f}{found:>8}")
+
+
+if __name__ == "__main__":
+    main()
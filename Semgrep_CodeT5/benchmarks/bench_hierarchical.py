@@ -0,0 +1,73 @@
+"""Compare how much code the model has to encode with flat and hierarchical summarization.
+
+Usage: python benchmarks/bench_hierarchical.py [FILE_OR_DIRECTORY ...] [--summary-words N]
+
+No model is run: every function gets a placeholder summary of --summary-words words, about what CodeT5+ writes,
+and the inputs that would reach the model are counted in tokens (with the CodeT5+ tokenizer when transformers is
+installed) or else in characters. The largest input shows whether parents still fit the model context.
+"""
+import argparse
+import os
+import sys
+from unittest.mock import patch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "tracing_statements")))
+
+import generate_tracing_statements
+from block_locator import AstBlockLocator, find_python_files
+from instrumentation_manifest import Manifest
+
+DEFAULT_TARGETS = [os.path.join(HERE, "..", "test_code"), os.path.join(HERE, "fixtures", "programs"),
+                   os.path.join(HERE, "..", "tracing_statements")]
+
+
+def load_counter():
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        return "characters", len
+    tokenizer = AutoTokenizer.from_pretrained(generate_tracing_statements.checkpoint, trust_remote_code=True)
+    return "tokens", lambda text: len(tokenizer(text).input_ids)
+
+
+def encoded_inputs(files, hierarchical, summary):
+    """Returns every input the model would be given for these files."""
+    inputs = []
+
+    def summarize(blocks, batch_size=None):
+        inputs.extend(blocks)
+        return [summary] * len(blocks)
+
+    plans = [generate_tracing_statements.plan_file(path, AstBlockLocator(), Manifest()) for path in files]
+    with patch.object(generate_tracing_statements, "HIERARCHICAL", hierarchical), \
+         patch.object(generate_tracing_statements, "generate_summaries", summarize):
+        generate_tracing_statements.summarize_plans(plans)
+    return inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--summary-words", type=int, default=12)
+    args = parser.parse_args()
+
+    files = []
+    for target in args.targets:
+        files.extend(find_python_files(target) if os.path.isdir(target) else [target])
+    unit, count = load_counter()
+    summary = " ".join(["word"] * args.summary_words) + "."
+
+    print(f"{len(files)} files, sizes in {unit}")
+    print(f"{'mode':<14}{'inputs':>8}{'total':>10}{'largest':>10}")
+    totals = {}
+    for mode, hierarchical in (("flat", False), ("hierarchical", True)):
+        sizes = [count(block) for block in encoded_inputs(files, hierarchical, summary)]
+        totals[mode] = sum(sizes)
+        print(f"{mode:<14}{len(sizes):>8}{sum(sizes):>10}{max(sizes, default=0):>10}")
+    if totals["flat"]:
+        print(f"Hierarchical mode encodes {1 - totals['hierarchical'] / totals['flat']:.0%} fewer {unit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Measure the overhead each instrumentation tool adds to a corpus of CPU-bound programs.
+
+Usage: python benchmarks/bench_overhead.py [--programs FILE ...] [--tools TOOL ...] [--repeat N]
+                                           [--save results.json] [--baseline previous.json] [--tolerance 0.25]
+
+Every program runs uninstrumented and under each tool in a fresh interpreter, recording wall time, peak RSS and
+the bytes of output produced (the program's stdout plus whatever the tool writes). Short programs are run several
+times in a row so every measurement lasts at least --min-time seconds. --save stores the results as a JSON
+baseline; --baseline reruns with the same number of runs per program, compares against it and exits with status 1
+when a tool stopped working or its overhead, memory or output grew by more than --tolerance. Overheads are compared as ratios to the uninstrumented run, so baselines stay
+meaningful across machines of similar speed. Measurements the baseline has no working entry for are listed as not
+compared. benchmarks/baselines/overhead.json holds the reference run, made with Python 3.12 so that the
+sys.monitoring backend is measured too; regenerate it with --save whenever a measured tool is added or changed:
+
+    python benchmarks/bench_overhead.py --baseline benchmarks/baselines/overhead.json
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACING_DIR = os.path.abspath(os.path.join(HERE, "..", "tracing_statements"))
+DEFAULT_PROGRAMS = sorted(glob.glob(os.path.join(HERE, "..", "test_code", "*.py")) +
+                          glob.glob(os.path.join(HERE, "fixtures", "programs", "*.py")))
+TOOLS = ["baseline", "trace_statements", "call_graph", "call_graph_monitoring", "call_graph_timing", "call_graph_event_log",
+         "variable_tracer", "runtime_coverage"]
+# sys.monitoring only exists from Python 3.12 on; older interpreters leave that tool out by default.
+DEFAULT_TOOLS = [tool for tool in TOOLS if tool != "call_graph_monitoring" or hasattr(sys, "monitoring")]
+RESULT_FIELDS = ("overhead", "peak_rss_kb", "output_bytes")
+MAX_ITERATIONS = 1 << 14
+
+
+def run_program(code, path, iterations):
+    for _ in range(iterations):
+        exec(code, {"__name__": "__main__", "__file__": path})
+
+
+def run_baseline(source, path, iterations, work_dir):
+    run_program(compile(source, path, "exec"), path, iterations)
+
+
+def run_trace_statements(source, path, iterations, work_dir):
+    """Every function gets the entry trace generate_tracing_statements injects; summaries are left out."""
+    from block_locator import locate_function_blocks
+    from source_rewriter import instrument_source
+    import trace_runtime
+
+    instrumented = instrument_source(source, {first: "" for first, _ in locate_function_blocks(source, path)})
+    writer = trace_runtime.configure(path=os.path.join(work_dir, "trace_log.bin"))
+    run_program(compile(instrumented, path, "exec"), path, iterations)
+    writer.close()
+
+
+def run_call_graph(source, path, iterations, work_dir, backend="settrace", timing=False, event_log=None):
+    import generate_call_graph
+
+    code = compile(source, path, "exec")
+    generate_call_graph.reset_call_graph()
+    stop_tracing = generate_call_graph.start_tracing(path, backend, timing, event_log=event_log)
+    try:
+        run_program(code, path, iterations)
+    finally:
+        stop_tracing()
+    if event_log:
+        return
+    with open(os.path.join(work_dir, "call_graph.txt"), "w") as f, contextlib.redirect_stdout(f):
+        generate_call_graph.display_call_graph(generate_call_graph.call_graph)
+        if timing:
+            print(generate_call_graph.hotspot_table(generate_call_graph.function_times))
+            print(generate_call_graph.collapsed_stacks(generate_call_graph.stack_times))
+
+
+def run_call_graph_monitoring(source, path, iterations, work_dir):
+    """The call graph built through sys.monitoring (Python 3.12+) instead of sys.settrace."""
+    run_call_graph(source, path, iterations, work_dir, backend="monitoring")
+
+
+def run_call_graph_timing(source, path, iterations, work_dir):
+    """The call graph in timing mode, with the default backend of this Python."""
+    run_call_graph(source, path, iterations, work_dir, backend="auto", timing=True)
+
+
+def run_call_graph_event_log(source, path, iterations, work_dir):
+    """The capture half of the call graph with the default backend: calls are streamed to a binary event log."""
+    run_call_graph(source, path, iterations, work_dir, backend="auto", event_log=os.path.join(work_dir, "calls.log"))
+
+
+def run_variable_tracer(source, path, iterations, work_dir):
+    from variable_tracer import VariableTracer
+
+    tracer = VariableTracer()
+    tracer.start_tracing()
+    try:
+        run_program(compile(source, path, "exec"), path, iterations)
+    finally:
+        tracer.stop_tracing()
+    tracer.output_results(os.path.join(work_dir, "variables.txt"))
+
+
+def run_runtime_coverage(source, path, iterations, work_dir):
+    """What runtime_coverage does through the coverage command line, done in-process so it can be measured alike."""
+    import coverage
+    import runtime_coverage
+
+    report_path = os.path.join(work_dir, "runtime_coverage.txt")
+    cov = coverage.Coverage(data_file=os.path.join(work_dir, ".coverage"), include=[path])
+    cov.start()
+    try:
+        run_program(compile(source, path, "exec"), path, iterations)
+    finally:
+        cov.stop()
+    cov.save()
+    with open(report_path, "w") as f:
+        cov.report(file=f, show_missing=True)
+    runtime_coverage.format_coverage_log(path, report_path, os.path.join(work_dir, "formatted.txt"))
+
+
+RUNNERS = {
+    "baseline": run_baseline,
+    "trace_statements": run_trace_statements,
+    "call_graph": run_call_graph,
+    "call_graph_monitoring": run_call_graph_monitoring,
+    "call_graph_timing": run_call_graph_timing,
+    "call_graph_event_log": run_call_graph_event_log,
+    "variable_tracer": run_variable_tracer,
+    "runtime_coverage": run_runtime_coverage,
+}
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes, Linux kilobytes
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def worker(tool, path, iterations):
+    """Runs one measurement in this (fresh) interpreter and prints it as JSON on the real stdout."""
+    sys.path.insert(0, TRACING_DIR)
+    with open(path, "r") as f:
+        source = f.read()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        with open(os.path.join(work_dir, "stdout.txt"), "w") as stdout, contextlib.redirect_stdout(stdout):
+            start = time.perf_counter()
+            RUNNERS[tool](source, os.path.abspath(path), iterations, work_dir)
+            wall_time = time.perf_counter() - start
+        output_bytes = directory_bytes(work_dir)
+
+    print(json.dumps({"wall_time": wall_time, "peak_rss_kb": peak_rss_kb(), "output_bytes": output_bytes}))
+
+
+def measure(tool, path, iterations, timeout=None):
+    command = [sys.executable, os.path.abspath(__file__), "--worker", tool, "--program", path, "--iterations", str(iterations)]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout:g}s"}
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()
+        return {"error": error[-1] if error else f"exit status {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def calibrate(path, min_time):
+    """Returns how many back-to-back runs make the uninstrumented program last at least min_time seconds."""
+    iterations = 1
+    while True:
+        result = measure("baseline", path, iterations)
+        if "error" in result or result["wall_time"] >= min_time or iterations >= MAX_ITERATIONS:
+            return iterations, result
+        iterations = min(MAX_ITERATIONS, iterations * max(2, min(16, int(min_time / max(result["wall_time"], 1e-6)) + 1)))
+
+
+def benchmark(programs, tools, repeat, min_time, timeout, previous=None):
+    """Measures every tool on every program; programs found in previous results reuse their number of runs."""
+    results = {}
+    for path in programs:
+        name = os.path.relpath(path, os.path.join(HERE, ".."))
+        if name in (previous or {}):
+            iterations = previous[name]["iterations"]
+        else:
+            iterations, _ = calibrate(path, min_time)
+        program_results = {}
+        for tool in ["baseline"] + [tool for tool in tools if tool != "baseline"]:
+            runs = []
+            for _ in range(repeat):
+                runs.append(measure(tool, path, iterations, timeout))
+                if "error" in runs[-1]:
+                    break
+            if "error" in runs[-1]:
+                program_results[tool] = runs[-1]
+                continue
+            program_results[tool] = {
+                "wall_time": statistics.median(run["wall_time"] for run in runs),
+                "peak_rss_kb": max(run["peak_rss_kb"] or 0 for run in runs),
+                "output_bytes": max(run["output_bytes"] for run in runs),
+            }
+
+        baseline = program_results["baseline"]
+        for tool, result in program_results.items():
+            if "error" not in result and "error" not in baseline:
+                result["overhead"] = result["wall_time"] / baseline["wall_time"]
+        results[name] = {"iterations": iterations, "tools": program_results}
+        print(f"Measured {name} ({iterations} runs per measurement)", file=sys.stderr)
+    return results
+
+
+def print_table(results, previous=None):
+    print(f"{'program':<42}{'tool':<18}{'ms':>9}{'overhead':>10}{'RSS MB':>9}{'output KB':>11}{'vs previous':>13}")
+    for name, program in results.items():
+        for tool, result in program["tools"].items():
+            if "error" in result:
+                print(f"{name:<42}{tool:<18}  failed: {result['error']}")
+                continue
+            change = ""
+            old = (previous or {}).get(name, {}).get("tools", {}).get(tool, {})
+            if "overhead" in old and "overhead" in result:
+                change = f"{(result['overhead'] / old['overhead'] - 1) * 100:+.0f}%"
+            print(f"{name:<42}{tool:<18}{result['wall_time'] * 1000:>9.1f}{result.get('overhead', 0):>9.2f}x"
+                  f"{result['peak_rss_kb'] / 1024:>9.1f}{result['output_bytes'] / 1024:>11.1f}{change:>13}")
+
+
+def find_regressions(results, previous, tolerance):
+    """Lists every tool that stopped working or whose overhead, peak RSS or output size grew by more than tolerance."""
+    regressions = []
+    for name, program in results.items():
+        old_tools = previous.get(name, {}).get("tools", {})
+        for tool, result in program["tools"].items():
+            old = old_tools.get(tool, {})
+            if "error" in result and old and "error" not in old:
+                regressions.append(f"{name} {tool}: {result['error']}")
+            for field in RESULT_FIELDS:
+                if field in result and old.get(field) and result[field] > old[field] * (1 + tolerance):
+                    regressions.append(f"{name} {tool}: {field} {old[field]:.6g} -> {result[field]:.6g}")
+    return regressions
+
+
+def uncompared(results, previous):
+    """Lists every working measurement that the baseline has no working entry for, so nothing was checked."""
+    missing = []
+    for name, program in results.items():
+        old_tools = previous.get(name, {}).get("tools", {})
+        for tool, result in program["tools"].items():
+            old = old_tools.get(tool, {})
+            if "error" not in result and (not old or "error" in old):
+                missing.append(f"{name} {tool}: {old.get('error', 'not in the baseline')}")
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--programs", nargs="+", default=DEFAULT_PROGRAMS)
+    parser.add_argument("--tools", nargs="+", choices=TOOLS, default=DEFAULT_TOOLS)
+    parser.add_argument("--repeat", type=int, default=3, help="Measurements per program and tool; the median time is kept")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum uninstrumented wall time per measurement")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="Seconds before a measurement is abandoned and reported as timed out")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth before a regression")
+    parser.add_argument("--worker", choices=TOOLS, help=argparse.SUPPRESS)
+    parser.add_argument("--program", help=argparse.SUPPRESS)
+    parser.add_argument("--iterations", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.program, args.iterations)
+        return
+
+    previous = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            saved = json.load(f)
+        previous = saved["results"]
+        # Call counts and backends differ between versions, e.g. 3.12 inlines comprehensions and adds sys.monitoring.
+        if saved["python"].split(".")[:2] != platform.python_version().split(".")[:2]:
+            print(f"Warning: {args.baseline} was made with Python {saved['python']}, not {platform.python_version()}; "
+                  "expect differences", file=sys.stderr)
+
+    results = benchmark([os.path.abspath(path) for path in args.programs], args.tools, args.repeat, args.min_time,
+                        args.timeout, previous)
+    print_table(results, previous)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Results saved to {args.save}")
+
+    if previous is not None:
+        for missing in uncompared(results, previous):
+            print(f"NOT COMPARED {missing}")
+        regressions = find_regressions(results, previous, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} compared with {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
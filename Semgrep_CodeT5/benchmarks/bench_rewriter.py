@@ -0,0 +1,34 @@
+"""Check that instrumenting a file scales linearly with its number of functions.
+
+Usage: python benchmarks/bench_rewriter.py [--functions 500 1000 2000 4000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements")))
+
+from block_locator import locate_function_blocks
+from source_rewriter import instrument_source
+from synthetic import make_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, nargs="+", default=[500, 1000, 2000, 4000])
+    args = parser.parse_args()
+
+    print(f"{'functions':>10}{'seconds':>10}{'us/function':>13}")
+    for count in args.functions:
+        source = make_module(count)
+        summaries = {first: "Summary." for first, _ in locate_function_blocks(source)}
+
+        start = time.perf_counter()
+        instrument_source(source, summaries)
+        elapsed = time.perf_counter() - start
+        print(f"{count:>10}{elapsed:>10.3f}{elapsed / count * 1e6:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Time the static call-graph analyzer on a generated project: serial, process pool, and warm cache.
+
+Usage: python benchmarks/bench_static_call_graph.py [--modules 200 2000] [--functions 20] [--jobs N]
+
+Each generated module holds --functions functions and a class, imports the module before it and calls into it,
+so every run resolves cross-module calls as well as local ones.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements")))
+
+import static_call_graph
+from static_call_graph import analyze_project
+from synthetic import make_module
+
+
+def make_project(root, modules, functions):
+    for i in range(modules):
+        package = os.path.join(root, f"pkg_{i // 100}")
+        os.makedirs(package, exist_ok=True)
+        init = os.path.join(package, "__init__.py")
+        if not os.path.exists(init):
+            open(init, "w").close()
+        source = make_module(functions, seed=i)
+        if i:
+            source = f"import pkg_{(i - 1) // 100}.mod_{i - 1} as previous\n\n" + source
+        calls = "\n".join(f"        func_{j}(1, 2)" for j in range(0, functions, 3))
+        previous = "        previous.Worker().run()\n" if i else ""
+        source += f"\n\nclass Worker:\n    def run(self):\n{calls}\n{previous}        return self.done()\n\n" \
+                  "    def done(self):\n        return True\n"
+        with open(os.path.join(package, f"mod_{i}.py"), "w") as f:
+            f.write(source)
+
+
+def timed(**kwargs):
+    start = time.perf_counter()
+    graph, modules, parsed = analyze_project(**kwargs)
+    return time.perf_counter() - start, sum(len(callees) for callees in graph.values()), parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, nargs="+", default=[200, 2000])
+    parser.add_argument("--functions", type=int, default=20)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print(f"{'modules':>8}{'mode':>10}{'seconds':>10}{'parsed':>8}{'edges':>8}")
+    for count in args.modules:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project = os.path.join(temp_dir, "project")
+            make_project(project, count, args.functions)
+            cache_path = os.path.join(temp_dir, "cache.sqlite3")
+            with patch.object(static_call_graph, "POOL_THRESHOLD", 0):
+                runs = [("serial", dict(jobs=1, cache_path=None)),
+                        ("pool", dict(jobs=args.jobs, cache_path=None)),
+                        ("cold", dict(jobs=args.jobs, cache_path=cache_path)),
+                        ("warm", dict(jobs=args.jobs, cache_path=cache_path))]
+                for mode, kwargs in runs:
+                    seconds, edges, parsed = timed(project_dir=project, **kwargs)
+                    print(f"{count:>8}{mode:>10}{seconds:>10.2f}{parsed:>8}{edges:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Compare one-by-one and batched CodeT5+ summarization throughput.
+
+Usage: python benchmarks/bench_summarization.py [--functions N] [--batch-sizes 1 4 8 16]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements")))
+
+import generate_tracing_statements
+from synthetic import make_functions
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    blocks = make_functions(args.functions)
+    generate_tracing_statements.CACHE_PATH = None  # Measure the model, not the summary cache
+
+    # Warm up so one-off allocation costs do not land on the first measurement.
+    generate_tracing_statements.generate_summary(blocks[0])
+
+    elapsed = time_call(lambda: [generate_tracing_statements.generate_summary(block) for block in blocks])
+    baseline = len(blocks) / elapsed
+    print(f"{'mode':<16}{'functions/sec':>14}{'speedup':>10}")
+    print(f"{'one-by-one':<16}{baseline:>14.2f}{1.0:>9.2f}x")
+
+    for batch_size in args.batch_sizes:
+        elapsed = time_call(generate_tracing_statements.generate_summaries, blocks, batch_size=batch_size)
+        throughput = len(blocks) / elapsed
+        print(f"{'batch=' + str(batch_size):<16}{throughput:>14.2f}{throughput / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare time-to-first-summary of a fresh process with and without a running summary server.
+
+Usage: python benchmarks/bench_summary_server.py [--runs N] [--backend torch|int8|onnx]
+
+Each run is a new Python process summarizing one function, like a VS Code command or a CLI run. Without the
+server it loads CodeT5+ itself; with it, it only waits for inference. The summary cache is disabled throughout.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+TRACING_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements"))
+
+CLIENT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {tracing_dir!r})
+import generate_tracing_statements, summary_server
+generate_tracing_statements.CACHE_PATH = None
+generate_tracing_statements.BACKEND = {backend!r}
+summary_server.SERVER_ADDRESS = {address!r}
+generate_tracing_statements.generate_summaries(["def add(a, b):\\n    return a + b\\n"])
+print(time.perf_counter() - start)
+"""
+
+
+def first_summary_seconds(address, backend):
+    code = CLIENT.format(tracing_dir=TRACING_DIR, backend=backend, address=address)
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def free_address():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+def wait_for_server(address, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://{address}/health", timeout=1) as response:
+                return json.load(response)
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"The summary server did not come up on {address} within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--backend", default="torch")
+    args = parser.parse_args()
+
+    cold = [first_summary_seconds("", args.backend) for _ in range(args.runs)]
+
+    address = free_address()
+    server = subprocess.Popen([sys.executable, os.path.join(TRACING_DIR, "summary_server.py"),
+                               "--address", address, "--backend", args.backend],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(address, timeout=600)
+        warm = [first_summary_seconds(address, args.backend) for _ in range(args.runs)]
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'mode':<24}{'median s':>10}{'min s':>10}")
+    print(f"{'in-process (loads model)':<24}{statistics.median(cold):>10.2f}{min(cold):>10.2f}")
+    print(f"{'summary server':<24}{statistics.median(warm):>10.2f}{min(warm):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compare the cost of entry traces written with print() and through the buffered trace runtime, with and without sampling.
+
+Usage: python benchmarks/bench_trace_runtime.py [--calls N]
+
+print() is measured writing to a block-buffered file and to a line-buffered one, which is how stdout behaves
+when it is a terminal.
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements")))
+
+import trace_runtime
+
+
+def plain(a, b):
+    return a + b
+
+
+def with_print(a, b):
+    print(f"TRACE: Entering with_print function with parameters: a={ a }, b={ b }")
+    return a + b
+
+
+def with_runtime(a, b):
+    trace_runtime.trace_call("with_runtime", ("a", "b"), a, b)
+    return a + b
+
+
+# Sampled functions are instrumented like this: one sampler per function, tested before the trace call.
+admit_sampled = trace_runtime.sampler("every:100")
+admit_rate_limited = trace_runtime.sampler("rate:1000")
+
+
+def sampled(a, b):
+    if admit_sampled(): trace_runtime.trace_call("sampled", ("a", "b"), a, b)
+    return a + b
+
+
+def rate_limited(a, b):
+    if admit_rate_limited(): trace_runtime.trace_call("rate_limited", ("a", "b"), a, b)
+    return a + b
+
+
+def time_calls(func, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i, 1)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        baseline = time_calls(plain, args.calls)
+
+        with open(os.path.join(work_dir, "stdout.txt"), "w") as stdout, contextlib.redirect_stdout(stdout):
+            printed = time_calls(with_print, args.calls)
+        with open(os.path.join(work_dir, "stdout.txt"), "w", buffering=1) as stdout, contextlib.redirect_stdout(stdout):
+            line_printed = time_calls(with_print, args.calls)
+
+        writer = trace_runtime.configure(path=os.path.join(work_dir, "trace.bin"))
+        buffered = time_calls(with_runtime, args.calls)
+        every_100 = time_calls(sampled, args.calls)
+        limited = time_calls(rate_limited, args.calls)
+        start = time.perf_counter()
+        writer.close()
+        drain = time.perf_counter() - start
+
+    print(f"{'mode':<20}{'ns/call':>10}{'slowdown':>10}")
+    modes = (("untraced", baseline), ("print (buffered)", printed), ("print (line)", line_printed), ("runtime", buffered),
+             ("runtime every:100", every_100), ("runtime rate:1000", limited))
+    for mode, elapsed in modes:
+        print(f"{mode:<20}{elapsed / args.calls * 1e9:>10.0f}{elapsed / baseline:>9.1f}x")
+    print(f"Final flush at exit: {drain:.3f}s, {writer.written} records written, {writer.dropped} dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Compare summary quality and latency of the torch, int8 and onnx inference backends.
+
+Every function in the fixture file is summarized one at a time through generate_summary. The fp32 torch
+summaries are the reference: each backend reports load time, per-function latency, exact-match rate against the
+reference, and mean word-level similarity (difflib ratio) to it. A backend whose packages are missing is reported
+as skipped; without torch there is no reference, so only load times and latencies are shown.
+
+Usage: python benchmarks/compare_backends.py [--backends torch int8 onnx] [--fixture FILE] [--output results.json]
+                                             [--baseline previous.json] [--tolerance 0.1]
+
+--output stores the results, summaries included, as a JSON baseline; --baseline compares against one and exits with
+status 1 when a backend stopped working, lost more than --tolerance of its exact-match rate or similarity, or its
+speedup over fp32 shrank by more than --tolerance. Record the reference comparison on a machine with the model stack
+(torch, transformers and optimum[onnxruntime]) and the checkpoint installed:
+
+    python benchmarks/compare_backends.py --output benchmarks/baselines/backends.json
+"""
+import argparse
+import difflib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tracing_statements")))
+
+import generate_tracing_statements
+from block_locator import AstBlockLocator
+from model_provider import BACKENDS
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "functions.py")
+
+
+def summarize_with(backend, blocks):
+    """Loads the backend through the shared provider and returns (load seconds, per-block latencies, summaries)."""
+    generate_tracing_statements.BACKEND = backend
+    generate_tracing_statements.tokenizer = generate_tracing_statements.model = None
+
+    start = time.perf_counter()
+    generate_tracing_statements.load_model()
+    load_seconds = time.perf_counter() - start
+    generate_tracing_statements.generate_summary(blocks[0])  # First call pays one-off allocation costs
+
+    latencies, summaries = [], []
+    for block in blocks:
+        start = time.perf_counter()
+        summaries.append(generate_tracing_statements.generate_summary(block))
+        latencies.append(time.perf_counter() - start)
+    return load_seconds, latencies, summaries
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, a.lower().split(), b.lower().split()).ratio()
+
+
+def find_regressions(results, previous, tolerance):
+    """Lists every backend that stopped working or whose quality or speedup dropped by more than tolerance."""
+    regressions = []
+    for backend, old in previous.items():
+        result = results.get(backend, {"error": "not measured"})
+        if "error" in result:
+            if "error" not in old:
+                regressions.append(f"{backend}: no longer runs ({result['error']})")
+            continue
+        for field in ("exact_match", "similarity", "speedup"):
+            if field in old and field in result and result[field] < old[field] * (1 - tolerance):
+                regressions.append(f"{backend}: {field} {old[field]:.3g} -> {result[field]:.3g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE)
+    parser.add_argument("--output", help="Also write the results, summaries included, to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results written by an earlier run with --output")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative drop before a regression")
+    args = parser.parse_args()
+
+    generate_tracing_statements.CACHE_PATH = None  # Measure the backends, not the summary cache
+    line_number_blocks = AstBlockLocator().locate(args.fixture)
+    blocks = generate_tracing_statements.get_blocks_from_file(args.fixture, line_number_blocks)
+
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    results = {}
+    for backend in backends:
+        try:
+            load_seconds, latencies, summaries = summarize_with(backend, blocks)
+        except ImportError as e:
+            results[backend] = {"error": str(e)}
+            continue
+        results[backend] = {"load_seconds": load_seconds, "latencies": latencies, "summaries": summaries}
+
+    reference = results["torch"] if "error" not in results["torch"] else None
+    print(f"{len(blocks)} functions from {args.fixture}\n")
+    print(f"{'backend':<8}{'load s':>8}{'mean ms':>9}{'p50 ms':>8}{'max ms':>8}{'speedup':>9}{'exact':>7}{'similarity':>12}")
+    for backend, result in results.items():
+        if "error" in result:
+            print(f"{backend:<8}  skipped: {result['error']}")
+            continue
+        latencies = result["latencies"]
+        line = (f"{backend:<8}{result['load_seconds']:>8.1f}{statistics.mean(latencies) * 1000:>9.1f}"
+                f"{statistics.median(latencies) * 1000:>8.1f}{max(latencies) * 1000:>8.1f}")
+        if reference is not None:
+            matches = [a == b for a, b in zip(result["summaries"], reference["summaries"])]
+            result["exact_match"] = sum(matches) / len(matches)
+            result["similarity"] = statistics.mean(similarity(a, b)
+                                                   for a, b in zip(result["summaries"], reference["summaries"]))
+            result["speedup"] = statistics.mean(reference["latencies"]) / statistics.mean(latencies)
+            line += f"{result['speedup']:>8.2f}x{result['exact_match']:>7.0%}{result['similarity']:>12.3f}"
+        print(line)
+    if reference is None:
+        print("\nNo torch reference, so no speedups or quality figures.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S"), "fixture": os.path.relpath(args.fixture),
+                       "blocks": blocks, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            previous = json.load(f)["results"]
+        regressions = find_regressions(results, previous, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} compared with {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
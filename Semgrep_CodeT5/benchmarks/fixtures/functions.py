@@ -0,0 +1,109 @@
+"""Fixture functions for comparing summarizer backends. They are only parsed, never imported."""
+
+
+def add(a, b):
+    return a + b
+
+
+def is_palindrome(text):
+    cleaned = [c.lower() for c in text if c.isalnum()]
+    return cleaned == cleaned[::-1]
+
+
+def fibonacci(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+def binary_search(items, target):
+    low, high = 0, len(items) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        if items[middle] == target:
+            return middle
+        if items[middle] < target:
+            low = middle + 1
+        else:
+            high = middle - 1
+    return -1
+
+
+def word_frequencies(path):
+    counts = {}
+    with open(path) as f:
+        for line in f:
+            for word in line.split():
+                word = word.strip(".,;:!?").lower()
+                if word:
+                    counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def merge_sorted(left, right):
+    merged = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] <= right[j]:
+            merged.append(left[i])
+            i += 1
+        else:
+            merged.append(right[j])
+            j += 1
+    merged.extend(left[i:])
+    merged.extend(right[j:])
+    return merged
+
+
+def flatten(nested):
+    result = []
+    for item in nested:
+        if isinstance(item, (list, tuple)):
+            result.extend(flatten(item))
+        else:
+            result.append(item)
+    return result
+
+
+def parse_key_value_pairs(text, separator="="):
+    pairs = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.partition(separator)
+        pairs[key.strip()] = value.strip()
+    return pairs
+
+
+def moving_average(values, window):
+    if window <= 0:
+        raise ValueError("window must be positive")
+    averages = []
+    total = 0
+    for index, value in enumerate(values):
+        total += value
+        if index >= window:
+            total -= values[index - window]
+        if index >= window - 1:
+            averages.append(total / window)
+    return averages
+
+
+class Inventory:
+    def __init__(self):
+        self.items = {}
+
+    def add_item(self, name, quantity):
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+        self.items[name] = self.items.get(name, 0) + quantity
+
+    def remove_item(self, name, quantity):
+        available = self.items.get(name, 0)
+        if quantity > available:
+            raise KeyError(f"only {available} {name} left")
+        self.items[name] = available - quantity
+        if self.items[name] == 0:
+            del self.items[name]
@@ -0,0 +1,31 @@
+"""Library-bound code: a few short functions that hand most of the work to pure-Python standard library modules."""
+import difflib
+import statistics
+import textwrap
+from fractions import Fraction
+
+
+def paragraphs(count):
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    return [" ".join(words[(i + j) % len(words)] for j in range(60)) for i in range(count)]
+
+
+def wrap_all(texts):
+    return [textwrap.fill(text, width=40) for text in texts]
+
+
+def compare(texts):
+    ratios = []
+    for left, right in zip(texts, texts[1:]):
+        ratios.append(difflib.SequenceMatcher(None, left, right).ratio())
+    return statistics.mean(ratios)
+
+
+def harmonic(limit):
+    return sum(Fraction(1, n) for n in range(1, limit))
+
+
+texts = paragraphs(40)
+wrap_all(texts)
+compare(texts)
+harmonic(300)
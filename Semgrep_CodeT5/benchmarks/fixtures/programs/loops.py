@@ -0,0 +1,40 @@
+"""Tight loops inside a few long-running functions: few calls, many executed lines."""
+
+
+def sieve(limit):
+    is_prime = [True] * (limit + 1)
+    is_prime[0] = is_prime[1] = False
+    for number in range(2, int(limit ** 0.5) + 1):
+        if is_prime[number]:
+            for multiple in range(number * number, limit + 1, number):
+                is_prime[multiple] = False
+    return [number for number, prime in enumerate(is_prime) if prime]
+
+
+def matrix_multiply(left, right):
+    size = len(left)
+    result = [[0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(size):
+            total = 0
+            for k in range(size):
+                total += left[i][k] * right[k][j]
+            result[i][j] = total
+    return result
+
+
+def collatz_lengths(limit):
+    lengths = {}
+    for start in range(1, limit):
+        value, steps = start, 0
+        while value != 1:
+            value = value // 2 if value % 2 == 0 else 3 * value + 1
+            steps += 1
+        lengths[start] = steps
+    return max(lengths.values())
+
+
+sieve(20000)
+matrix = [[(i * j) % 7 for j in range(24)] for i in range(24)]
+matrix_multiply(matrix, matrix)
+collatz_lengths(2000)
@@ -0,0 +1,52 @@
+"""Object-oriented code: small methods, strings and containers passed around."""
+
+
+class Inventory:
+    def __init__(self):
+        self.items = {}
+
+    def add(self, name, quantity):
+        self.items[name] = self.items.get(name, 0) + quantity
+
+    def remove(self, name, quantity):
+        if self.items.get(name, 0) < quantity:
+            return False
+        self.items[name] -= quantity
+        return True
+
+    def report(self):
+        return ", ".join(f"{name}={count}" for name, count in sorted(self.items.items()))
+
+
+class Order:
+    def __init__(self, customer, lines):
+        self.customer = customer
+        self.lines = lines
+
+    def total(self, prices):
+        return sum(prices[name] * quantity for name, quantity in self.lines)
+
+
+def normalize(text):
+    return " ".join(word.capitalize() for word in text.split())
+
+
+def run_shop(rounds):
+    prices = {f"item{i}": i + 1 for i in range(20)}
+    inventory = Inventory()
+    for name in prices:
+        inventory.add(name, 50)
+    revenue = 0
+    for round_number in range(rounds):
+        customer = normalize(f"customer number {round_number % 13}")
+        lines = [(f"item{(round_number + k) % 20}", 1 + k % 3) for k in range(4)]
+        order = Order(customer, lines)
+        if all(inventory.remove(name, quantity) for name, quantity in lines):
+            revenue += order.total(prices)
+        else:
+            for name in prices:
+                inventory.add(name, 10)
+    return revenue, inventory.report()
+
+
+run_shop(600)
@@ -0,0 +1,28 @@
+"""Deep and branching recursion: many short calls with small integer arguments."""
+
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+
+def ackermann(m, n):
+    if m == 0:
+        return n + 1
+    if n == 0:
+        return ackermann(m - 1, 1)
+    return ackermann(m - 1, ackermann(m, n - 1))
+
+
+def hanoi(disks, source, target, spare, moves):
+    if disks:
+        hanoi(disks - 1, source, spare, target, moves)
+        moves.append((source, target))
+        hanoi(disks - 1, spare, target, source, moves)
+    return moves
+
+
+fib(16)
+ackermann(2, 40)
+hanoi(10, "a", "c", "b", [])
@@ -0,0 +1,46 @@
+"""Synthetic Python sources shared by the benchmarks in this folder."""
+import random
+
+FUNCTION_TEMPLATES = [
+    '''def {name}(a, b):
+    return a + b
+''',
+    '''def {name}(items, threshold=0):
+    total = 0
+    for item in items:
+        if item > threshold:
+            total += item
+        else:
+            total -= 1
+    return total
+''',
+    '''def {name}(text):
+    words = []
+    current = []
+    for char in text:
+        if char == " ":
+            if current:
+                words.append("".join(current))
+                current = []
+        else:
+            current.append(char)
+    if current:
+        words.append("".join(current))
+    counts = {{}}
+    for word in words:
+        counts[word] = counts.get(word, 0) + 1
+    ordered = sorted(counts.items(), key=lambda pair: (-pair[1], pair[0]))
+    return [word for word, _ in ordered[:10]]
+''',
+]
+
+
+def make_functions(count, seed=0):
+    """Return `count` function sources of mixed length, deterministic for a given seed."""
+    rng = random.Random(seed)
+    return [rng.choice(FUNCTION_TEMPLATES).format(name=f"func_{i}") for i in range(count)]
+
+
+def make_module(count, seed=0):
+    """Return a module source containing `count` top-level functions."""
+    return "\n\n".join(make_functions(count, seed))
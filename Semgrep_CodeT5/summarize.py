@@ -1,13 +1,14 @@
 import re
-from transformers import AutoModel, AutoTokenizer
+import time
+from tracing_statements.model_provider import get_provider
+from tracing_statements.generation_policy import GenerationPolicy, GenerationStats, token_counts
 
 # Specify the checkpoint and device
 checkpoint = "Salesforce/codet5p-220m-bimodal"
 device = "cpu"  # Change to "cuda" if GPU is available
 
-# Load the tokenizer and model
-tokenizer = AutoTokenizer.from_pretrained(checkpoint, trust_remote_code=True)
-model = AutoModel.from_pretrained(checkpoint, trust_remote_code=True).to(device)
+# Scales the decode budget with function size and windows functions longer than the model context
+policy = GenerationPolicy()
 
 # Input and output file paths
 file_path = "functions.py"
@@ -39,30 +40,46 @@ def add_summary_to_function(function_code, summary):
     return "\n".join(result)
 
 
-# Read the input file
-with open(file_path, "r") as file:
-    code = file.read()
-
-# Split the code into individual functions
-functions = split_into_functions(code)
-
-# Annotate each function with a summary
-annotated_functions = []
-for func in functions:
-    # Tokenize the function code
-    input_ids = tokenizer(func, return_tensors="pt").input_ids.to(device)
-    
-    # Generate summary
-    generated_ids = model.generate(input_ids, max_length=200)
-    summary = tokenizer.decode(generated_ids[0], skip_special_tokens=True)
-    
-    # Add the summary to the function
-    annotated_function = add_summary_to_function(func, summary)
-    annotated_functions.append(annotated_function)
-
-# Combine the annotated functions back into a single code block
-annotated_code = "\n\n".join(annotated_functions)
-
-# Write the annotated code to the output file
-with open(output_file, "w") as file:
-    file.write(annotated_code)
+def main():
+    # The tokenizer and model are shared with the tracing tools and only loaded now
+    tokenizer, model = get_provider(checkpoint, device).load()
+
+    # Read the input file
+    with open(file_path, "r") as file:
+        code = file.read()
+
+    # Split the code into individual functions
+    functions = split_into_functions(code)
+
+    # Annotate each function with a summary
+    annotated_functions = []
+    stats = GenerationStats()
+    for func in functions:
+        # Tokenize the function code, keeping its head and tail when it is too long for the model
+        encoded = tokenizer(func).input_ids
+        fitted = policy.fit_input(encoded)
+        input_ids = tokenizer.pad({"input_ids": [fitted]}, return_tensors="pt").input_ids.to(device)
+
+        # Generate summary
+        start = time.perf_counter()
+        generated_ids = model.generate(input_ids, **policy.generate_kwargs(tokenizer, [len(fitted)]))
+        stats.record(time.perf_counter() - start, [len(fitted)], token_counts(generated_ids, tokenizer.pad_token_id),
+                     windowed=int(len(fitted) < len(encoded)))
+        summary = tokenizer.decode(generated_ids[0], skip_special_tokens=True)
+
+        # Add the summary to the function
+        annotated_function = add_summary_to_function(func, summary)
+        annotated_functions.append(annotated_function)
+
+    # Combine the annotated functions back into a single code block
+    annotated_code = "\n\n".join(annotated_functions)
+
+    # Write the annotated code to the output file
+    with open(output_file, "w") as file:
+        file.write(annotated_code)
+
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
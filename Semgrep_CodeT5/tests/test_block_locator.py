@@ -0,0 +1,106 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+from block_locator import (AstBlockLocator, SemgrepBlockLocator, find_python_files, get_block_locator,
+                           group_semgrep_results, locate_function_blocks, enclosing_blocks)
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestBlockLocator(unittest.TestCase):
+
+    def test_ast_locator_finds_methods(self):
+        test_script = os.path.join(BASE_PATH, "../test_code/test_code.py")
+        blocks = AstBlockLocator().locate(test_script)
+        self.assertEqual(blocks, [(2, 4), (6, 11), (13, 20), (22, 33), (35, 41), (43, 47), (50, 58)])
+
+    def test_async_and_nested_functions(self):
+        source = textwrap.dedent("""\
+            async def fetch(url):
+                return url
+
+            def outer(a, *args, **kwargs):
+                def inner(b):
+                    return b
+                return inner(a)
+
+            class Widget:
+                @property
+                def size(self) -> int:
+                    return 1
+            """)
+        self.assertEqual(locate_function_blocks(source), [(1, 2), (4, 7), (5, 6), (11, 12)])
+
+    def test_enclosing_blocks(self):
+        blocks = [(1, 2), (4, 12), (5, 10), (6, 7), (11, 12), (14, 15)]
+        self.assertEqual(enclosing_blocks(blocks), {2: 1, 3: 2, 4: 1})
+
+    def test_unparsable_file_returns_no_blocks(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+            f.write("def broken(:\n")
+        try:
+            self.assertEqual(AstBlockLocator().locate(f.name), [])
+        finally:
+            os.remove(f.name)
+
+    def test_get_block_locator(self):
+        self.assertIsInstance(get_block_locator("ast"), AstBlockLocator)
+        self.assertEqual(get_block_locator("semgrep", rule_files="custom.yaml").rule_files, ["custom.yaml"])
+        with self.assertRaises(ValueError):
+            get_block_locator("regex")
+
+    def test_group_semgrep_results(self):
+        """JSON matches are fanned out per file, merged across rules, and scanned files without matches are kept."""
+        report = {
+            "results": [
+                {"check_id": "method_detection", "path": "pkg/a.py", "start": {"line": 5}, "end": {"line": 9}},
+                {"check_id": "async_detection", "path": "pkg/a.py", "start": {"line": 1}, "end": {"line": 3}},
+                {"check_id": "other_rule", "path": "pkg/a.py", "start": {"line": 5}, "end": {"line": 9}},
+                {"check_id": "method_detection", "path": "pkg/b.py", "start": {"line": 2}, "end": {"line": 4}},
+            ],
+            "paths": {"scanned": ["pkg/a.py", "pkg/b.py", "pkg/c.py"]},
+        }
+        self.assertEqual(group_semgrep_results(report), {
+            os.path.abspath("pkg/a.py"): [(1, 3), (5, 9)],
+            os.path.abspath("pkg/b.py"): [(2, 4)],
+            os.path.abspath("pkg/c.py"): [],
+        })
+
+    def test_find_python_files_skips_hidden_directories(self):
+        with tempfile.TemporaryDirectory() as project:
+            for relative in ("a.py", "pkg/b.py", "pkg/notes.txt", ".venv/c.py", "pkg/__pycache__/d.py"):
+                path = os.path.join(project, relative)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, "w").close()
+            found = [os.path.relpath(path, project) for path in find_python_files(project)]
+        self.assertEqual(found, ["a.py", os.path.join("pkg", "b.py")])
+
+    @unittest.skipUnless(shutil.which("semgrep"), "Semgrep is not installed")
+    def test_project_prefetch_matches_ast(self):
+        """One Semgrep pass over test_code/ finds the same functions as the AST locator in every file."""
+        rule_file = os.path.join(BASE_PATH, "../tracing_statements/rule.yaml")
+        project = os.path.join(BASE_PATH, "../test_code")
+        locator = SemgrepBlockLocator(rule_file)
+        locator.prefetch(project)
+
+        for path in find_python_files(project):
+            self.assertIn(os.path.abspath(path), locator.results)
+            self.assertEqual([first for first, _ in locator.locate(path)],
+                             [first for first, _ in AstBlockLocator().locate(path)])
+
+    @unittest.skipUnless(shutil.which("semgrep"), "Semgrep is not installed")
+    def test_backends_agree_on_function_starts(self):
+        rule_file = os.path.join(BASE_PATH, "../tracing_statements/rule.yaml")
+        target_file = os.path.join(BASE_PATH, "../test_code/sample2.py")
+        semgrep_blocks = SemgrepBlockLocator(rule_file).locate(target_file)
+        ast_blocks = AstBlockLocator().locate(target_file)
+        self.assertEqual([first for first, _ in semgrep_blocks], [first for first, _ in ast_blocks])
+
+if __name__ == "__main__":
+    unittest.main()
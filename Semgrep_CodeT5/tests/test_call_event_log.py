@@ -0,0 +1,182 @@
+import unittest
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+import call_graph_builder
+import generate_call_graph
+from call_event_log import CALL, RETURN, CallEventWriter, read_events, read_shards, shard_path, shard_paths
+from call_graph_export import labeled_edges
+from generate_call_graph import call_graph, reset_call_graph, replay_events, start_tracing
+
+THREADS = ("import threading\n\n"
+           "def leaf(n):\n    return n if n < 2 else leaf(n - 1)\n\n"
+           "def work():\n    for i in range(50):\n        leaf(i % 4)\n\n"
+           "def main():\n    threads = [threading.Thread(target=work, name=f'worker-{i}') for i in range(3)]\n"
+           "    for thread in threads:\n        thread.start()\n    work()\n"
+           "    for thread in threads:\n        thread.join()\n\nmain()\n")
+
+PROCESSES = ("import multiprocessing\nimport subprocess\nimport sys\n\n"
+             "def square(n):\n    return helper(n) * n\n\n"
+             "def helper(n):\n    return n\n\n"
+             "if __name__ == '__main__':\n"
+             "    if sys.argv[1:] == ['child']:\n        helper(0)\n    else:\n"
+             "        with multiprocessing.Pool(2) as pool:\n            pool.map(square, range(20))\n"
+             "        subprocess.run([sys.executable, __file__, 'child'], check=True)\n        helper(0)\n")
+
+MAIN, HELPER, LIBRARY = ("app.py", 1, "main"), ("app.py", 5, "helper"), ("/lib/json/encoder.py", 10, "encode")
+
+
+class TestCallEventLog(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.log = os.path.join(self.temp_dir, "calls.log")
+        self.addCleanup(reset_call_graph)
+
+    def trace(self, event_log=None):
+        script = os.path.join(self.temp_dir, "threads.py")
+        with open(script, "w") as f:
+            f.write(THREADS)
+        reset_call_graph()
+        stop_tracing = start_tracing(script, "settrace", event_log=event_log)
+        try:
+            exec(compile(THREADS, script, "exec"), {"__name__": "__main__"})
+        finally:
+            stop_tracing()
+        return {name: sorted(labeled_edges(graph)) for name, graph in generate_call_graph.calls_by_context().items()}
+
+    def test_round_trip(self):
+        writer = CallEventWriter(self.log, flush_bytes=16)
+        writer.call("MainThread", MAIN)
+        writer.call("worker-0", HELPER)
+        writer.call("MainThread", HELPER)
+        writer.ret("MainThread")
+        writer.ret("worker-0")
+        writer.ret("MainThread")
+        writer.close()
+
+        events = list(read_events(self.log))
+        self.assertEqual([event[:3] for event in events],
+                         [(CALL, "MainThread", MAIN), (CALL, "worker-0", HELPER), (CALL, "MainThread", HELPER),
+                          (RETURN, "MainThread", None), (RETURN, "worker-0", None), (RETURN, "MainThread", None)])
+        times = [event[3] for event in events]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(writer.events, 6)
+
+    def test_truncated_log_ends_at_the_last_whole_event(self):
+        writer = CallEventWriter(self.log)
+        for _ in range(3):
+            writer.call("MainThread", MAIN)
+            writer.ret("MainThread")
+        writer.close()
+        with open(self.log, "rb") as f:
+            data = f.read()
+        with open(self.log, "wb") as f:
+            f.write(data[:-1])
+        self.assertEqual([event[0] for event in read_events(self.log)], [CALL, RETURN] * 2 + [CALL])
+
+        with open(self.log, "wb") as f:
+            f.write(b"not a log")
+        with self.assertRaises(ValueError):
+            list(read_events(self.log))
+
+    def test_replay_matches_live_tracing(self):
+        live = self.trace()
+        live_graph = {caller: dict(callees) for caller, callees in call_graph.items()}
+        self.assertEqual(self.trace(event_log=self.log), {})  # Nothing is kept in memory while logging
+
+        replay_events(read_events(self.log))
+        self.assertEqual({caller: dict(callees) for caller, callees in call_graph.items()}, live_graph)
+        replayed = {name: sorted(labeled_edges(graph))
+                    for name, graph in generate_call_graph.calls_by_context().items()}
+        self.assertEqual(replayed, live)
+        self.assertEqual(set(replayed), {"MainThread", "worker-0", "worker-1", "worker-2"})
+        self.assertEqual(generate_call_graph.function_times[next(f for f in live_graph if f[2] == "work")][0], 4)
+
+    def test_replayed_timings(self):
+        """The same events give the same timings as test_timing_mode measures live."""
+        events = [(CALL, "MainThread", MAIN, 0), (CALL, "MainThread", HELPER, 10), (RETURN, "MainThread", None, 30),
+                  (CALL, "MainThread", HELPER, 40), (RETURN, "MainThread", None, 45), (RETURN, "MainThread", None, 100)]
+        replay_events(events)
+        self.assertEqual(generate_call_graph.function_times[MAIN], [1, 100, 75])
+        self.assertEqual(generate_call_graph.function_times[HELPER], [2, 25, 25])
+        self.assertEqual(generate_call_graph.edge_times[MAIN, HELPER], [25, 25])
+
+    def test_filtered_views(self):
+        events = [(CALL, "MainThread", MAIN, 0), (CALL, "MainThread", LIBRARY, 1), (CALL, "MainThread", HELPER, 2),
+                  (RETURN, "MainThread", None, 3), (RETURN, "MainThread", None, 4), (RETURN, "MainThread", None, 5),
+                  (CALL, "worker-0", HELPER, 6), (RETURN, "worker-0", None, 7)]
+        replay_events(events)
+        self.assertIn(("encode", "helper", 1), labeled_edges(call_graph))
+
+        replay_events(events, exclude=["/lib/*"])
+        self.assertEqual(sorted(labeled_edges(call_graph)),
+                         [("Program Start", "helper", 1), ("Program Start", "main", 1), ("main", "helper", 1)])
+        self.assertEqual(generate_call_graph.function_times[MAIN], [1, 5, 4])
+
+        replay_events(events, context_names={"worker-0"})
+        self.assertEqual(labeled_edges(call_graph), [("Program Start", "helper", 1)])
+
+    def test_builder(self):
+        self.trace(event_log=self.log)
+        output = os.path.join(self.temp_dir, "graph.json")
+        collapsed = os.path.join(self.temp_dir, "calls.collapsed")
+        with redirect_stdout(io.StringIO()) as stdout:
+            call_graph_builder.main([self.log, "--output", output, "--context", "worker-1", "--collapsed", collapsed])
+        self.assertIn("in 4 contexts", stdout.getvalue())
+        with open(output) as f:
+            edges = {(edge["caller"], edge["callee"]): edge for edge in json.load(f)["edges"]}
+        self.assertEqual(edges["work", "leaf"]["calls"], 50)
+        self.assertIn("inclusive_ns", edges["work", "leaf"])
+        with open(collapsed) as f:
+            self.assertTrue(f.read().startswith("Program Start;work"))
+
+    def test_shards_are_merged_per_process(self):
+        for pid, calls in ((200, 3), (100, 2)):
+            writer = CallEventWriter(shard_path(self.temp_dir, pid))
+            writer.call("MainThread", MAIN)
+            for _ in range(calls):
+                writer.call("MainThread", HELPER)
+                writer.ret("MainThread")
+            writer.ret("MainThread")
+            writer.close()
+        open(shard_path(self.temp_dir, 300), "wb").close()  # Killed before writing anything
+
+        paths = shard_paths(self.temp_dir)
+        self.assertEqual([os.path.basename(path) for path in paths], ["calls-100.log", "calls-200.log", "calls-300.log"])
+        replay_events(read_shards(paths))
+        self.assertIn(("main", "helper", 5), labeled_edges(call_graph))
+        contexts = {name: labeled_edges(graph) for name, graph in generate_call_graph.calls_by_context().items()}
+        self.assertEqual(contexts, {"100/MainThread": [("Program Start", "main", 1), ("main", "helper", 2)],
+                                    "200/MainThread": [("Program Start", "main", 1), ("main", "helper", 3)]})
+
+    def test_process_capture(self):
+        """Pool workers and Python subprocesses are traced into shards of their own and merged by process."""
+        with open(os.path.join(self.temp_dir, "test_code.py"), "w") as f:
+            f.write(PROCESSES)
+        script = os.path.join(os.path.dirname(__file__), "..", "tracing_statements", "generate_call_graph.py")
+        subprocess.run([sys.executable, os.path.abspath(script), "--processes", "shards", "--output", "graph.json"],
+                       cwd=self.temp_dir, check=True, stdout=subprocess.DEVNULL, timeout=120)
+        with open(os.path.join(self.temp_dir, "graph.json")) as f:
+            edges = {(edge["caller"], edge["callee"]): edge for edge in json.load(f)["edges"]}
+
+        self.assertEqual(edges["square", "helper"]["calls"], 20)
+        workers = {name.split("/")[0] for name in edges["square", "helper"]["contexts"]}
+        self.assertGreaterEqual(len(workers), 1)
+        helper_processes = {name.split("/")[0] for name in edges["<module>", "helper"]["contexts"]}
+        self.assertEqual(len(helper_processes), 2)  # The parent and its subprocess
+        self.assertTrue(workers.isdisjoint(helper_processes))
+        self.assertGreaterEqual(len(os.listdir(os.path.join(self.temp_dir, "shards"))), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,11 +2,29 @@
 import unittest
 import sys
 import os
-from collections import defaultdict
+import json
+import xml.etree.ElementTree as ET
+import tempfile
+from unittest.mock import patch
+from collections import Counter, defaultdict
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
 
-from tracing_statements.generate_call_graph import create_trace_calls, display_call_graph, call_graph
+from tracing_statements import generate_call_graph
+
+from tracing_statements.generate_call_graph import (create_trace_calls, display_call_graph, call_graph, call_stack, start_tracing,
+                                                    labeled_edges, call_graph_to_dot, save_call_graph, PROGRAM_START,
+                                                    collapsed_stacks, hotspot_table, reset_call_graph,
+                                                    aggregate_call_graph, prune_call_graph, call_graph_to_graphml,
+                                                    call_graph_to_svg)
+
+
+def callees_by_caller(graph):
+    callees = defaultdict(list)
+    for caller, callee, calls in labeled_edges(graph):
+        callees[caller].append(callee)
+    return callees
 
 class TestCallGraphTracing(unittest.TestCase):
     
@@ -46,21 +64,150 @@ class TestCallGraphTracing(unittest.TestCase):
             "f3": ["f4"]
         }
 
-        cleaned_call_graph = {k: v for k, v in call_graph.items() if k != "<module>"}
+        cleaned_call_graph = {k: v for k, v in callees_by_caller(call_graph).items() if k != "<module>"}
 
         cleaned_call_graph = {k: sorted(set(v)) for k, v in cleaned_call_graph.items()}
 
         self.assertEqual(cleaned_call_graph, expected_graph)
 
+    @unittest.skipUnless(hasattr(sys, "monitoring"), "sys.monitoring needs Python 3.12+")
+    def test_monitoring_backend_matches_settrace(self):
+        """The sys.monitoring backend records the same edges as the settrace one."""
+        graphs = []
+        for backend in ("settrace", "monitoring"):
+            call_graph.clear()
+            del call_stack[:]
+            stop_tracing = start_tracing(self.test_script, backend)
+            try:
+                with open(self.test_script, encoding='utf-8') as f:
+                    code = compile(f.read(), self.test_script, 'exec')
+                    exec(code, {"__builtins__": __builtins__, "__name__": "__main__"})
+            finally:
+                stop_tracing()
+            graphs.append(dict(call_graph))
+
+        self.assertEqual(graphs[0], graphs[1])
+        self.assertEqual(sorted(callees_by_caller(graphs[1])["f1"]), ["f2", "f3"])
+        self.assertEqual(call_stack, [])
+
+    @unittest.skipUnless(hasattr(sys, "monitoring"), "sys.monitoring needs Python 3.12+")
+    def test_monitoring_rearms_only_its_own_disabled_code(self):
+        """Code disabled while tracing one target reports again for the next, without restarting other tools."""
+        with tempfile.TemporaryDirectory() as tmp:
+            helper_path, main_path = os.path.join(tmp, "helper.py"), os.path.join(tmp, "main.py")
+            helper = {"__name__": "helper"}
+            exec(compile("def helper():\n    return 1\n", helper_path, "exec"), helper)
+            main = {"__name__": "main", "helper": helper["helper"]}
+            exec(compile("def run():\n    return helper()\n", main_path, "exec"), main)
+
+            graphs = []
+            with patch.object(sys.monitoring, "restart_events", side_effect=AssertionError("process-wide")):
+                for target in (main_path, helper_path):
+                    reset_call_graph()
+                    stop_tracing = start_tracing(target, "monitoring")
+                    try:
+                        main["run"]()
+                    finally:
+                        stop_tracing()
+                    graphs.append(dict(callees_by_caller(call_graph)))
+        # helper was disabled while main.py was the target and still shows up once helper.py is
+        self.assertEqual(graphs, [{"Program Start": ["run"]}, {"Program Start": ["helper"]}])
+
+    def test_threads_and_tasks_have_their_own_stacks(self):
+        """Calls in other threads and asyncio tasks are traced on their own stacks and counted per context."""
+        source = ("import asyncio\nimport threading\n\n"
+                  "def leaf():\n    return 1\n\n"
+                  "def work():\n    for _ in range(100):\n        leaf()\n\n"
+                  "async def fetch():\n    await asyncio.sleep(0)\n    leaf()\n\n"
+                  "async def gather():\n    await asyncio.gather(fetch(), fetch())\n\n"
+                  "def main():\n    threads = [threading.Thread(target=work, name=f'worker-{i}') for i in range(4)]\n"
+                  "    for thread in threads:\n        thread.start()\n    work()\n"
+                  "    for thread in threads:\n        thread.join()\n    asyncio.run(gather())\n\nmain()\n")
+        backends = ["settrace", "monitoring"] if hasattr(sys, "monitoring") else ["settrace"]
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "concurrent.py")
+            with open(script, "w") as f:
+                f.write(source)
+            for backend in backends:
+                with self.subTest(backend=backend):
+                    reset_call_graph()
+                    stop_tracing = start_tracing(script, backend)
+                    try:
+                        exec(compile(source, script, "exec"), {"__name__": "__main__"})
+                    finally:
+                        stop_tracing()
+
+                    contexts = generate_call_graph.calls_by_context()
+                    edges = {name: sorted(labeled_edges(graph)) for name, graph in contexts.items()}
+                    self.assertIn(("work", "leaf", 100), edges["MainThread"])
+                    self.assertIn(("main", "work", 1), edges["MainThread"])
+                    for i in range(4):
+                        self.assertEqual(edges[f"worker-{i}"], [("Program Start", "work", 1), ("work", "leaf", 100)])
+                    tasks = [name for name in edges if name.startswith("MainThread/")]
+                    self.assertEqual(len(tasks), 3)  # gather() and both fetch() calls
+                    self.assertIn(("Program Start", "work", 4), labeled_edges(call_graph))
+                    self.assertIn(("work", "leaf", 500), labeled_edges(call_graph))
+                    self.assertEqual((call_stack, generate_call_graph.contexts), ([], {}))
+
+                    exported = json.loads(generate_call_graph.call_graph_to_json(call_graph, context_graphs=contexts))
+                    edge = [e for e in exported["edges"] if (e["caller"], e["callee"]) == ("work", "leaf")][0]
+                    self.assertEqual(edge["contexts"], {"MainThread": 100, "worker-0": 100, "worker-1": 100,
+                                                        "worker-2": 100, "worker-3": 100})
+
+    def test_decisions_are_cached_per_code_object(self):
+        namespace = {}
+        exec(compile("def helper():\n    pass\n\ndef __init__():\n    pass\n", "/proj/app/util.py", "exec"), namespace)
+        exec(compile("def helper():\n    pass\n", "/proj/app/vendor/lib.py", "exec"), namespace)
+        vendored = namespace["helper"].__code__
+        exec(compile("def helper():\n    pass\n", "/proj/app/util.py", "exec"), namespace)
+        helper, dunder = namespace["helper"].__code__, namespace["__init__"].__code__
+
+        traced_function = generate_call_graph.create_function_filter("main.py", include=["*/app/*"],
+                                                                     exclude=["*/vendor/*"])
+        with patch.object(generate_call_graph, "is_traced", wraps=generate_call_graph.is_traced) as is_traced:
+            for _ in range(3):
+                self.assertEqual(traced_function(helper), ("/proj/app/util.py", 1, "helper"))
+                self.assertIsNone(traced_function(vendored))
+                self.assertIsNone(traced_function(dunder))
+        self.assertEqual(is_traced.call_count, 3)
+        # Equal code objects of different files are decided separately.
+        self.assertEqual(vendored, helper)
+        self.assertFalse(generate_call_graph.is_traced(vendored, "main.py", ["*/app/*"], ["*/vendor/*"]))
+        self.assertFalse(generate_call_graph.is_traced(helper, "main.py"))
+
+    def test_traced_frames_get_no_line_events(self):
+        events = Counter()
+        trace_calls = create_trace_calls(self.test_script)
+
+        def counting(frame, event, arg):
+            events[event] += 1
+            return counting if trace_calls(frame, event, arg) else None
+
+        reset_call_graph()
+        sys.settrace(counting)
+        try:
+            with open(self.test_script, encoding='utf-8') as f:
+                exec(compile(f.read(), self.test_script, 'exec'), {"__name__": "__main__"})
+        finally:
+            sys.settrace(None)
+        self.assertEqual(events["line"], 0)
+        self.assertEqual(call_stack, [])
+        self.assertEqual(sorted(callees_by_caller(call_graph)["f1"]), ["f2", "f3"])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            start_tracing(self.test_script, "dtrace")
+
     def test_display_call_graph(self):
         """Check if the call graph prints correctly without errors."""
         global call_graph
         call_graph.clear()
+        f1, f2, f3, f4 = [("script.py", line, name) for line, name in ((1, "f1"), (5, "f2"), (8, "f3"), (11, "f4"))]
         call_graph.update({
-            "Program Start": ["f1"],
-            "f1": ["f2", "f3"],
-            "f2": ["f3"],
-            "f3": ["f4"]
+            PROGRAM_START: Counter({f1: 1}),
+            f1: Counter({f2: 1, f3: 1}),
+            f2: Counter({f3: 1}),
+            f3: Counter({f4: 1})
         })
 
         try:
@@ -68,5 +215,237 @@ class TestCallGraphTracing(unittest.TestCase):
         except Exception as e:
             self.fail(f"display_call_graph failed with error: {e}")
 
+    def test_calls_are_counted_per_qualified_function(self):
+        """Repeated calls grow a counter, not a list, and same-named methods of different classes stay apart."""
+        source = ("class A:\n    def run(self):\n        return 1\n\nclass B:\n    def run(self):\n        return 2\n\n"
+                  "def main():\n    for _ in range(1000):\n        A().run()\n    B().run()\n\nmain()\n")
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "counted.py")
+            with open(script, "w") as f:
+                f.write(source)
+            call_graph.clear()
+            del call_stack[:]
+            stop_tracing = start_tracing(script, "settrace")
+            try:
+                exec(compile(source, script, "exec"), {"__name__": "__main__"})
+            finally:
+                stop_tracing()
+
+            main = (script, 9, "main")
+            self.assertEqual(call_graph[main], Counter({(script, 2, "A.run"): 1000, (script, 6, "B.run"): 1}))
+            self.assertIn(("main", "A.run", 1000), labeled_edges(call_graph))
+
+            dot = call_graph_to_dot(call_graph)
+            self.assertIn('"main" -> "A.run" [label="1000", weight=1000];', dot)
+
+            path = os.path.join(tmp, "graph.json")
+            save_call_graph(call_graph, path)
+            with open(path) as f:
+                exported = json.load(f)
+            self.assertIn({"caller": "main", "callee": "B.run", "calls": 1}, exported["edges"])
+            self.assertIn({"id": "A.run", "filename": script, "first_line": 2, "qualname": "A.run"}, exported["nodes"])
+
+    def test_shared_qualnames_are_labeled_with_their_location(self):
+        graph = defaultdict(Counter)
+        graph[PROGRAM_START][("a/tools.py", 3, "run")] += 2
+        graph[PROGRAM_START][("b/util.py", 7, "run")] += 1
+        self.assertEqual(sorted(labeled_edges(graph)), [("Program Start", "run (tools.py:3)", 2),
+                                                        ("Program Start", "run (util.py:7)", 1)])
+
+    def test_timing_mode(self):
+        """Inclusive and exclusive time per function, edge and stack, measured with perf_counter_ns."""
+        main, helper = ("script.py", 1, "main"), ("script.py", 5, "helper")
+        clock = iter([0, 10, 30, 40, 45, 100])
+        reset_call_graph()
+        with patch.object(generate_call_graph, "timing_enabled", True), \
+             patch.object(generate_call_graph.time, "perf_counter_ns", lambda: next(clock)):
+            generate_call_graph.enter_function(main)
+            for _ in range(2):
+                generate_call_graph.enter_function(helper)
+                generate_call_graph.leave_function()
+            generate_call_graph.leave_function()
+
+        self.assertEqual(generate_call_graph.function_times[main], [1, 100, 75])
+        self.assertEqual(generate_call_graph.function_times[helper], [2, 25, 25])
+        self.assertEqual(generate_call_graph.edge_times[main, helper], [25, 25])
+        self.assertEqual(collapsed_stacks(generate_call_graph.stack_times),
+                         "Program Start;main 75\nProgram Start;main;helper 25\n")
+        table = hotspot_table(generate_call_graph.function_times).splitlines()
+        self.assertTrue(table[0].startswith("function"))
+        self.assertTrue(table[1].startswith("main") and table[2].startswith("helper"))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.json")
+            save_call_graph(call_graph, path, function_timing=generate_call_graph.function_times,
+                            edge_timing=generate_call_graph.edge_times)
+            with open(path) as f:
+                exported = json.load(f)
+        self.assertIn({"caller": "main", "callee": "helper", "calls": 2, "inclusive_ns": 25, "exclusive_ns": 25},
+                      exported["edges"])
+
+    def test_recursive_inclusive_time_counts_the_outermost_call(self):
+        clock = iter(range(0, 100, 10))
+        fact = ("script.py", 1, "fact")
+        reset_call_graph()
+        with patch.object(generate_call_graph, "timing_enabled", True), \
+             patch.object(generate_call_graph.time, "perf_counter_ns", lambda: next(clock)):
+            for _ in range(3):
+                generate_call_graph.enter_function(fact)
+            for _ in range(3):
+                generate_call_graph.leave_function()
+        self.assertEqual(generate_call_graph.function_times[fact], [3, 50, 50])
+
+    def test_deep_recursion_is_folded(self):
+        """Recursion of any depth is traced on a bounded stack, with the depth of each chain recorded."""
+        source = ("def depth(n):\n    if n == 0:\n        probe()\n        return 0\n    return 1 + depth(n - 1)\n\n"
+                  "def even(n):\n    return n == 0 or odd(n - 1)\n\n"
+                  "def odd(n):\n    return n != 0 and even(n - 1)\n\n"
+                  "depth(10)\ndepth(600)\neven(501)\n")
+        stack_sizes = []
+        backends = ["settrace", "monitoring"] if hasattr(sys, "monitoring") else ["settrace"]
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "recursive.py")
+            with open(script, "w") as f:
+                f.write(source)
+            for backend in backends:
+                with self.subTest(backend=backend):
+                    reset_call_graph()
+                    stop_tracing = start_tracing(script, backend)
+                    try:
+                        exec(compile(source, script, "exec"),
+                             {"__name__": "__main__", "probe": lambda: stack_sizes.append(len(call_stack))})
+                    finally:
+                        stop_tracing()
+
+                    edges = labeled_edges(call_graph)
+                    self.assertIn(("depth", "depth", 610), edges)
+                    self.assertIn(("even", "odd", 251), edges)
+                    self.assertIn(("odd", "even", 250), edges)
+                    depths = {(caller[2], callee[2]): depth
+                              for (caller, callee), depth in generate_call_graph.recursion_depths.items()}
+                    self.assertEqual(depths, {("depth", "depth"): [2, 612, 601], ("odd", "even"): [1, 502, 502]})
+                    self.assertLessEqual(max(stack_sizes), 2)
+                    self.assertEqual(call_stack, [])
+                    del stack_sizes[:]
+
+    def test_folded_recursion_is_timed_like_unfolded(self):
+        """Timings of mutually recursive chains, with calls out of them, do not change when the chains are folded."""
+        a, b, leaf = ("script.py", 1, "a"), ("script.py", 5, "b"), ("script.py", 9, "leaf")
+        chains = {
+            (a, b, a, leaf, None, b, a, None, None, None, leaf, None, None, None): {(b, a): [1, 5, 5]},
+            # a calls itself back through the chain b -> b, which the chain a -> ... -> a takes in
+            (a, b, b, a, leaf, None, b, a, None, None, None, None, leaf, None, None, None): {(b, a): [1, 6, 6]},
+        }
+        for calls, depths in chains.items():
+            results = []
+            for fold in (False, True):
+                clock = iter(range(0, 1000, 7))
+                reset_call_graph()
+                with patch.object(generate_call_graph, "timing_enabled", True), \
+                     patch.object(generate_call_graph, "FOLD_RECURSION", fold), \
+                     patch.object(generate_call_graph.time, "perf_counter_ns", lambda: next(clock) ** 2 % 997):
+                    for callee in calls:
+                        if callee is None:
+                            generate_call_graph.leave_function()
+                        else:
+                            generate_call_graph.enter_function(callee)
+                self.assertEqual((call_stack, generate_call_graph.timing_stack), ([], []))
+                results.append((dict(generate_call_graph.function_times), dict(generate_call_graph.edge_times),
+                                sum(generate_call_graph.stack_times.values())))
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(dict(generate_call_graph.recursion_depths), depths)
+
+    def test_irregular_mutual_recursion_is_one_chain(self):
+        """A function called back through changing callees folds into a single chain, however they alternate."""
+        # Which of visit_a and visit_b visit goes through follows the Thue-Morse sequence, which never repeats
+        source = ("def visit(n):\n    if n == 0:\n        probe()\n        return\n"
+                  "    (visit_a, visit_b)[bin(n).count('1') % 2](n - 1)\n\n"
+                  "def visit_a(n):\n    visit(n)\n\n"
+                  "def visit_b(n):\n    visit(n)\n\n"
+                  "visit(400)\n")
+        stack_sizes = []
+        backends = ["settrace", "monitoring"] if hasattr(sys, "monitoring") else ["settrace"]
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "visitor.py")
+            with open(script, "w") as f:
+                f.write(source)
+            for backend in backends:
+                with self.subTest(backend=backend):
+                    reset_call_graph()
+                    stop_tracing = start_tracing(script, backend, timing=True)
+                    try:
+                        exec(compile(source, script, "exec"),
+                             {"__name__": "__main__", "probe": lambda: stack_sizes.append(len(call_stack))})
+                    finally:
+                        stop_tracing()
+
+                    depths = {(caller[2], callee[2]): depth
+                              for (caller, callee), depth in generate_call_graph.recursion_depths.items()}
+                    self.assertEqual(depths, {("visit_b", "visit"): [1, 801, 801]})
+                    self.assertEqual(stack_sizes, [2])
+                    calls = {function[2]: times[0] for function, times in generate_call_graph.function_times.items()}
+                    self.assertEqual(calls["visit"], 401)
+                    self.assertLessEqual(max(len(stack) for stack in generate_call_graph.stack_times), 3)
+                    del stack_sizes[:]
+
+    def test_aggregation_levels_and_pruning(self):
+        graph = defaultdict(Counter)
+        graph[PROGRAM_START][("app/models.py", 1, "<module>")] += 1
+        graph[("app/models.py", 1, "<module>")][("app/models.py", 10, "User.save")] += 3
+        graph[("app/models.py", 10, "User.save")][("app/models.py", 20, "User.validate")] += 3
+        graph[("app/models.py", 10, "User.save")][("app/__init__.py", 2, "slugify")] += 5
+        graph[("app/__init__.py", 2, "slugify")][("app/__init__.py", 8, "slugify.<locals>.clean")] += 5
+
+        self.assertEqual(sorted(labeled_edges(aggregate_call_graph(graph, "class"))), [
+            ("<module>", "User", 3), ("Program Start", "<module>", 1), ("User", "User", 3), ("User", "slugify", 5),
+            ("slugify", "slugify", 5)])
+        self.assertEqual(sorted(labeled_edges(aggregate_call_graph(graph, "module"))), [
+            ("Program Start", "models", 1), ("app", "app", 5), ("models", "app", 5), ("models", "models", 6)])
+        self.assertIs(aggregate_call_graph(graph, "function"), graph)
+        with self.assertRaises(ValueError):
+            aggregate_call_graph(graph, "package")
+
+        self.assertEqual(sorted(labeled_edges(prune_call_graph(graph, 2))),
+                         [("User.save", "slugify", 5), ("slugify", "slugify.<locals>.clean", 5)])
+        self.assertIs(prune_call_graph(graph, None), graph)
+
+    def test_headless_exports(self):
+        graph = defaultdict(Counter)
+        graph[PROGRAM_START][("s.py", 1, "<module>")] += 1
+        graph[("s.py", 1, "<module>")][("s.py", 3, "main")] += 1
+        graph[("s.py", 3, "main")][("s.py", 9, "parse<T>")] += 12
+        graph[("s.py", 9, "parse<T>")][("s.py", 9, "parse<T>")] += 4
+        graph[("s.py", 9, "parse<T>")][("s.py", 3, "main")] += 1
+
+        graphml = ET.fromstring(call_graph_to_graphml(graph))
+        ns = {"g": "http://graphml.graphdrawing.org/xmlns"}
+        self.assertEqual(len(graphml.findall("g:graph/g:node", ns)), 4)
+        edge = [e for e in graphml.findall("g:graph/g:edge", ns) if e.get("source") == "main"][0]
+        self.assertEqual((edge.get("target"), edge.find("g:data", ns).text), ("parse<T>", "12"))
+
+        svg = ET.fromstring(call_graph_to_svg(graph))
+        texts = [text.text for text in svg.iter("{http://www.w3.org/2000/svg}text")]
+        self.assertEqual(sorted(texts), ["1", "12", "4", "main", "parse<T>"])  # Program Start and <module> left out
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.svg")
+            with patch.object(generate_call_graph, "run_program"), \
+                 patch.object(generate_call_graph, "call_graph", graph), \
+                 patch.object(generate_call_graph, "visualize_call_graph") as visualize, \
+                 patch("builtins.print"):
+                generate_call_graph.main(["--output", path, "--level", "module", "--top", "1"])
+            visualize.assert_not_called()
+            with open(path) as f:
+                self.assertIn("<title>s -&gt; s: 18</title>", f.read())
+
+    def test_capture_options(self):
+        with patch.object(generate_call_graph, "run_program") as run_program, \
+             patch.object(generate_call_graph, "report"), patch("builtins.print"):
+            generate_call_graph.main(["--backend", "settrace", "--timing", "--exclude", "*/vendor/*"])
+        run_program.assert_called_once_with("test_code.py", "settrace", include=[], exclude=["*/vendor/*"],
+                                            event_log=None, shard_dir=None, timing=True)
+        with self.assertRaises(SystemExit), patch("sys.stderr"):
+            generate_call_graph.parse_args(["--backend", "fast"])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+import call_graph_diff
+import generate_call_graph
+from call_event_log import CALL, RETURN, CallEventWriter
+from call_graph_diff import diff_captures, load_capture
+from call_graph_export import save_call_graph
+from generate_call_graph import call_graph, replay_events, reset_call_graph
+
+
+def calls(helper_calls, extra="old_path", root="/release-1"):
+    """Events of a run: main calls parse, which calls helper helper_calls times, and then calls extra."""
+    main, parse = (f"{root}/app.py", 1, "main"), (f"{root}/app.py", 5, "parse")
+    helper, other = (f"{root}/app.py", 9, "helper"), (f"{root}/app.py", 12, extra)
+    events, now = [], 0
+
+    def event(kind, function, duration):
+        nonlocal now
+        now += duration
+        events.append((kind, "MainThread", function, now))
+
+    event(CALL, main, 0)
+    event(CALL, parse, 1)
+    for _ in range(helper_calls):
+        event(CALL, helper, 1)
+        event(RETURN, None, 10)
+    event(RETURN, None, 1)
+    event(CALL, other, 1)
+    event(RETURN, None, 5)
+    event(RETURN, None, 1)
+    return events
+
+
+class TestCallGraphDiff(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.addCleanup(reset_call_graph)
+
+    def save_json(self, name, events):
+        replay_events(events)
+        path = os.path.join(self.temp_dir, name)
+        save_call_graph(call_graph, path, function_timing=generate_call_graph.function_times)
+        reset_call_graph()
+        return path
+
+    def save_log(self, name, helper_calls):
+        path = os.path.join(self.temp_dir, name)
+        writer = CallEventWriter(path)
+        main, helper = ("/release-2/app.py", 1, "main"), ("/release-2/app.py", 9, "helper")
+        writer.call("MainThread", main)
+        for _ in range(helper_calls):
+            writer.call("MainThread", helper)
+            writer.ret("MainThread")
+        writer.ret("MainThread")
+        writer.close()
+        return path
+
+    def test_call_explosion_comes_first(self):
+        before = self.save_json("before.json", calls(10))
+        after = self.save_json("after.json", calls(1000, extra="new_path", root="/release-2"))
+        changes = diff_captures(load_capture(before), load_capture(after))
+
+        self.assertEqual(changes[0], {"kind": "calls", "item": "parse -> helper", "before": 10, "after": 1000,
+                                      "impact": 990 / 1003})
+        by_item = {change["item"]: change for change in changes}
+        self.assertEqual(by_item["main -> new_path"]["kind"], "added")
+        self.assertEqual(by_item["main -> old_path"]["kind"], "removed")
+        self.assertEqual(by_item["helper"]["kind"], "time")
+        self.assertEqual((by_item["helper"]["before"], by_item["helper"]["after"]), (100, 10000))
+        self.assertEqual((by_item["helper"]["calls_before"], by_item["helper"]["calls_after"]), (10, 1000))
+        # The helper's own time grew, not its callers': it ranks above them despite their larger inclusive times
+        self.assertLess(changes.index(by_item["helper"]), changes.index(by_item["main"]))
+        self.assertEqual(by_item["main"]["impact"], 0)
+
+    def test_same_named_modules_of_different_packages(self):
+        def run(root, a_calls, b_calls):
+            main, a, b = (f"{root}/main.py", 1, "main"), (f"{root}/pkg_a/utils.py", 1, "helper"), \
+                (f"{root}/pkg_b/utils.py", 1, "helper")
+            events = [(CALL, "MainThread", main, 0)]
+            for helper, count in ((a, a_calls), (b, b_calls)):
+                events += [(CALL, "MainThread", helper, 0), (RETURN, "MainThread", None, 0)] * count
+            return self.save_json(f"{os.path.basename(root)}.json", events + [(RETURN, "MainThread", None, 0)])
+
+        same = diff_captures(load_capture(run("/release-1", 10, 1)), load_capture(run("/release-2", 10, 1)))
+        self.assertEqual(same, [])
+        swapped = diff_captures(load_capture(run("/release-1", 10, 1)), load_capture(run("/release-2", 1, 10)))
+        self.assertEqual({(change["item"], change["before"], change["after"]) for change in swapped},
+                         {("main -> pkg_a.utils.helper", 10, 1), ("main -> pkg_b.utils.helper", 1, 10)})
+
+    def test_same_capture_has_no_changes(self):
+        path = self.save_json("run.json", calls(10))
+        self.assertEqual(diff_captures(load_capture(path), load_capture(path)), [])
+
+    def test_untimed_and_logged_captures(self):
+        untimed = os.path.join(self.temp_dir, "untimed.json")
+        replay_events(calls(3, root="/release-2"))
+        save_call_graph(call_graph, untimed)
+        reset_call_graph()
+        self.assertIsNone(load_capture(untimed)[1])
+
+        log = self.save_log("calls.log", 3)
+        with patch.object(generate_call_graph, "timing_enabled", False):
+            changes = diff_captures(load_capture(untimed), load_capture(log))
+            self.assertFalse(generate_call_graph.timing_enabled)  # Replaying the log left the tracer as it was
+        self.assertEqual(dict(generate_call_graph.call_graph), {})
+        self.assertEqual({(change["kind"], change["item"]) for change in changes},
+                         {("removed", "main -> parse"), ("removed", "main -> old_path"),
+                          ("removed", "parse -> helper"), ("added", "main -> helper")})
+
+    def test_fail_above(self):
+        before = self.save_json("before.json", calls(10))
+        after = self.save_json("after.json", calls(1000))
+        output = os.path.join(self.temp_dir, "diff.json")
+        with redirect_stdout(io.StringIO()) as stdout:
+            call_graph_diff.main([before, after, "--top", "1", "--output", output, "--fail-above", "0.99"])
+        self.assertEqual(stdout.getvalue().splitlines()[1].split()[2:5], ["parse", "->", "helper"])
+        with open(output) as f:
+            self.assertGreater(len(json.load(f)), 1)
+
+        with redirect_stdout(io.StringIO()) as stdout, self.assertRaises(SystemExit) as exit:
+            call_graph_diff.main([before, after, "--fail-above", "0.5"])
+        self.assertEqual(exit.exception.code, 1)
+        self.assertIn("grew by more than 50.0%", stdout.getvalue())
+
+        with redirect_stdout(io.StringIO()):
+            call_graph_diff.main([after, before, "--fail-above", "0.5"])  # Fewer calls is not a regression
+
+
+if __name__ == "__main__":
+    unittest.main()
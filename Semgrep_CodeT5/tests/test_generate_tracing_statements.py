@@ -1,10 +1,73 @@
 import unittest
+from unittest.mock import patch
 import os
 import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+from tracing_statements import generate_tracing_statements
+import summary_server
+from summary_cache import SummaryCache
+from block_locator import AstBlockLocator
 from tracing_statements.generate_tracing_statements import generate_summary, install_semgrep, get_semgrep_path, run_semgrep, extract_first_last_line_numbers
 
+
+class FakeBatch:
+    """Stands in for the padded BatchEncoding returned by tokenizer.pad."""
+
+    def __init__(self, input_ids):
+        width = max(len(ids) for ids in input_ids)
+        self.input_ids = [ids + [0] * (width - len(ids)) for ids in input_ids]
+        self.attention_mask = [[1] * len(ids) + [0] * (width - len(ids)) for ids in input_ids]
+
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    """Encodes each character as its code point so decoding returns the original block."""
+
+    pad_token_id = 0
+    eos_token_id = 3
+    unk_token_id = None
+
+    def convert_tokens_to_ids(self, token):
+        return ord(token)
+
+    def __call__(self, blocks):
+        return SimpleNamespace(input_ids=[[ord(c) for c in block] for block in blocks])
+
+    def pad(self, features, return_tensors=None):
+        return FakeBatch(features["input_ids"])
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return ["".join(chr(i) for i in ids if i) for ids in sequences]
+
+
+class FakeModel:
+    """Echoes its input so summaries can be matched back to their blocks."""
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.budgets = []
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=None, eos_token_id=None):
+        self.batch_sizes.append(len(input_ids))
+        self.budgets.append(max_new_tokens)
+        return input_ids
+
+
 class TestGenerateTracingStatements(unittest.TestCase):
-    
+
+    def setUp(self):
+        # The fake models below must not be bypassed by a summary server that happens to be running.
+        patcher = patch.object(summary_server, "SERVER_ADDRESS", "")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_install_semgrep(self):
         """Test that Semgrep is installed correctly."""
         try:
@@ -48,5 +111,189 @@ class TestGenerateTracingStatements(unittest.TestCase):
         self.assertIsInstance(summary, str)
         self.assertTrue(len(summary) > 0)
 
+    def test_generate_summaries_batches_and_keeps_order(self):
+        """Blocks are grouped into batches by length but summaries come back in input order."""
+        blocks = ["def a():\n    pass\n" * n for n in (5, 1, 3, 2, 4)]
+        model = FakeModel()
+        with patch.object(generate_tracing_statements, "tokenizer", FakeTokenizer()), \
+             patch.object(generate_tracing_statements, "model", model), \
+             patch.object(generate_tracing_statements, "CACHE_PATH", None):
+            summaries = generate_tracing_statements.generate_summaries(blocks, batch_size=2)
+
+        self.assertEqual(summaries, blocks)
+        self.assertEqual(model.batch_sizes, [2, 2, 1])
+
+    def test_generation_budget_scales_with_block_size(self):
+        """Short blocks get a small decode budget, long ones a larger one, and oversized inputs are windowed."""
+        blocks = ["def a():\n    pass\n", "def b():\n" + "    x = 1\n" * 60]
+        model = FakeModel()
+        policy = generate_tracing_statements.GenerationPolicy(max_input_tokens=400)
+        with patch.object(generate_tracing_statements, "tokenizer", FakeTokenizer()), \
+             patch.object(generate_tracing_statements, "model", model), \
+             patch.object(generate_tracing_statements, "GENERATION_POLICY", policy), \
+             patch.object(generate_tracing_statements, "generation_stats", generate_tracing_statements.GenerationStats()) as stats, \
+             patch.object(generate_tracing_statements, "CACHE_PATH", None):
+            summaries = generate_tracing_statements.generate_summaries(blocks, batch_size=1)
+
+        self.assertEqual(summaries[0], blocks[0])
+        self.assertEqual(len(summaries[1]), 400)
+        self.assertTrue(summaries[1].startswith("def b():") and summaries[1].endswith("x = 1\n"))
+        self.assertLess(model.budgets[0], model.budgets[1])
+        self.assertEqual(stats.windowed, 1)
+        self.assertEqual(stats.output_lengths, [len(blocks[0]), 400])
+        self.assertIn("2 summaries in 2 model calls", stats.report())
+
+    def test_generate_summaries_uses_cache(self):
+        """Re-summarizing after changing one function only runs the model for that function."""
+        blocks = ["def a():\n    return 1\n", "def b():\n    return 2\n", "def c():\n    return 3\n"]
+        model = FakeModel()
+        with tempfile.TemporaryDirectory() as cache_dir, \
+             patch.object(generate_tracing_statements, "tokenizer", FakeTokenizer()), \
+             patch.object(generate_tracing_statements, "model", model):
+            cache = SummaryCache(os.path.join(cache_dir, "summaries.sqlite3"))
+            generate_tracing_statements.generate_summaries(blocks, cache=cache)
+
+            # Reformatting is not a change; editing the body of b is.
+            edited = ["def a():\n    return 1  # same\n", "def b():\n    return 20\n", blocks[2]]
+            summaries = generate_tracing_statements.generate_summaries(edited, cache=cache)
+            cache.close()
+
+        self.assertEqual(model.batch_sizes, [3, 1])
+        self.assertEqual(summaries, [blocks[0], edited[1], blocks[2]])
+
+    def test_instrument_project(self):
+        """Every file of a project is instrumented into the output directory and the sources are left alone."""
+        sources = {
+            "main.py": "def run(a):\n    return a\n",
+            os.path.join("pkg", "util.py"): "def helper():\n    pass\n\ndef other(x, y):\n    return x\n",
+        }
+        model = FakeModel()
+        with tempfile.TemporaryDirectory() as project, tempfile.TemporaryDirectory() as output, \
+             patch.object(generate_tracing_statements, "tokenizer", FakeTokenizer()), \
+             patch.object(generate_tracing_statements, "model", model), \
+             patch.object(generate_tracing_statements, "CACHE_PATH", None):
+            for relative, source in sources.items():
+                os.makedirs(os.path.dirname(os.path.join(project, relative)), exist_ok=True)
+                with open(os.path.join(project, relative), "w") as f:
+                    f.write(source)
+
+            generate_tracing_statements.instrument_project(project, output, AstBlockLocator())
+
+            for relative, source in sources.items():
+                with open(os.path.join(project, relative)) as f:
+                    self.assertEqual(f.read(), source)
+            with open(os.path.join(output, "main.py")) as f:
+                self.assertIn('_trace_call("main:run", ("a",), a)', f.read())
+            with open(os.path.join(output, "pkg", "util.py")) as f:
+                self.assertIn('_trace_call("pkg.util:other", ("x", "y"), x, y)', f.read())
+            self.assertTrue(os.path.isfile(os.path.join(output, "trace_runtime.py")))
+
+        self.assertEqual(model.batch_sizes, [3])
+
+    def test_incremental_project_runs(self):
+        """A manifest next to each output lets re-runs summarize only added or modified functions."""
+        source = "def run(a):\n    return a\n\nclass Box:\n    def size(self):\n        return 1\n"
+        model = FakeModel()
+        with tempfile.TemporaryDirectory() as project, tempfile.TemporaryDirectory() as output, \
+             patch.object(generate_tracing_statements, "tokenizer", FakeTokenizer()), \
+             patch.object(generate_tracing_statements, "model", model), \
+             patch.object(generate_tracing_statements, "CACHE_PATH", None):
+            source_file = os.path.join(project, "main.py")
+            output_file = os.path.join(output, "main.py")
+            with open(source_file, "w") as f:
+                f.write(source)
+
+            generate_tracing_statements.instrument_project(project, output, AstBlockLocator())
+            with open(output_file) as f:
+                first_output = f.read()
+            self.assertTrue(os.path.isfile(output_file + ".trace-manifest.json"))
+
+            # Nothing changed: no model calls and an identical output.
+            generate_tracing_statements.instrument_project(project, output, AstBlockLocator())
+            with open(output_file) as f:
+                self.assertEqual(f.read(), first_output)
+
+            # Only the modified method goes back to the model.
+            with open(source_file, "w") as f:
+                f.write(source.replace("return 1", "return 2"))
+            generate_tracing_statements.instrument_project(project, output, AstBlockLocator())
+            with open(output_file) as f:
+                second_output = f.read()
+
+        self.assertEqual(model.batch_sizes, [2, 1])
+        self.assertIn("return 2", second_output)
+        self.assertEqual(second_output.count('_trace_call("'), 2)
+
+    def test_incremental_run_on_instrumented_file_is_a_no_op(self):
+        """Feeding an instrumented output back in (as the editor integration does) leaves it untouched."""
+        model = FakeModel()
+        with tempfile.TemporaryDirectory() as work_dir, \
+             patch.object(generate_tracing_statements, "tokenizer", FakeTokenizer()), \
+             patch.object(generate_tracing_statements, "model", model), \
+             patch.object(generate_tracing_statements, "CACHE_PATH", None):
+            target_file = os.path.join(work_dir, "test_code.py")
+            output_file = os.path.join(work_dir, "user_code.py")
+            with open(target_file, "w") as f:
+                f.write("def run(a):\n    return a\n")
+
+            generate_tracing_statements.instrument_file(target_file, output_file, AstBlockLocator())
+            with open(output_file) as f:
+                instrumented = f.read()
+
+            with open(target_file, "w") as f:
+                f.write(instrumented)
+            generate_tracing_statements.instrument_file(target_file, output_file, AstBlockLocator())
+            with open(output_file) as f:
+                self.assertEqual(f.read(), instrumented)
+
+        self.assertEqual(model.batch_sizes, [1])
+
+    def test_trace_policies(self):
+        """Per-function policies are chosen by glob, validated on the command line and baked into the trace calls."""
+        args = generate_tracing_statements.parse_args(
+            ["in.py", "out.py", "--trace-policy", "rate:50", "--trace-policy-for", "Parser.*=every:100",
+             "--trace-policy-for", "*=first:3"])
+        self.assertEqual(args.trace_policies, [("Parser.*", "every:100"), ("*", "first:3")])
+        with self.assertRaises(SystemExit), patch("sys.stderr"):
+            generate_tracing_statements.parse_args(["in.py", "out.py", "--trace-policy", "every:0"])
+
+        source = "class Parser:\n    def feed(self, data):\n        pass\n\ndef run():\n    pass\n"
+        plan = {"source": source, "blocks": [(2, 3), (5, 6)], "pending": [0, 1], "summaries": {0: "Feeds.", 1: "Runs."}}
+        with patch.object(generate_tracing_statements, "TRACE_POLICIES", [("Parser.*", "every:100")]):
+            instrumented = generate_tracing_statements.apply_plan(plan)
+        self.assertIn('_trace_admit_Parser_feed = _trace_sampler("every:100")\nclass Parser:', instrumented)
+        self.assertIn('if _trace_admit_Parser_feed(): _trace_call("Parser.feed", ("data",), data)', instrumented)
+        self.assertIn('_trace_call("run", ())', instrumented)
+
+    def test_hierarchical_summaries_reuse_inner_summaries(self):
+        """Inner functions are summarized first and parents only see their summaries."""
+        source = ("class Box:\n    def pack(self, items):\n        def weigh(item):\n            total = item * 2\n"
+                  "            return total\n        return sum(map(weigh, items))\n\ndef run():\n    pass\n")
+        rounds = []
+
+        def summarize(blocks, batch_size=None):
+            rounds.append(blocks)
+            return [f"Summary of {block.split('(')[0].split()[-1]}." for block in blocks]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            target_file = os.path.join(tmp, "module.py")
+            with open(target_file, "w") as f:
+                f.write(source)
+            manifest = generate_tracing_statements.load_manifest(os.path.join(tmp, "out.py"))
+            plan = generate_tracing_statements.plan_file(target_file, AstBlockLocator(), manifest)
+            with patch.object(generate_tracing_statements, "HIERARCHICAL", True), \
+                 patch.object(generate_tracing_statements, "generate_summaries", summarize):
+                self.assertEqual(generate_tracing_statements.summarize_plans([plan]), 3)
+
+        self.assertEqual(rounds[0], ["        def weigh(item):\n            total = item * 2\n            return total\n"])
+        self.assertEqual(len(rounds[1]), 2)
+        self.assertIn('def weigh(item):\n            """Summary of weigh."""\n        return', rounds[1][0])
+        self.assertNotIn("total", rounds[1][0])
+        self.assertEqual(plan["summaries"], {0: "Summary of pack.", 1: "Summary of weigh.", 2: "Summary of run."})
+
+    def test_generate_summaries_empty(self):
+        """No blocks means no model calls."""
+        self.assertEqual(generate_tracing_statements.generate_summaries([]), [])
+
 if __name__ == "__main__":
     unittest.main()
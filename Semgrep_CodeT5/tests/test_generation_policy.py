@@ -0,0 +1,57 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+from generation_policy import GenerationPolicy, GenerationStats, percentile, token_counts
+
+
+class FakeTokenizer:
+    eos_token_id = 2
+    unk_token_id = 3
+
+    def convert_tokens_to_ids(self, token):
+        return {".": 4, "!": 5}.get(token, self.unk_token_id)
+
+
+class TestGenerationPolicy(unittest.TestCase):
+
+    def test_budget_grows_with_input_and_is_clamped(self):
+        policy = GenerationPolicy(min_new_tokens=16, max_new_tokens=128, new_tokens_per_input_token=0.25)
+        self.assertEqual(policy.new_token_budget(0), 16)
+        self.assertEqual(policy.new_token_budget(40), 26)
+        self.assertEqual(policy.new_token_budget(10000), 128)
+
+    def test_long_inputs_keep_head_and_tail(self):
+        policy = GenerationPolicy(max_input_tokens=8)
+        ids = list(range(20))
+        self.assertEqual(policy.fit_input(ids[:8]), ids[:8])
+        self.assertEqual(policy.fit_input(ids), [0, 1, 2, 3, 4, 5, 18, 19])
+
+    def test_stop_tokens(self):
+        tokenizer = FakeTokenizer()
+        self.assertEqual(GenerationPolicy().stop_token_ids(tokenizer), [2, 4, 5])
+        self.assertEqual(GenerationPolicy(stop_at_sentence_end=False).stop_token_ids(tokenizer), [2])
+        self.assertEqual(GenerationPolicy().generate_kwargs(tokenizer, [10, 400])["max_new_tokens"], 116)
+
+    def test_invalid_budgets(self):
+        with self.assertRaises(ValueError):
+            GenerationPolicy(min_new_tokens=64, max_new_tokens=32)
+        with self.assertRaises(ValueError):
+            GenerationPolicy(max_input_tokens=1)
+
+    def test_stats_report(self):
+        stats = GenerationStats()
+        self.assertEqual(stats.report(), "No summaries generated")
+        stats.record(0.5, [10, 20], token_counts([[0, 7, 8, 2], [0, 7, 2, 0]], pad_token_id=0))
+        stats.record(1.5, [300], [12], windowed=1)
+        self.assertEqual(stats.output_lengths, [3, 2, 12])
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.99), 4)
+        report = stats.report()
+        self.assertIn("3 summaries in 2 model calls (1 inputs windowed", report)
+        self.assertIn("p50 0.50s p90 1.50s", report)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+
+BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TRACING_PATH = os.path.join(BASE_PATH, 'tracing_statements')
+
+# Importing a tracing module must not load the model stack; a cold import of transformers alone takes seconds.
+HEAVY_MODULES = ("transformers", "torch")
+IMPORT_BUDGET_SECONDS = 1.0
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def probe_import(module, cwd):
+    """Imports the module in a fresh interpreter and reports how long it took and which heavy modules came along."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=cwd, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+
+    def assert_cheap_import(self, module, cwd):
+        report = probe_import(module, cwd)
+        self.assertEqual(report["loaded"], [], f"importing {module} loaded {report['loaded']}")
+        self.assertLess(report["elapsed"], IMPORT_BUDGET_SECONDS, f"importing {module} took {report['elapsed']:.2f}s")
+
+    def test_generate_tracing_statements_import_is_cheap(self):
+        self.assert_cheap_import("generate_tracing_statements", TRACING_PATH)
+
+    def test_model_provider_import_is_cheap(self):
+        self.assert_cheap_import("model_provider", TRACING_PATH)
+
+    def test_summarize_import_is_cheap(self):
+        self.assert_cheap_import("summarize", BASE_PATH)
+
+if __name__ == "__main__":
+    unittest.main()
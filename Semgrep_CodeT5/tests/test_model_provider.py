@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+import model_provider
+from model_provider import ModelProvider, get_provider
+
+
+class SlowLoader:
+    """Counts from_pretrained calls and sleeps so concurrent loads would overlap if they were not serialized."""
+
+    def __init__(self):
+        self.loads = 0
+
+    def from_pretrained(self, checkpoint, trust_remote_code=False):
+        self.loads += 1
+        time.sleep(0.05)
+        return self
+
+    def to(self, device):
+        return self
+
+
+def fake_transformers(loader):
+    module = types.ModuleType("transformers")
+    module.AutoTokenizer = loader
+    module.AutoModel = loader
+    return module
+
+
+class TestModelProvider(unittest.TestCase):
+
+    def test_nothing_is_loaded_until_first_use(self):
+        provider = ModelProvider("some/checkpoint")
+        self.assertFalse(provider.is_loaded())
+
+    def test_concurrent_loads_happen_once(self):
+        loader = SlowLoader()
+        provider = ModelProvider("some/checkpoint")
+        results = []
+        with patch.dict(sys.modules, {"transformers": fake_transformers(loader)}):
+            threads = [threading.Thread(target=lambda: results.append(provider.load())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # One tokenizer load plus one model load, shared by every caller.
+        self.assertEqual(loader.loads, 2)
+        self.assertEqual(len(set(map(id, (pair[1] for pair in results)))), 1)
+        self.assertTrue(provider.is_loaded())
+
+    def test_get_provider_is_process_wide(self):
+        with patch.dict(model_provider.providers, clear=True):
+            self.assertIs(get_provider("a", "cpu"), get_provider("a", "cpu"))
+            self.assertIsNot(get_provider("a", "cpu"), get_provider("b", "cpu"))
+            self.assertIsNot(get_provider("a", "cpu", "torch"), get_provider("a", "cpu", "int8"))
+
+    def test_backend_validation(self):
+        with self.assertRaises(ValueError):
+            ModelProvider(backend="tensorrt")
+        with self.assertRaises(ValueError):
+            ModelProvider(device="cuda", backend="int8")
+
+if __name__ == "__main__":
+    unittest.main()
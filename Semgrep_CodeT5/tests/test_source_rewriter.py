@@ -0,0 +1,184 @@
+import unittest
+import ast
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import textwrap
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+from block_locator import locate_function_blocks
+from source_rewriter import RUNTIME_IMPORT, condense_block, instrument_source
+import trace_runtime
+
+
+def instrument_all(source, summary="Does something."):
+    return instrument_source(source, {first: summary for first, _ in locate_function_blocks(source)})
+
+
+class TestSourceRewriter(unittest.TestCase):
+
+    def test_docstring_and_trace_go_inside_the_function(self):
+        source = "def add(a, b):\n    return a + b\n"
+        self.assertEqual(instrument_all(source, "Adds two numbers."), textwrap.dedent('''\
+            try:
+                from trace_runtime import trace_call as _trace_call, sampler as _trace_sampler
+            except ImportError:
+                _trace_call = lambda function, names, *values, **options: print(f"TRACE: Entering {function}", dict(zip(names, values)))
+                _trace_sampler = lambda policy: lambda: True
+
+            def add(a, b):
+                """Adds two numbers."""
+                _trace_call("add", ("a", "b"), a, b)
+                return a + b
+            '''))
+
+    def test_signatures_the_regex_missed(self):
+        source = textwrap.dedent('''\
+            class Client:
+                @staticmethod
+                def connect(
+                    host: str,
+                    port: int = 80,
+                    options: tuple = (1, 2),
+                    *args,
+                    timeout: float = 1.0,
+                    **kwargs,
+                ) -> None:
+                    pass
+
+                async def fetch(self, url, /, retries=3):
+                    return url
+
+                def ping(self): return True
+            ''')
+        result = instrument_all(source)
+        ast.parse(result)
+        self.assertIn('_trace_call("Client.connect", ("host", "port", "options", "args", "timeout", "kwargs"), '
+                      'host, port, options, args, timeout, kwargs)', result)
+        self.assertIn('_trace_call("Client.fetch", ("url", "retries"), url, retries)', result)
+        self.assertIn('_trace_call("Client.ping", ())', result)
+
+    def test_header_continued_onto_the_body_line(self):
+        source = ("def f(a, \\\n      b): \\\n    return a\n\n"
+                  "class C:\n    def g(self): \\\nreturn 1\n    def h(self):  # not a continuation \\\n        return 2\n")
+        result = instrument_source(source, {1: "F.", 6: "G.", 8: "H."})
+        ast.parse(result)
+        self.assertIn('def f(a, \\\n      b):\n    """F."""\n    _trace_call("f", ("a", "b"), a, b)\n    return a\n', result)
+        self.assertIn('    def g(self):\n        """G."""\n        _trace_call("C.g", ())\n        return 1\n', result)
+        self.assertIn('    def h(self):  # not a continuation \\\n        """H."""\n', result)
+
+    def test_existing_docstring_is_kept(self):
+        source = 'def f(x):\n    """Human written."""\n    return x\n'
+        result = instrument_all(source).split("def f(x):\n")[1]
+        self.assertEqual(result.splitlines()[:2], ['    """Human written."""', '    _trace_call("f", ("x",), x)'])
+
+    def test_only_requested_functions_change_and_formatting_is_kept(self):
+        source = "def keep( a ,b ):  # odd spacing\n    return a\n\n\ndef change(c):\n    return c\n"
+        result = instrument_source(source, {5: "Changes."})
+        self.assertIn("\ndef keep( a ,b ):  # odd spacing\n    return a\n\n\ndef change(c):\n", result)
+        self.assertEqual(result.count('_trace_call("'), 1)
+
+    def test_runtime_import_follows_docstring_and_future_imports_once(self):
+        source = '"""Module."""\nfrom __future__ import annotations\nimport os\n\ndef f():\n    pass\n'
+        once = instrument_all(source)
+        self.assertTrue(once.startswith('"""Module."""\nfrom __future__ import annotations\ntry:\n'))
+        twice = instrument_source(once, {first: "Again." for first, _ in locate_function_blocks(once)})
+        self.assertEqual(twice.count(RUNTIME_IMPORT), 1)
+
+    def test_awkward_summaries_stay_valid_python(self):
+        source = "def f():\n    pass\n"
+        for summary in ['Says "hi"', 'Ends with a backslash \\', 'Has """ inside', "multi\nline   text", ""]:
+            ast.parse(instrument_all(source, summary))
+
+    def test_earlier_traces_are_replaced(self):
+        legacy = 'def f(x):\n    """Old."""\n    print(f"TRACE: Entering f function with parameters: x={ x }")\n    return x\n'
+        once = instrument_all(legacy)
+        self.assertNotIn("Entering f function", once)
+        self.assertEqual(once.count('_trace_call("f"'), 1)
+
+        def again(source, policy):
+            return instrument_source(source, {first: "New." for first, _ in locate_function_blocks(source)},
+                                     lambda qualname: policy)
+
+        sampled = once.replace('def f(x):\n', '_trace_admit_f = _trace_sampler("every:10")\ndef f(x):\n').replace(
+            '_trace_call("f", ("x",), x)', 'if _trace_admit_f(): _trace_call("f", ("x",), x)')
+        self.assertEqual(again(once, "every:10"), sampled)
+        self.assertEqual(again(sampled, "first:3"), sampled.replace("every:10", "first:3"))
+        self.assertEqual(again(sampled, "all"), once)
+
+    def test_sampled_functions_get_a_sampler_each(self):
+        source = textwrap.dedent("""\
+            import os
+
+            @decorate
+            class Parser:
+                def feed(self, data):
+                    pass
+
+                def close(self):
+                    pass
+
+            def Parser_feed():
+                pass
+            """)
+        result = instrument_source(source, {5: "Feeds.", 8: "Closes.", 11: "Clashes."}, lambda qualname: "every:100")
+        ast.parse(result)
+        self.assertIn('\n\n_trace_admit_Parser_feed = _trace_sampler("every:100")\n'
+                      '_trace_admit_Parser_close = _trace_sampler("every:100")\n@decorate\nclass Parser:\n', result)
+        self.assertIn('        if _trace_admit_Parser_feed(): _trace_call("Parser.feed", ("data",), data)\n', result)
+        self.assertIn('_trace_admit_Parser_feed_2 = _trace_sampler("every:100")\ndef Parser_feed():\n', result)
+        self.assertIn('    if _trace_admit_Parser_feed_2(): _trace_call("Parser_feed", ())\n', result)
+
+    def test_instrumented_code_logs_through_the_runtime(self):
+        source = "def greet(name, *rest, punctuation='!'):\n    return name + punctuation\n\nvalue = greet('hi', 1, 2)\n"
+        namespace = {}
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_path = os.path.join(log_dir, "trace.bin")
+            trace_runtime.configure(path=log_path)
+            try:
+                exec(compile(instrument_all(source), "<instrumented>", "exec"), namespace)
+            finally:
+                trace_runtime.writer.close()
+            records = list(trace_runtime.read_log(log_path))
+        self.assertEqual(namespace["value"], "hi!")
+        self.assertEqual([(r["function"], r["args"]) for r in records],
+                         [("greet", {"name": "'hi'", "rest": "(1, 2)", "punctuation": "'!'"})])
+
+    def test_instrumented_code_prints_without_the_runtime(self):
+        source = "def greet(name):\n    return name\n\nvalue = greet('hi')\n"
+        namespace = {}
+        output = io.StringIO()
+        with patch.dict(sys.modules, {"trace_runtime": None}), contextlib.redirect_stdout(output):
+            exec(compile(instrument_all(source), "<instrumented>", "exec"), namespace)
+        self.assertEqual(namespace["value"], "hi")
+        self.assertIn("TRACE: Entering greet {'name': 'hi'}", output.getvalue())
+
+    def test_condense_block_replaces_inner_bodies_with_summaries(self):
+        source = textwrap.dedent("""\
+            class Cache:
+                def lookup(self, key):
+                    @memoize
+                    def load(name):
+                        with open(name) as f:
+                            return f.read()
+                    def fallback(): return None
+                    return load(key) or fallback()
+            """)
+        block = "".join(source.splitlines(keepends=True)[1:8])
+        condensed = condense_block(block, 2, [(4, 6, "Reads a file."), (7, 7, "Returns None."), (8, 8, "")])
+        self.assertEqual(condensed, textwrap.indent(textwrap.dedent("""\
+            def lookup(self, key):
+                @memoize
+                def load(name):
+                    \"\"\"Reads a file.\"\"\"
+                def fallback(): return None
+                return load(key) or fallback()
+            """), "    "))
+        ast.parse(textwrap.dedent(condensed))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from unittest.mock import patch
+import json
+import os
+import sys
+import tempfile
+import textwrap
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+import static_call_graph
+from call_graph_export import labeled_edges
+from static_call_graph import analyze_project, module_name
+
+PROJECT = {
+    "app/__init__.py": "from .util import slugify\n",
+    "app/util.py": """\
+        def slugify(text):
+            return clean(text).replace(" ", "-")
+
+        def clean(text):
+            return text.strip()
+        """,
+    "app/models.py": """\
+        from app.base import Model
+        from . import util
+
+        class User(Model):
+            def save(self):
+                self.validate()
+                super().save()
+                return util.slugify(self.name)
+
+            def validate(self):
+                pass
+        """,
+    "app/base.py": """\
+        import functools
+
+        class Model:
+            def save(self):
+                self.log()
+
+            @functools.lru_cache
+            def log(self):
+                pass
+
+            def __repr__(self):
+                return self.log()
+        """,
+    "main.py": """\
+        import app
+        import app.models as models
+
+        def run():
+            def step():
+                return app.slugify("A b")
+            step()
+            models.User().save()
+            len([])
+            return step()
+
+        run()
+        """,
+}
+
+
+def write_project(root):
+    for name, source in PROJECT.items():
+        path = os.path.join(root, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(textwrap.dedent(source))
+
+
+class TestStaticCallGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "project")
+        write_project(self.root)
+        self.cache_path = os.path.join(self.tmp.name, "cache.sqlite3")
+
+    def test_module_names(self):
+        self.assertEqual(module_name(os.path.join(self.root, "app", "__init__.py"), self.root), "app")
+        self.assertEqual(module_name(os.path.join(self.root, "app", "util.py"), self.root), "app.util")
+
+    def test_calls_are_resolved_across_modules(self):
+        graph, modules, parsed = analyze_project(self.root, cache_path=None)
+        self.assertEqual((modules, parsed), (5, 5))
+        edges = set(labeled_edges(graph))
+        self.assertEqual(edges, {
+            ("<module>", "run", 1),
+            ("run", "run.<locals>.step", 2),
+            ("run.<locals>.step", "slugify", 1),  # re-exported by app/__init__.py
+            ("User.save", "User.validate", 1),
+            ("User.save", "Model.save", 1),  # super().save()
+            ("User.save", "slugify", 1),  # from . import util; util.slugify()
+            ("Model.save", "Model.log", 1),
+            ("Model.__repr__", "Model.log", 1),
+            ("slugify", "clean", 1),
+        })
+
+        log = [callee for callees in graph.values() for callee in callees if callee[2] == "Model.log"][0]
+        self.assertEqual(log, (os.path.join(self.root, "app", "base.py"), 7, "Model.log"))  # the decorator's line
+
+    def test_results_are_cached_by_content(self):
+        first, _, parsed = analyze_project(self.root, cache_path=self.cache_path)
+        self.assertEqual(parsed, 5)
+        second, _, parsed = analyze_project(self.root, cache_path=self.cache_path)
+        self.assertEqual(parsed, 0)
+        self.assertEqual(first, second)
+
+        with open(os.path.join(self.root, "app", "util.py"), "a") as f:
+            f.write("\ndef extra():\n    return clean('x')\n")
+        graph, _, parsed = analyze_project(self.root, cache_path=self.cache_path)
+        self.assertEqual(parsed, 1)
+        self.assertIn(("extra", "clean", 1), labeled_edges(graph))
+
+    def test_process_pool_gives_the_same_graph(self):
+        serial, _, _ = analyze_project(self.root, cache_path=None)
+        with patch.object(static_call_graph, "POOL_THRESHOLD", 1):
+            pooled, _, _ = analyze_project(self.root, jobs=2, cache_path=None)
+        self.assertEqual(serial, pooled)
+
+    def test_unparsable_modules_are_reported_and_skipped(self):
+        with open(os.path.join(self.root, "broken.py"), "w") as f:
+            f.write("def broken(:\n")
+        with patch("builtins.print") as printed:
+            graph, modules, _ = analyze_project(self.root, cache_path=None)
+        self.assertEqual(modules, 6)
+        self.assertIn("broken.py", printed.call_args[0][0])
+        self.assertIn(("slugify", "clean", 1), labeled_edges(graph))
+
+    def test_main_writes_the_export_formats(self):
+        output = os.path.join(self.tmp.name, "graph.json")
+        with patch("builtins.print"):
+            static_call_graph.main([self.root, "--output", output, "--no-cache"])
+        with open(output) as f:
+            exported = json.load(f)
+        self.assertIn({"caller": "slugify", "callee": "clean", "calls": 1}, exported["edges"])
+
+if __name__ == "__main__":
+    unittest.main()
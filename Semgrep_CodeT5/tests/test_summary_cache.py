@@ -0,0 +1,59 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+from summary_cache import SummaryCache, normalize_source, summary_key
+
+
+class TestSummaryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, "summaries.sqlite3")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_key_ignores_formatting_and_indentation(self):
+        method = "    def add(self, a, b):\n        # sum\n        return a + b\n"
+        function = "def add(self, a,   b):\n    return a + b\n"
+        self.assertEqual(normalize_source(method), normalize_source(function))
+        self.assertEqual(summary_key(method, "ckpt", {"max_length": 300}), summary_key(function, "ckpt", {"max_length": 300}))
+
+    def test_key_depends_on_code_checkpoint_and_settings(self):
+        block = "def add(a, b):\n    return a + b\n"
+        key = summary_key(block, "ckpt", {"max_length": 300})
+        self.assertNotEqual(key, summary_key(block.replace("+", "-"), "ckpt", {"max_length": 300}))
+        self.assertNotEqual(key, summary_key(block, "other", {"max_length": 300}))
+        self.assertNotEqual(key, summary_key(block, "ckpt", {"max_length": 200}))
+
+    def test_unparsable_block_still_has_key(self):
+        self.assertEqual(normalize_source("  def broken(:\n"), "def broken(:")
+
+    def test_round_trip_persists(self):
+        cache = SummaryCache(self.cache_path)
+        cache.put("k1", "Adds two numbers.")
+        cache.close()
+
+        cache = SummaryCache(self.cache_path)
+        self.assertEqual(cache.get("k1"), "Adds two numbers.")
+        self.assertEqual(cache.get_many(["k1", "missing"]), {"k1": "Adds two numbers."})
+        cache.close()
+
+    def test_evicts_least_recently_used(self):
+        entry_size = len("k0") + len("x" * 100)
+        cache = SummaryCache(self.cache_path, max_bytes=entry_size * 2)
+        cache.put("k0", "x" * 100)
+        cache.put("k1", "x" * 100)
+        cache.get("k0")  # k1 is now the least recently used entry
+        cache.put("k2", "x" * 100)
+
+        self.assertEqual(set(cache.get_many(["k0", "k1", "k2"])), {"k0", "k2"})
+        self.assertLessEqual(cache.size(), entry_size * 2)
+        cache.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+import generate_tracing_statements
+import summary_server
+from summary_server import Batcher, SummaryServer, request_summaries
+
+
+class RecordingModel:
+    """Upper-cases blocks and remembers how they were grouped into calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, blocks):
+        self.calls.append(list(blocks))
+        return [block.upper() for block in blocks]
+
+
+def unused_address():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+class TestSummaryServer(unittest.TestCase):
+
+    def start_server(self, run, settings):
+        server = SummaryServer(("127.0.0.1", 0), run, settings, window=0.05)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"127.0.0.1:{server.server_address[1]}"
+
+    def test_concurrent_requests_share_one_model_call(self):
+        model = RecordingModel()
+        batcher = Batcher(model, window=0.2)
+        futures = [batcher.submit([f"block {i}a", f"block {i}b"]) for i in range(3)]
+
+        self.assertEqual([future.result(timeout=5) for future in futures],
+                         [[f"BLOCK {i}A", f"BLOCK {i}B"] for i in range(3)])
+        self.assertEqual(len(model.calls), 1)
+        self.assertEqual(len(model.calls[0]), 6)
+
+    def test_batches_stop_growing_at_max_batch(self):
+        model = RecordingModel()
+        batcher = Batcher(model, window=0.2, max_batch=2)
+        futures = [batcher.submit([str(i)]) for i in range(4)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual([len(call) for call in model.calls], [2, 2])
+
+    def test_round_trip_and_settings_check(self):
+        settings = {"checkpoint": "some/checkpoint", "backend": "torch"}
+        address = self.start_server(RecordingModel(), settings)
+
+        self.assertEqual(request_summaries(["def f(): pass"], settings, address), ["DEF F(): PASS"])
+        with patch("builtins.print"):
+            self.assertIsNone(request_summaries(["def f(): pass"], dict(settings, backend="int8"), address))
+
+    def test_model_errors_fall_back(self):
+        def broken(blocks):
+            raise RuntimeError("out of memory")
+
+        settings = {"checkpoint": "some/checkpoint"}
+        address = self.start_server(broken, settings)
+        with patch("builtins.print"):
+            self.assertIsNone(request_summaries(["x = 1"], settings, address))
+
+    def test_no_server_means_none(self):
+        self.assertIsNone(request_summaries(["x = 1"], {}, unused_address()))
+        self.assertIsNone(request_summaries(["x = 1"], {}, ""))
+
+    def test_generate_summaries_prefers_the_server(self):
+        address = self.start_server(RecordingModel(), generate_tracing_statements.model_settings())
+        with patch.object(summary_server, "SERVER_ADDRESS", address), \
+             patch.object(generate_tracing_statements, "CACHE_PATH", None), \
+             patch.object(generate_tracing_statements, "run_model", side_effect=AssertionError("ran locally")):
+            self.assertEqual(generate_tracing_statements.generate_summaries(["def a(): pass"]), ["DEF A(): PASS"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tracing_statements')))
+
+from source_rewriter import instrument_source
+import trace_runtime
+from trace_runtime import TraceWriter, bounded_repr, read_log
+
+
+class TestTraceRuntime(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.log_dir.name, "trace.bin")
+
+    def tearDown(self):
+        self.log_dir.cleanup()
+
+    def test_records_are_flushed_in_order(self):
+        writer = TraceWriter(self.log_path, flush_interval=60)
+        for i in range(5):
+            writer.record("work", ("i",), (i,))
+        writer.close()
+
+        records = list(read_log(self.log_path))
+        self.assertEqual([r["seq"] for r in records], [0, 1, 2, 3, 4])
+        self.assertEqual([r["args"] for r in records], [{"i": str(i)} for i in range(5)])
+        self.assertEqual(writer.dropped, 0)
+        with open(self.log_path, "rb") as f:
+            self.assertEqual(f.read().count(b"work"), 1)  # Records refer to the function by id
+
+    def test_out_of_order_records_are_not_counted_twice(self):
+        writer = TraceWriter(self.log_path, flush_interval=60)
+        writer.stopped = True
+        writer.wakeup.set()
+        writer.thread.join()
+        writer.record("work", ("i",), (0,))
+        late = next(writer.sequence)  # Taken by a thread that is preempted before it appends its record
+        writer.record("work", ("i",), (2,))
+        writer.flush()
+        self.assertEqual(writer.dropped, 1)
+        writer.buffer.append((late, 0, 0, 0, (1,)))
+        writer.flush()
+        writer.log.close()
+
+        self.assertEqual(writer.dropped, 0)
+        self.assertEqual(sorted(r["seq"] for r in read_log(self.log_path)), [0, 1, 2])
+
+    def test_huge_ints_are_stored_as_reprs(self):
+        writer = TraceWriter(self.log_path, flush_interval=60)
+        writer.record("work", ("small", "huge"), (7, 10 ** 3000))
+        writer.close()
+
+        args = next(read_log(self.log_path))["args"]
+        self.assertEqual(args["small"], "7")
+        self.assertLessEqual(len(args["huge"]), trace_runtime.MAX_REPR)
+        self.assertLess(os.path.getsize(self.log_path), 300)
+
+    def test_full_buffer_drops_oldest_records(self):
+        writer = TraceWriter(self.log_path, buffer_size=4, flush_interval=60)
+        # Stop the background thread first so nothing drains the buffer while it overflows.
+        writer.stopped = True
+        writer.wakeup.set()
+        writer.thread.join()
+        for i in range(10):
+            writer.record("work", ("i",), (i,))
+        writer.flush()
+        writer.log.close()
+
+        self.assertEqual([r["seq"] for r in read_log(self.log_path)], [6, 7, 8, 9])
+        self.assertEqual(writer.dropped, 6)
+
+    def test_log_rotates_and_keeps_backups(self):
+        writer = TraceWriter(self.log_path, flush_interval=60, max_bytes=300, backup_count=2)
+        for i in range(20):
+            writer.record("work", ("i",), (i,))
+            writer.flush()
+        writer.close()
+
+        self.assertTrue(os.path.isfile(self.log_path + ".1"))
+        self.assertTrue(os.path.isfile(self.log_path + ".2"))
+        self.assertFalse(os.path.exists(self.log_path + ".3"))
+        for path in (self.log_path, self.log_path + ".1", self.log_path + ".2"):
+            self.assertLessEqual(os.path.getsize(path), 300)
+            # Each file starts with the function definitions, so it can be read without the ones before it
+            self.assertEqual({r["function"] for r in read_log(path)}, {"work"})
+
+    def test_argument_reprs_are_bounded(self):
+        class Broken:
+            def __repr__(self):
+                raise RuntimeError("no repr")
+
+        self.assertLessEqual(len(bounded_repr("x" * 10000)), trace_runtime.MAX_REPR + 5)
+        self.assertLess(len(bounded_repr(list(range(100000)))), 100)
+        self.assertIn("Broken", bounded_repr(Broken()))
+
+    def test_sampling_policies(self):
+        every = trace_runtime.parse_policy("every:3")
+        self.assertEqual([every.admit() for _ in range(7)], [True, False, False, True, False, False, True])
+        first = trace_runtime.parse_policy("first:2")
+        self.assertEqual([first.admit() for _ in range(4)], [True, True, False, False])
+        self.assertIsNone(trace_runtime.parse_policy("all"))
+        for spec in ("every:0", "first:-1", "rate:0", "sometimes", "all:1", "every:x"):
+            with self.assertRaises(ValueError):
+                trace_runtime.parse_policy(spec)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        bucket = trace_runtime.TokenBucket(rate=2, burst=3, clock=lambda: now[0])
+        self.assertEqual([bucket.admit() for _ in range(4)], [True, True, True, False])
+        now[0] = 1.0  # Two more tokens after a second
+        self.assertEqual([bucket.admit() for _ in range(3)], [True, True, False])
+
+    def test_skipped_calls_are_not_recorded(self):
+        trace_runtime.configure(path=self.log_path, flush_interval=60)
+        try:
+            for i in range(10):
+                trace_runtime.trace_call("hot", ("i",), i, policy="every:4")
+        finally:
+            trace_runtime.writer.close()
+        self.assertEqual([r["args"]["i"] for r in read_log(self.log_path)], ["0", "4", "8"])
+
+    def test_same_named_functions_of_two_modules_sample_separately(self):
+        source = "def main(i):\n    return i\n"
+        trace_runtime.configure(path=self.log_path, flush_interval=60)
+        try:
+            for module in ("app.cli", "app.worker"):
+                code = instrument_source(source, {1: "Runs."}, policy_for=lambda qualname: "first:2", module=module)
+                namespace = {}
+                exec(code, namespace)
+                for i in range(5):
+                    namespace["main"](i)
+        finally:
+            trace_runtime.writer.close()
+        self.assertEqual([(r["function"], r["args"]["i"]) for r in read_log(self.log_path)],
+                         [("app.cli:main", "0"), ("app.cli:main", "1"), ("app.worker:main", "0"), ("app.worker:main", "1")])
+
+if __name__ == "__main__":
+    unittest.main()
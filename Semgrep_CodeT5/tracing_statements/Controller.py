@@ -1,7 +1,9 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
+import threading
 import generate_tracing_statements
+import model_provider
 import UI
 
 class Controller:
@@ -62,6 +64,11 @@ class Controller:
 
 
     def main(self):
+        # Load the summarization model in the background while the user picks a file; it must be the one
+        # generate_tracing_statements will ask for, backend (TRACING_INFERENCE_BACKEND) included.
+        threading.Thread(target=model_provider.warm_up, daemon=True,
+                         args=(generate_tracing_statements.checkpoint, generate_tracing_statements.device,
+                               generate_tracing_statements.BACKEND)).start()
         self.ui = UI.UI(self)
         self.ui.main()
 
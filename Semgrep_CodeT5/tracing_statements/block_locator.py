@@ -0,0 +1,229 @@
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+
+DEFAULT_RULE_FILE = "rule.yaml"
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+SKIPPED_DIRECTORIES = {"__pycache__", "venv", "node_modules"}
+
+class BlockLocator:
+    """Finds the (first_line, last_line) range of every function, method and async function in a Python file."""
+    name = None
+
+    def locate(self, file_path):
+        raise NotImplementedError
+
+    def locate_source(self, source, file_path):
+        """Like locate(), for callers that already hold the file's text; backends that can use it avoid a re-read."""
+        return self.locate(file_path)
+
+    def prefetch(self, target):
+        """Gives the backend a chance to scan a whole directory up front; a no-op unless overridden."""
+        pass
+
+class AstBlockLocator(BlockLocator):
+    """Walks the file's AST in-process, using each definition's lineno/end_lineno."""
+    name = "ast"
+
+    def __init__(self, **options):
+        pass
+
+    def locate(self, file_path):
+        try:
+            with open(file_path, "r") as f:
+                source = f.read()
+        except OSError as e:
+            print(f"Error: Could not read {file_path}: {e}")
+            return []
+
+        return self.locate_source(source, file_path)
+
+    def locate_source(self, source, file_path):
+        try:
+            return locate_function_blocks(source, file_path)
+        except SyntaxError as e:
+            print(f"Error: Could not parse {file_path}: {e}")
+            return []
+
+class SemgrepBlockLocator(BlockLocator):
+    """Runs Semgrep with --json and reads the start/end lines of each match.
+
+    prefetch() scans a whole directory with every rule file in a single Semgrep run; locate() then answers
+    from those results and only starts Semgrep itself for files outside the prefetched scan.
+    """
+    name = "semgrep"
+
+    def __init__(self, rule_files=(DEFAULT_RULE_FILE,), jobs=None, **options):
+        self.rule_files = [rule_files] if isinstance(rule_files, str) else list(rule_files)
+        self.jobs = jobs
+        self.results = {}
+
+    def prefetch(self, target):
+        self.results.update(scan_with_semgrep(self.rule_files, target, self.jobs))
+
+    def locate(self, file_path):
+        file_path = os.path.abspath(file_path)
+        if file_path not in self.results:
+            self.results.update(scan_with_semgrep(self.rule_files, file_path, self.jobs))
+        return self.results.get(file_path, [])
+
+LOCATORS = {locator.name: locator for locator in (AstBlockLocator, SemgrepBlockLocator)}
+
+def get_block_locator(name="ast", **options):
+    """Returns the block locator registered under the given name."""
+    if name not in LOCATORS:
+        raise ValueError(f"Unknown block locator '{name}'. Choose from: {', '.join(sorted(LOCATORS))}")
+    return LOCATORS[name](**options)
+
+def locate_function_blocks(source, filename="<unknown>"):
+    """Returns sorted (first_line, last_line) ranges of all function definitions in the source, nested ones included."""
+    tree = ast.parse(source, filename)
+    return sorted((node.lineno, node.end_lineno) for node in ast.walk(tree) if isinstance(node, FUNCTION_NODES))
+
+def enclosing_blocks(line_number_blocks):
+    """Maps the index of each nested block to the index of the innermost block containing it; top-level blocks are left out."""
+    parents = {}
+    stack = []
+    for i in sorted(range(len(line_number_blocks)), key=lambda i: (line_number_blocks[i][0], -line_number_blocks[i][1])):
+        first, last = line_number_blocks[i]
+        while stack and line_number_blocks[stack[-1]][1] < first:
+            stack.pop()
+        if stack and line_number_blocks[stack[-1]] != (first, last) and last <= line_number_blocks[stack[-1]][1]:
+            parents[i] = stack[-1]
+        stack.append(i)
+    return parents
+
+def install_semgrep():
+    """Install Semgrep using pip if it is not already installed."""
+    print("Semgrep is not installed. Installing Semgrep...")
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "semgrep"])
+    print("Semgrep installed successfully.")
+
+def get_semgrep_path():
+    """Get the path to the Semgrep executable."""
+    scripts_dir = os.path.join(os.path.dirname(sys.executable), "Scripts")
+    semgrep_path = os.path.join(scripts_dir, "semgrep.exe")
+    return semgrep_path if os.path.isfile(semgrep_path) else "semgrep"
+
+def ensure_semgrep():
+    """Returns the Semgrep executable, installing Semgrep first if it cannot be found."""
+    semgrep_path = get_semgrep_path()
+
+    try:
+        subprocess.run([semgrep_path, "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        install_semgrep()
+        semgrep_path = get_semgrep_path()
+    except subprocess.CalledProcessError:
+        print("Warning: Semgrep version check failed. Attempting to run Semgrep anyway.")
+
+    return semgrep_path
+
+def run_semgrep(rule_file, target_file):
+    """Run Semgrep with the specified rule file on the given Python file and return the raw output."""
+    semgrep_path = ensure_semgrep()
+
+    if not os.path.isfile(rule_file) or not os.path.isfile(target_file):
+        print(f"Error: Missing files: rule_file='{rule_file}', target_file='{target_file}'")
+        return ""
+
+    print(f"Running Semgrep on {target_file}")
+    result = subprocess.run(
+        [semgrep_path, "--config", rule_file, target_file],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+
+    return result.stdout
+
+def run_semgrep_json(rule_files, target, jobs=None):
+    """Runs one Semgrep scan of a file or directory with all rule files and returns the parsed --json report."""
+    missing = [path for path in list(rule_files) + [target] if not os.path.exists(path)]
+    if missing:
+        print(f"Error: Missing files: {', '.join(missing)}")
+        return {"results": [], "errors": [], "paths": {"scanned": []}}
+
+    command = [ensure_semgrep(), "--json", "--quiet"]
+    for rule_file in rule_files:
+        command += ["--config", rule_file]
+    if jobs:
+        command += ["--jobs", str(jobs)]
+    command.append(target)
+
+    print(f"Running Semgrep on {target}")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    try:
+        report = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        print(f"Error: Semgrep did not produce a JSON report: {result.stderr.strip()}")
+        return {"results": [], "errors": [], "paths": {"scanned": []}}
+
+    for error in report.get("errors", []):
+        print(f"Warning: Semgrep reported: {error.get('message', error)}")
+    return report
+
+def group_semgrep_results(report):
+    """Fans a Semgrep JSON report out to {absolute file path: sorted (first_line, last_line) ranges}.
+
+    Every scanned file gets an entry, so files without matches are not scanned again. Matches of the same
+    range by several rules are reported once.
+    """
+    blocks = {os.path.abspath(path): set() for path in report.get("paths", {}).get("scanned", [])}
+    for result in report.get("results", []):
+        blocks.setdefault(os.path.abspath(result["path"]), set()).add((result["start"]["line"], result["end"]["line"]))
+    return {path: sorted(ranges) for path, ranges in blocks.items()}
+
+def scan_with_semgrep(rule_files, target, jobs=None):
+    """Scans a file or a whole directory in one Semgrep run and returns the per-file block ranges."""
+    return group_semgrep_results(run_semgrep_json(rule_files, target, jobs))
+
+def find_python_files(directory):
+    """Returns the sorted paths of all Python files below the directory, skipping hidden and virtualenv folders."""
+    python_files = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d not in SKIPPED_DIRECTORIES]
+        python_files.extend(os.path.join(root, name) for name in files if name.endswith(".py"))
+    return sorted(python_files)
+
+def extract_first_last_line_numbers(semgrep_output):
+    """Extracts first and last line numbers from the Semgrep output, including support for nested blocks."""
+    blocks = []
+    current_stack = []
+    in_block = False
+
+    for line in semgrep_output.splitlines():
+        if "Semgrep found" in line:
+            if current_stack:
+                first_line_number, last_line_number = current_stack.pop()
+                if first_line_number and last_line_number:
+                    blocks.append((first_line_number, last_line_number))
+            current_stack.clear()
+            in_block = True
+
+        elif "┆----------------------------------------" in line:
+            if current_stack:
+                first_line_number, last_line_number = current_stack.pop()
+                if first_line_number and last_line_number:
+                    blocks.append((first_line_number, last_line_number))
+            in_block = False
+
+        elif in_block and re.match(r"^(\d+)┆", line.strip()):
+            match = re.match(r"^(\d+)┆", line.strip())
+            if match:
+                line_number = int(match.group(1))
+
+                if not current_stack:
+                    current_stack.append((line_number, line_number))
+                else:
+                    first_line_number, last_line_number = current_stack[-1]
+                    current_stack[-1] = (first_line_number, line_number)
+
+    if current_stack:
+        first_line_number, last_line_number = current_stack.pop()
+        if first_line_number and last_line_number:
+            blocks.append((first_line_number, last_line_number))
+
+    return blocks
@@ -0,0 +1,214 @@
+import glob
+import mmap
+import os
+import re
+import time
+
+# A call event log records every call and return of a traced run in a compact binary stream, so long-running targets
+# can be traced with flat memory and analyzed offline (see call_graph_builder). Layout, after a header of MAGIC,
+# VERSION and the wall-clock ns at the start of the capture:
+#   FUNCTION id filename first_line qualname   defines a function id, before its first call
+#   CONTEXT id name                            defines a thread or asyncio task id, before its first switch
+#   SWITCH id                                  the following events happen in that context
+#   CALL function_id delta_ns                  a call, delta_ns after the previous event of any context
+#   RETURN delta_ns                            a return from the innermost call of the current context
+# Numbers are unsigned LEB128 varints, strings a varint byte length and UTF-8. Timestamps are perf_counter_ns deltas,
+# mostly one or two bytes each, so a call and its return usually take 6 to 8 bytes.
+MAGIC = b"CGEVLOG"
+VERSION = 1
+FUNCTION, CONTEXT, SWITCH, CALL, RETURN = range(5)
+FLUSH_BYTES = 1 << 20  # Events buffered in memory before they are written out
+SHARD_NAME = re.compile(r"calls-(\d+)\.log")  # The log of one process of a multi-process capture
+
+def append_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def append_string(buffer, text):
+    data = text.encode("utf-8", "surrogatepass")
+    append_varint(buffer, len(data))
+    buffer += data
+
+class CallEventWriter:
+    """Appends call and return events to a log file through a fixed-size buffer.
+
+    Not thread-safe on its own: generate_call_graph calls it under graph_lock once several threads record calls.
+    """
+
+    def __init__(self, path, flush_bytes=FLUSH_BYTES):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.file = open(path, "wb")
+        self.buffer = bytearray(MAGIC)
+        self.buffer.append(VERSION)
+        append_varint(self.buffer, time.time_ns())
+        self.function_ids = {}
+        self.context_ids = {}
+        self.context = None
+        self.last = time.perf_counter_ns()
+        self.events = 0
+
+    def switch(self, name):
+        buffer = self.buffer
+        context_id = self.context_ids.get(name)
+        if context_id is None:
+            context_id = self.context_ids[name] = len(self.context_ids)
+            buffer.append(CONTEXT)
+            append_varint(buffer, context_id)
+            append_string(buffer, name)
+        buffer.append(SWITCH)
+        append_varint(buffer, context_id)
+        self.context = name
+
+    def call(self, context, function):
+        now = time.perf_counter_ns()
+        buffer = self.buffer
+        if context != self.context:
+            self.switch(context)
+        function_id = self.function_ids.get(function)
+        if function_id is None:
+            function_id = self.function_ids[function] = len(self.function_ids)
+            buffer.append(FUNCTION)
+            append_varint(buffer, function_id)
+            append_string(buffer, function[0])
+            append_varint(buffer, function[1])
+            append_string(buffer, function[2])
+        buffer.append(CALL)
+        append_varint(buffer, function_id)
+        append_varint(buffer, max(0, now - self.last))
+        self.last = now
+        self.events += 1
+        if len(buffer) >= self.flush_bytes:
+            self.flush()
+
+    def ret(self, context):
+        now = time.perf_counter_ns()
+        buffer = self.buffer
+        if context != self.context:
+            self.switch(context)
+        buffer.append(RETURN)
+        append_varint(buffer, max(0, now - self.last))
+        self.last = now
+        self.events += 1
+        if len(buffer) >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+def read_events(path):
+    """Yields (kind, context name, function, time ns) for every event of a log, kind being CALL or RETURN.
+
+    The log is memory-mapped and decoded as it is read, so memory stays flat however long the capture. Times count
+    from the start of the capture. A log cut short (the traced process was killed) ends at its last whole event.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{path} is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from decode_events(data, path)
+
+def decode_events(data, path="<log>"):
+    if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} call event log")
+    size = len(data)
+    position = len(MAGIC) + 1
+
+    def varint():
+        nonlocal position
+        result = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def string():
+        nonlocal position
+        length = varint()
+        if position + length > size:
+            raise IndexError
+        text = bytes(data[position:position + length]).decode("utf-8", "surrogatepass")
+        position += length
+        return text
+
+    try:
+        varint()  # Wall-clock start, see log_start_time
+        functions, contexts = [], []
+        context = None
+        now = 0
+        while position < size:
+            kind = data[position]
+            position += 1
+            if kind == CALL:
+                function = functions[varint()]
+                now += varint()
+                yield CALL, context, function, now
+            elif kind == RETURN:
+                now += varint()
+                yield RETURN, context, None, now
+            elif kind == SWITCH:
+                context = contexts[varint()]
+            elif kind == FUNCTION:
+                varint()  # Ids are assigned in order
+                filename = string()
+                functions.append((filename, varint(), string()))
+            elif kind == CONTEXT:
+                varint()
+                contexts.append(string())
+            else:
+                raise ValueError(f"{path}: unknown event {kind} at byte {position - 1}")
+    except IndexError:
+        return  # Truncated in the middle of an event
+
+def log_start_time(path):
+    """The wall-clock time (ns since the epoch) at which a capture started."""
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + 11)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a call event log")
+    result = shift = 0
+    for byte in header[len(MAGIC) + 1:]:
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return result
+
+def shard_path(directory, pid):
+    return os.path.join(directory, f"calls-{pid}.log")
+
+def shard_paths(directory):
+    """The shards of a multi-process capture, by process id."""
+    paths = [path for path in glob.glob(os.path.join(directory, "calls-*.log"))
+             if SHARD_NAME.fullmatch(os.path.basename(path))]
+    return sorted(paths, key=lambda path: int(SHARD_NAME.fullmatch(os.path.basename(path)).group(1)))
+
+def shard_process(path):
+    """The process that wrote a log: its process id for a shard, else the file name without its extension."""
+    name = os.path.basename(path)
+    match = SHARD_NAME.fullmatch(name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+def read_shards(paths):
+    """Yields the events of several logs like read_events, naming each context after its process ("4242/MainThread").
+
+    A process killed before it wrote anything leaves an empty shard, which is skipped.
+    """
+    for path in paths:
+        if os.path.getsize(path) == 0:
+            continue
+        process = shard_process(path)
+        for kind, context, function, now in read_events(path):
+            yield kind, f"{process}/{context}", function, now
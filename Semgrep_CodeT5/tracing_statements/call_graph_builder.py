@@ -0,0 +1,57 @@
+import argparse
+import os
+import time
+
+import generate_call_graph
+from call_event_log import CALL, log_start_time, read_events, read_shards, shard_paths
+from generate_call_graph import add_export_arguments, replay_events, report
+
+# Builds the call graph, timings and flame-graph stacks of a capture recorded with
+# `generate_call_graph.py --event-log PATH` (or CALL_GRAPH_EVENT_LOG=PATH), after the traced program has finished.
+# The log holds every call, so one capture can be looked at several ways: narrowed to some files with
+# --include/--exclude, to some threads or tasks with --context, or merged by class or module with --level.
+# The shards of a process capture (`generate_call_graph.py --processes DIR`) are merged by giving their directory, or
+# several logs; each context is then named after its process ("4242/MainThread", "4242/MainThread/Task-1").
+
+def count_events(events, counts):
+    """Passes events through, counting calls, returns and the contexts they happen in."""
+    for event in events:
+        counts[event[0] == CALL] += 1
+        counts[2].add(event[1])
+        yield event
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a call graph from a call event log.")
+    parser.add_argument("event_logs", nargs="+", metavar="event_log",
+                        help="A call event log, or a directory of process capture shards")
+    add_export_arguments(parser)
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="Keep only functions in files matching this pattern (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Leave out functions in files matching this pattern (repeatable)")
+    parser.add_argument("--context", action="append", default=[], metavar="NAME",
+                        help="Keep only calls made in this thread or asyncio task (repeatable)")
+    parser.add_argument("--collapsed", default=generate_call_graph.COLLAPSED_STACKS_PATH, metavar="PATH",
+                        help="Where to write the collapsed stacks for flame graphs")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for path in args.event_logs:
+        paths.extend(shard_paths(path) if os.path.isdir(path) else [path])
+    if not paths:
+        parser.error(f"no call event logs in {', '.join(args.event_logs)}")
+
+    start = time.perf_counter()
+    counts = [0, 0, set()]  # returns, calls, contexts
+    events = read_events(paths[0]) if len(paths) == 1 else read_shards(paths)
+    replay_events(count_events(events, counts), args.include, args.exclude, set(args.context))
+    seconds = time.perf_counter() - start
+    started = min(log_start_time(path) for path in paths if os.path.getsize(path))
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started / 1e9))
+    print(f"Read {counts[1]} calls and {counts[0]} returns in {len(counts[2])} contexts from {len(paths)} "
+          f"log{'s' if len(paths) != 1 else ''} captured at {started}, in {seconds:.2f}s")
+
+    report(args, args.collapsed)
+
+if __name__ == "__main__":
+    main()
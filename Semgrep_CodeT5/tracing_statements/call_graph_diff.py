@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+
+import generate_call_graph
+from call_event_log import MAGIC, read_events, read_shards, shard_paths
+from generate_call_graph import PROGRAM_START
+from static_call_graph import module_name
+
+# Compares two call-graph captures, typically of two releases, to catch performance regressions. A capture is a JSON
+# export (generate_call_graph.py --output run.json, with CALL_GRAPH_TIMING=1 for timings), a call event log or a
+# directory of process capture shards; logs and shards are replayed, neither program is run again. Functions are
+# matched by dotted module path and qualified name, modules being named from the directory of the scripts each
+# capture ran (pkg_a.utils, pkg_b.utils), so moved lines and different checkout paths still match.
+#
+# Every change is ranked by its impact: how much it changed as a share of the larger run's total, of calls for an
+# edge and of traced time for a function. A helper that went from 1k to 1M calls changed by most of the second
+# run's calls and comes first, however small each call is. Functions are shown with their inclusive time but ranked
+# by their exclusive time, so the function that got slower comes before the callers whose time it inflates.
+
+def load_capture(path):
+    """Returns (call graph, function times) of a capture; function times are None when it was not timed."""
+    if os.path.isdir(path):
+        return replay_capture(read_shards(shard_paths(path)))
+    with open(path, "rb") as f:
+        is_log = f.read(len(MAGIC)) == MAGIC
+    return replay_capture(read_events(path)) if is_log else load_json_capture(path)
+
+def replay_capture(events):
+    """Replays a log through generate_call_graph and takes its graph and times, leaving the module as it was found."""
+    timing = generate_call_graph.timing_enabled
+    try:
+        generate_call_graph.replay_events(events)
+        graph = {caller: Counter(callees) for caller, callees in generate_call_graph.call_graph.items()}
+        times = {function: list(times) for function, times in generate_call_graph.function_times.items()}
+    finally:
+        generate_call_graph.reset_call_graph()
+        generate_call_graph.timing_enabled = timing
+    return graph, times
+
+def load_json_capture(path):
+    with open(path) as f:
+        data = json.load(f)
+    functions = {node["id"]: (node["filename"], node["first_line"], node["qualname"]) for node in data["nodes"]}
+    graph = defaultdict(Counter)
+    calls = Counter()
+    for edge in data["edges"]:
+        callee = functions[edge["callee"]]
+        graph[functions[edge["caller"]]][callee] += edge["calls"]
+        calls[callee] += edge["calls"]
+    times = {functions[node["id"]]: [calls[functions[node["id"]]], node["inclusive_ns"], node["exclusive_ns"]]
+             for node in data["nodes"] if "inclusive_ns" in node}
+    return graph, times or None
+
+def capture_root(graph):
+    """The directory a capture's modules are named from: that of the scripts it ran, else the one all its files share."""
+    started = [function[0] for function in graph.get(PROGRAM_START, ()) if os.path.isabs(function[0])]
+    files = started or [function[0] for callees in graph.values() for function in callees
+                        if os.path.isabs(function[0])]
+    try:
+        return os.path.commonpath([os.path.dirname(filename) for filename in files]) if files else None
+    except ValueError:  # Files on several Windows drives
+        return None
+
+def module_key(filename, root):
+    """The dotted module path of a file under root. Files outside it, such as libraries, are named from the
+    site-packages or standard library directory they are in, else from their full path."""
+    if not filename:
+        return ""
+    if not os.path.isabs(filename):
+        return module_name(filename, os.curdir)  # A script run by a relative path, from its own directory
+    if root and os.path.commonpath([root, filename]) == root:
+        return module_name(filename, root)
+    parts = filename.split(os.sep)
+    for index in range(len(parts) - 2, 0, -1):
+        if parts[index] in ("site-packages", "dist-packages") or re.fullmatch(r"python\d+(\.\d+)?", parts[index]):
+            return module_name(filename, os.sep.join(parts[:index + 1]))
+    return module_name(filename, os.path.splitdrive(filename)[0] + os.sep)
+
+def function_key(function, root):
+    """(module, qualified name): the same function in both captures, wherever its checkout and first line are."""
+    return module_key(function[0], root), function[2]
+
+def key_labels(keys):
+    """Names functions by their qualified name, adding the module where two modules have one of the same name."""
+    qualnames = Counter(qualname for _, qualname in keys)
+    return {(module, qualname): qualname if qualnames[qualname] == 1 else f"{module}.{qualname}"
+            for module, qualname in keys}
+
+def keyed_edges(graph, root):
+    edges = Counter()
+    for caller, callees in graph.items():
+        for callee, calls in callees.items():
+            edges[function_key(caller, root), function_key(callee, root)] += calls
+    return edges
+
+def keyed_times(times, root):
+    keyed = defaultdict(lambda: [0, 0, 0])
+    for function, values in (times or {}).items():
+        total = keyed[function_key(function, root)]
+        for i, value in enumerate(values):
+            total[i] += value
+    return keyed
+
+def diff_captures(before, after):
+    """Lists the changes between two captures loaded by load_capture, most impactful first.
+
+    Each change is a dict: kind ("added", "removed" or "calls" for an edge, "time" for a function), item, before,
+    after (calls, or inclusive ns) and impact. Functions also have their calls and exclusive ns before and after;
+    they are only compared when both captures are timed.
+    """
+    root_before, root_after = capture_root(before[0]), capture_root(after[0])
+    edges_before, edges_after = keyed_edges(before[0], root_before), keyed_edges(after[0], root_after)
+    times_before, times_after = keyed_times(before[1], root_before), keyed_times(after[1], root_after)
+    labels = key_labels({key for edge in list(edges_before) + list(edges_after) for key in edge} |
+                        set(times_before) | set(times_after))
+
+    changes = []
+    total_calls = max(sum(edges_before.values()), sum(edges_after.values()), 1)
+    for edge in edges_before.keys() | edges_after.keys():
+        old, new = edges_before[edge], edges_after[edge]
+        if old != new:
+            kind = "added" if not old else "removed" if not new else "calls"
+            changes.append({"kind": kind, "item": f"{labels[edge[0]]} -> {labels[edge[1]]}", "before": old,
+                            "after": new, "impact": abs(new - old) / total_calls})
+
+    if before[1] is not None and after[1] is not None:
+        total_time = max(sum(times[2] for times in times_before.values()),
+                         sum(times[2] for times in times_after.values()), 1)
+        for function in times_before.keys() | times_after.keys():
+            (old_calls, old, old_own), (new_calls, new, new_own) = times_before[function], times_after[function]
+            if (old, old_own) != (new, new_own):
+                changes.append({"kind": "time", "item": labels[function], "before": old, "after": new,
+                                "impact": abs(new_own - old_own) / total_time, "calls_before": old_calls,
+                                "calls_after": new_calls, "exclusive_before": old_own, "exclusive_after": new_own})
+    changes.sort(key=lambda change: (-change["impact"], change["item"], change["kind"]))
+    return changes
+
+def change_table(changes):
+    width = max([len("what")] + [len(change["item"]) for change in changes])
+    lines = [f"{'impact':>8}  {'change':<8}{'what':<{width}}{'before':>14}{'after':>14}{'ratio':>10}"]
+    for change in changes:
+        old, new = change["before"], change["after"]
+        ratio = f"x{new / old:.1f}" if old and new else ""
+        if change["kind"] == "time":
+            old, new = f"{old / 1e6:.3f} ms", f"{new / 1e6:.3f} ms"
+        lines.append(f"{change['impact']:>8.1%}  {change['kind']:<8}{change['item']:<{width}}{old:>14}{new:>14}"
+                     f"{ratio:>10}")
+    return "\n".join(lines) + "\n"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the call graphs and timings of two captures.")
+    parser.add_argument("before", help="A JSON export, call event log or directory of process shards")
+    parser.add_argument("after", help="The capture to compare with the first one")
+    parser.add_argument("--top", type=int, default=20, help="Show this many changes, those with the most impact")
+    parser.add_argument("--min-impact", type=float, default=0.0, metavar="SHARE",
+                        help="Leave out changes smaller than this share of the run, e.g. 0.01")
+    parser.add_argument("--output", help="Also write every change to this JSON file")
+    parser.add_argument("--fail-above", type=float, metavar="SHARE",
+                        help="Exit with status 1 when calls or time grew by more than this share of the run")
+    args = parser.parse_args(argv)
+
+    changes = [change for change in diff_captures(load_capture(args.before), load_capture(args.after))
+               if change["impact"] >= args.min_impact]
+    if not changes:
+        print("No differences.")
+    else:
+        print(change_table(changes[:args.top]), end="")
+        if len(changes) > args.top:
+            print(f"... and {len(changes) - args.top} smaller changes")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(changes, f, indent=2)
+            f.write("\n")
+        print(f"Changes written to {args.output}")
+
+    if args.fail_above is not None:
+        regressions = [change for change in changes
+                       if change["after"] > change["before"] and change["impact"] > args.fail_above]
+        if regressions:
+            print(f"{len(regressions)} changes grew by more than {args.fail_above:.1%} of the run")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
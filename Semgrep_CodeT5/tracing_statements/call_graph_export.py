@@ -0,0 +1,279 @@
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
+from xml.sax.saxutils import escape
+
+# Text, DOT, JSON, GraphML and SVG exports shared by the dynamic tracer (generate_call_graph) and the static analyzer
+# (static_call_graph). A call graph maps each caller to a Counter of callees; functions are identified by
+# (filename, first line, qualified name) tuples. Aggregated graphs use the same tuples with first line 0 for classes
+# and modules, so every export works on them too.
+
+def function_labels(graph):
+    """Names every function by its qualified name, adding file and line where two functions share one."""
+    functions = set(graph)
+    for callees in graph.values():
+        functions.update(callees)
+    return label_functions(functions)
+
+def label_functions(functions):
+    functions = set(functions)
+    qualnames = Counter(qualname for _, _, qualname in functions)
+    labels = {}
+    for filename, first_line, qualname in functions:
+        label = qualname if qualnames[qualname] == 1 else f"{qualname} ({location(os.path.basename(filename), first_line)})"
+        labels[filename, first_line, qualname] = label
+    # Files with the same name in different directories (every __init__.py) need their full path to stay apart.
+    taken = Counter(labels.values())
+    for (filename, first_line, qualname), label in labels.items():
+        if taken[label] > 1:
+            labels[filename, first_line, qualname] = f"{qualname} ({location(filename, first_line)})"
+    return labels
+
+def location(filename, first_line):
+    return f"{filename}:{first_line}" if first_line else filename
+
+def labeled_edges(graph, skip_module=False):
+    """Returns (caller, callee, calls) for every edge, with functions named by function_labels."""
+    labels = function_labels(graph)
+    return [(labels[caller], labels[callee], calls) for caller, callees in graph.items() for callee, calls in callees.items()
+            if not (skip_module and "<module>" in (caller[2], callee[2]))]
+
+CALL_GRAPH_LEVELS = ("function", "class", "module")
+
+def aggregate_function(function, level):
+    """The class or module a function belongs to, as a (filename, 0, name) node."""
+    filename, first_line, qualname = function
+    if level == "function" or not filename:
+        return function
+    if level == "module":
+        name = os.path.splitext(os.path.basename(filename))[0]
+        if name == "__init__":
+            name = os.path.basename(os.path.dirname(filename)) or name
+        return filename, 0, name
+    # Nested functions belong to their outermost enclosing definition, methods to their class.
+    owner = qualname.split(".<locals>.")[0]
+    return filename, 0, owner.rsplit(".", 1)[0]
+
+def aggregate_call_graph(graph, level="function"):
+    """Merges functions into their class or module, adding up the calls of the edges merged together.
+
+    Calls between functions of the same class or module become a self-loop on it.
+    """
+    if level not in CALL_GRAPH_LEVELS:
+        raise ValueError(f"Unknown aggregation level {level!r}; expected one of {', '.join(CALL_GRAPH_LEVELS)}")
+    if level == "function":
+        return graph
+    aggregated = defaultdict(Counter)
+    for caller, callees in graph.items():
+        for callee, calls in callees.items():
+            aggregated[aggregate_function(caller, level)][aggregate_function(callee, level)] += calls
+    return aggregated
+
+def prune_call_graph(graph, top):
+    """Keeps the `top` edges with the most calls, so rendering cost does not grow with the program."""
+    if top is None:
+        return graph
+    labels = function_labels(graph)
+    edges = sorted(((calls, caller, callee) for caller, callees in graph.items() for callee, calls in callees.items()),
+                   key=lambda edge: (-edge[0], labels[edge[1]], labels[edge[2]]))
+    pruned = defaultdict(Counter)
+    for calls, caller, callee in edges[:top]:
+        pruned[caller][callee] = calls
+    return pruned
+
+def call_graph_to_text(graph):
+    return "".join(f"  {caller} -> {callee} [{calls} call{'s' if calls != 1 else ''}]\n"
+                   for caller, callee, calls in labeled_edges(graph, skip_module=True))
+
+def call_graph_to_dot(graph):
+    """Graphviz DOT with call counts as edge labels and weights."""
+    lines = ["digraph call_graph {"]
+    for caller, callee, calls in labeled_edges(graph):
+        lines.append(f"  {json.dumps(caller)} -> {json.dumps(callee)} [label=\"{calls}\", weight={calls}];")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def call_graph_to_json(graph, function_timing=None, edge_timing=None, context_graphs=None, recursion=None):
+    """JSON with one node per function (file, first line, qualified name) and one weighted edge per caller/callee pair.
+
+    With timings from a timing run, nodes carry inclusive_ns/exclusive_ns and edges the callee's time on that edge.
+    With the call graph of each thread or asyncio task, edges carry their calls per context name. With the
+    recursion depths of a trace, the edge that first closed each recursive chain carries its chains and their depth.
+    """
+    labels = function_labels(graph)
+    nodes = []
+    for function, label in sorted(labels.items(), key=lambda item: item[1]):
+        node = {"id": label, "filename": function[0], "first_line": function[1], "qualname": function[2]}
+        if function_timing and function in function_timing:
+            node["inclusive_ns"], node["exclusive_ns"] = function_timing[function][1:]
+        nodes.append(node)
+    edges = []
+    for caller, callees in graph.items():
+        for callee, calls in callees.items():
+            edge = {"caller": labels[caller], "callee": labels[callee], "calls": calls}
+            if edge_timing and (caller, callee) in edge_timing:
+                edge["inclusive_ns"], edge["exclusive_ns"] = edge_timing[caller, callee]
+            if context_graphs:
+                edge["contexts"] = {name: context_graph[caller][callee] for name, context_graph in
+                                    sorted(context_graphs.items()) if callee in context_graph.get(caller, ())}
+            if recursion and (caller, callee) in recursion:
+                chains, frames, deepest = recursion[caller, callee]
+                edge["recursion"] = {"chains": chains, "mean_depth": round(frames / chains, 1), "max_depth": deepest}
+            edges.append(edge)
+    return json.dumps({"nodes": nodes, "edges": edges}, indent=2) + "\n"
+
+def call_graph_to_graphml(graph):
+    """GraphML for Gephi, yEd or networkx.read_graphml, with call counts as edge weights."""
+    root = ET.Element("graphml", xmlns="http://graphml.graphdrawing.org/xmlns")
+    for key, target, name, kind in (("d0", "node", "filename", "string"), ("d1", "node", "first_line", "int"),
+                                    ("d2", "node", "qualname", "string"), ("d3", "edge", "calls", "int")):
+        ET.SubElement(root, "key", {"id": key, "for": target, "attr.name": name, "attr.type": kind})
+    element = ET.SubElement(root, "graph", id="call_graph", edgedefault="directed")
+    labels = function_labels(graph)
+    for function, label in sorted(labels.items(), key=lambda item: item[1]):
+        node = ET.SubElement(element, "node", id=label)
+        for key, value in zip(("d0", "d1", "d2"), function):
+            ET.SubElement(node, "data", key=key).text = str(value)
+    for caller, callee, calls in labeled_edges(graph):
+        edge = ET.SubElement(element, "edge", source=caller, target=callee)
+        ET.SubElement(edge, "data", key="d3").text = str(calls)
+    ET.indent(root)
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+
+def layered_layout(nodes, edges):
+    """Places callers above their callees: each node goes one layer below the first caller that reaches it.
+
+    Returns {node: (layer, position in layer)}. Nodes are ordered within a layer by the mean position of their
+    callers, which keeps most edges short. Apart from sorting, the work is linear in the size of the graph.
+    """
+    callees, callers = defaultdict(list), defaultdict(list)
+    for caller, callee in edges:
+        if caller != callee:
+            callees[caller].append(callee)
+            callers[callee].append(caller)
+    layer = {}
+    pending = sorted(nodes, key=lambda node: (len(callers[node]) > 0, node))
+    for root in pending:
+        if root in layer:
+            continue
+        layer[root] = 0 if not callers[root] else max((layer[c] + 1 for c in callers[root] if c in layer), default=0)
+        frontier = [root]
+        while frontier:
+            following = []
+            for node in frontier:
+                for callee in callees[node]:
+                    if callee not in layer:
+                        layer[callee] = layer[node] + 1
+                        following.append(callee)
+            frontier = following
+
+    rows = defaultdict(list)
+    for node in sorted(nodes):
+        rows[layer[node]].append(node)
+    position = {}
+    for depth in sorted(rows):
+        def barycenter(node):
+            above = [position[c][1] for c in callers[node] if c in position and position[c][0] < depth]
+            return sum(above) / len(above) if above else float("inf")
+        rows[depth].sort(key=barycenter)
+        for index, node in enumerate(rows[depth]):
+            position[node] = (depth, index)
+    return position
+
+def call_graph_to_svg(graph):
+    """A standalone SVG drawing of the graph, laid out without Graphviz or a display.
+
+    Edge width grows with the logarithm of the call count. Edges from "Program Start" and module code are left
+    out, as in the text export; prune large graphs first (prune_call_graph) to keep the drawing readable.
+    """
+    char_width, node_height, gap, layer_height, margin = 7, 26, 24, 90, 20
+    edges = labeled_edges(graph, skip_module=True)
+    nodes = {node for caller, callee, _ in edges for node in (caller, callee)}
+    position = layered_layout(nodes, [(caller, callee) for caller, callee, _ in edges])
+    width = {node: len(node) * char_width + 16 for node in nodes}
+
+    rows = defaultdict(list)
+    for node, (depth, index) in position.items():
+        rows[depth].append((index, node))
+    row_widths = {depth: sum(width[node] for _, node in row) + gap * (len(row) - 1) for depth, row in rows.items()}
+    canvas_width = max(row_widths.values(), default=0) + 2 * margin
+    canvas_height = (max(rows, default=-1) + 1) * layer_height - (layer_height - node_height) + 2 * margin
+    box = {}
+    for depth, row in rows.items():
+        x = margin + (canvas_width - 2 * margin - row_widths[depth]) / 2
+        for _, node in sorted(row):
+            box[node] = (x, margin + depth * layer_height)
+            x += width[node] + gap
+
+    lines = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{canvas_width:.0f}" height="{canvas_height:.0f}" '
+             f'font-family="monospace" font-size="12">',
+             '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="6" markerHeight="6" '
+             'orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z" fill="#555"/></marker></defs>']
+    for caller, callee, calls in edges:
+        stroke = 1 + math.log10(calls)
+        (x1, y1), (x2, y2) = box[caller], box[callee]
+        if caller == callee:
+            x, y = x1 + width[caller], y1 + node_height / 2
+            path = f"M {x:.1f} {y - 6:.1f} C {x + 30:.1f} {y - 20:.1f}, {x + 30:.1f} {y + 20:.1f}, {x:.1f} {y + 6:.1f}"
+            label_x, label_y = x + 26, y + 4
+        else:
+            start_x, end_x = x1 + width[caller] / 2, x2 + width[callee] / 2
+            start_y, end_y = (y1 + node_height, y2) if y2 > y1 else (y1, y2 + node_height)
+            bend = 0 if y2 > y1 else 40  # Calls back up the layers (recursion, cycles) curve to the side
+            path = (f"M {start_x:.1f} {start_y:.1f} C {start_x + bend:.1f} {(start_y + end_y) / 2:.1f}, "
+                    f"{end_x + bend:.1f} {(start_y + end_y) / 2:.1f}, {end_x:.1f} {end_y:.1f}")
+            label_x, label_y = (start_x + end_x) / 2 + bend * 0.75 + 4, (start_y + end_y) / 2
+        lines.append(f'<path d="{path}" fill="none" stroke="#555" stroke-width="{stroke:.2f}" '
+                     f'marker-end="url(#arrow)"><title>{escape(caller)} -&gt; {escape(callee)}: {calls}</title></path>')
+        lines.append(f'<text x="{label_x:.1f}" y="{label_y:.1f}" fill="#a33">{calls}</text>')
+    for node, (x, y) in sorted(box.items()):
+        lines.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{width[node]}" height="{node_height}" rx="5" '
+                     f'fill="#e8f0fe" stroke="#2196F3"/>')
+        lines.append(f'<text x="{x + 8:.1f}" y="{y + 17:.1f}">{escape(node)}</text>')
+    lines.append("</svg>")
+    return "\n".join(lines) + "\n"
+
+def collapsed_stacks(stacks):
+    """Collapsed-stack lines ("Program Start;main;helper 1200") weighted by exclusive ns, for flame graph tools."""
+    labels = label_functions(function for stack in stacks for function in stack)
+    return "".join(f"{';'.join(['Program Start'] + [labels[function] for function in stack])} {own}\n"
+                   for stack, own in sorted(stacks.items(), key=lambda item: [labels[f] for f in item[0]]) if own > 0)
+
+def hotspot_table(times, limit=20):
+    """The functions that took the most exclusive time, with their call counts and inclusive time."""
+    labels = label_functions(times)
+    rows = sorted(times.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    width = max([len("function")] + [len(labels[function]) for function, _ in rows])
+    lines = [f"{'function':<{width}}{'calls':>10}{'incl ms':>12}{'excl ms':>12}{'excl us/call':>14}"]
+    for function, (calls, inclusive, exclusive) in rows:
+        lines.append(f"{labels[function]:<{width}}{calls:>10}{inclusive / 1e6:>12.3f}{exclusive / 1e6:>12.3f}"
+                     f"{exclusive / 1e3 / max(calls, 1):>14.2f}")
+    return "\n".join(lines) + "\n"
+
+def recursion_table(depths):
+    """Each kind of recursive chain, by the edge that first closed it, with how many there were and how deep."""
+    labels = label_functions(function for edge in depths for function in edge)
+    rows = sorted(((f"{labels[caller]} -> {labels[callee]}", depth) for (caller, callee), depth in depths.items()),
+                  key=lambda row: -row[1][2])
+    width = max([len("cycle")] + [len(edge) for edge, _ in rows])
+    lines = [f"{'cycle':<{width}}{'chains':>10}{'mean depth':>12}{'max depth':>12}"]
+    for edge, (chains, frames, deepest) in rows:
+        lines.append(f"{edge:<{width}}{chains:>10}{frames / chains:>12.1f}{deepest:>12}")
+    return "\n".join(lines) + "\n"
+
+CALL_GRAPH_FORMATS = {"text": call_graph_to_text, "dot": call_graph_to_dot, "json": call_graph_to_json,
+                      "graphml": call_graph_to_graphml, "svg": call_graph_to_svg}
+FORMAT_EXTENSIONS = {".dot": "dot", ".gv": "dot", ".json": "json", ".graphml": "graphml", ".svg": "svg"}
+
+def save_call_graph(graph, path, fmt=None, **details):
+    """Writes the call graph in one of CALL_GRAPH_FORMATS; the format defaults to the file extension, else text.
+
+    JSON also takes the function_timing and edge_timing of a timing run, the context_graphs of each thread or task
+    and the recursion depths of a trace.
+    """
+    if fmt is None:
+        fmt = FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), "text")
+    with open(path, "w") as f:
+        f.write(CALL_GRAPH_FORMATS[fmt](graph, **details) if fmt == "json" else CALL_GRAPH_FORMATS[fmt](graph))
@@ -1,73 +1,883 @@
+import argparse
+import atexit
+import fnmatch
+import itertools
+import json
+import os
+import runpy
 import sys
-import networkx as nx
-import matplotlib
-import matplotlib.pyplot as plt
-from collections import defaultdict
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
 import tempfile
+from call_event_log import CALL, CallEventWriter, read_events, read_shards, shard_path, shard_paths
+from call_graph_export import (CALL_GRAPH_FORMATS, CALL_GRAPH_LEVELS, aggregate_call_graph, call_graph_to_dot,
+                               call_graph_to_graphml, call_graph_to_json, call_graph_to_svg, call_graph_to_text,
+                               collapsed_stacks, function_labels, hotspot_table, label_functions, labeled_edges,
+                               prune_call_graph, recursion_table, save_call_graph)
 
-# Ensure Matplotlib uses the TkAgg backend for visualization in VS Code
-matplotlib.use("TkAgg")
+# The call graph maps each caller to a Counter of its callees, so memory grows with the number of distinct edges and
+# not with the number of calls. Functions are identified by (filename, first line, qualified name): methods of
+# different classes, or functions of different modules, that share a name stay apart.
+call_graph = defaultdict(Counter)
+call_stack = []  # The main thread's stack; other threads and asyncio tasks each have their own TraceContext
+PROGRAM_START = ("", 0, "Program Start")
+EXCLUDED_FUNCTIONS = {"decode", "encode", "display_call_graph", "visualize_call_graph"}
 
-# Dictionary to store the call graph dynamically
-call_graph = defaultdict(list)
-call_stack = []
-MAX_DEPTH = 50  # Limit recursion depth to prevent infinite loops
+# Recursion is folded on the stack instead of growing it: calling a function that is already active turns every
+# frame from its last call up to this one, RecursionRuns among them, into a single RecursionRun. A run keeps a slot
+# number per frame, slots standing for a function, its caller and its folded stack, and counts a cycle of slots that
+# repeats instead of storing it again: f -> f -> f or a -> b -> a -> b takes constant memory at any depth, irregular
+# recursion (visit -> visit_If -> visit -> visit_Call ...) an int per frame, and the stack stays as short as the
+# distinct functions on it. Every call is still counted on its edge; recursion_depths adds, under the edge that
+# first closed each chain, [chains, total frames, deepest chain]. FOLD_RECURSION = False keeps every frame instead.
+FOLD_RECURSION = True
+recursion_depths = defaultdict(lambda: [0, 0, 0])
 
-def create_trace_calls(target_file):
-    """Creates a trace function with a bound TARGET_FILE."""
-    def trace_calls(frame, event, arg):
-        """Tracks function calls and constructs the call graph dynamically."""
-        filename = frame.f_code.co_filename
+# Timing mode (--timing, CALL_GRAPH_TIMING=1 or start_tracing(..., timing=True)) turns the tracer into a deterministic
+# profiler. Per function: [calls, inclusive ns, exclusive ns]; per edge: [inclusive ns, exclusive ns] of the callee
+# when called from that caller; per distinct call stack: exclusive ns, for flame graphs. Inclusive time of recursive
+# functions is only counted for the outermost active call, so it never exceeds the wall time.
+TIMING = os.environ.get("CALL_GRAPH_TIMING", "") not in ("", "0")
+COLLAPSED_STACKS_PATH = "call_graph.collapsed"
+timing_enabled = False
+timing_stack = []  # [start ns, ns spent in callees] for each timed entry of call_stack; see fold_recursion for runs
+function_times = defaultdict(lambda: [0, 0, 0])
+edge_times = defaultdict(lambda: [0, 0])
+stack_times = Counter()
+
+# Every thread, and every asyncio task, has its own call stack, so concurrent code never interleaves its calls into
+# wrong edges. A context's first traced function is called from "Program Start". Edges of other threads and tasks are
+# also counted per context name ("Thread-2 (worker)", "MainThread/Task-3") in context_graphs; the main thread's share
+# is what they leave of call_graph (see calls_by_context), so single-threaded programs count every call once. Once a
+# second thread records calls, graph_lock guards the state all contexts share; single-threaded programs never take it.
+MAIN_CONTEXT = "MainThread"
+context_graphs = defaultdict(lambda: defaultdict(Counter))
+graph_lock = threading.Lock()
+concurrent_threads = False
+
+class RecursionRun:
+    """A recursive chain on a call stack, depth frames deep, starting with a call of root.
+
+    slots holds the (function, caller) and keys the folded stack of each slot: the functions from root to the frame
+    with every loop cut out, so f -> g -> f -> h is folded to (f, h). path holds the slot of each frame, root's
+    first, and is followed by repeats more frames going round its last period slots again. Frames in path are
+    counted in active, per function, and in the functions and edges counts of their TraceContext (edges is None
+    when untimed); repeated frames are not, the frames they repeat keep their functions and edges active. slot and
+    function are those of the innermost frame.
+    """
+    __slots__ = ("edge", "functions", "edges", "slots", "keys", "slot_ids", "next_slots", "path", "last_seen",
+                 "period", "repeats", "active", "slot", "function", "depth", "deepest")
+
+    def __init__(self, root, edge, functions, edges=None):
+        self.edge = edge  # The call that first closed the chain
+        self.functions = functions
+        self.edges = edges
+        self.slots = [(root, None)]
+        self.keys = [(root,)]
+        self.slot_ids = {}
+        self.next_slots = {}
+        self.path = [0]
+        self.last_seen = {}
+        self.period = 0
+        self.repeats = 0
+        self.active = {root: 1}
+        self.slot = 0
+        self.function = root
+        self.depth = 1
+        self.deepest = 1
+
+    def frames(self):
+        """The slot of each frame, root's first."""
+        path, period = self.path, self.period
+        return itertools.chain(path, (path[len(path) - period + i % period] for i in range(self.repeats)))
+
+    def push(self, callee):
+        """Adds a frame calling callee; True when it is the first active frame of its function or edge."""
+        path, period = self.path, self.period
+        self.depth += 1
+        if self.depth > self.deepest:
+            self.deepest = self.depth
+        if period:
+            repeated = path[len(path) - period + self.repeats % period]
+            if self.slots[repeated][0] == callee:
+                # The cycle goes round once more; the frame it repeats has the same slot.
+                self.repeats += 1
+                self.slot, self.function = repeated, callee
+                return False
+        slot = self.next_slots.get((self.slot, callee))
+        if slot is None:
+            key = self.keys[self.slot]
+            key = key[:key.index(callee) + 1] if callee in key else key + (callee,)
+            slot = self.slot_ids.setdefault((self.function, callee, key), len(self.slots))
+            if slot == len(self.slots):
+                self.slots.append((callee, self.function))
+                self.keys.append(key)
+            self.next_slots[self.slot, callee] = slot
+        if self.repeats:
+            # Another slot breaks the cycle: the frames that went round it are stored after all.
+            block = path[-period:]
+            for frame in block * (self.repeats // period) + block[:self.repeats % period]:
+                path.append(frame)
+                self.count(*self.slots[frame], 1)
+            self.repeats = 0
+        seen = self.last_seen.get(slot)
+        self.period = len(path) - seen if seen is not None and seen < len(path) and path[seen] == slot else 0
+        self.last_seen[slot] = len(path)
+        path.append(slot)
+        caller = self.function
+        first = not self.functions[callee] or self.edges is not None and not self.edges[caller, callee]
+        self.count(callee, caller, 1)
+        self.slot, self.function = slot, callee
+        return first
+
+    def pop(self):
+        """Drops the innermost frame."""
+        self.depth -= 1
+        path = self.path
+        if self.repeats:
+            self.repeats -= 1
+        else:
+            self.count(*self.slots[path.pop()], -1)
+            self.period = 0
+        self.slot = path[len(path) - self.period + (self.repeats - 1) % self.period] if self.repeats else path[-1]
+        self.function = self.slots[self.slot][0]
+
+    def count(self, function, caller, change):
+        self.active[function] = self.active.get(function, 0) + change
+        self.functions[function] += change
+        if self.edges is not None:
+            self.edges[caller, function] += change
+
+class TraceContext:
+    """The call stack of one thread or asyncio task, with its timing stack, active call counts and call graph."""
+    __slots__ = ("task_id", "name", "graph", "call_stack", "timing_stack", "runs", "recorded", "active_functions",
+                 "active_edges")
+
+    def __init__(self, name, task_id=None, stack=None, timings=None):
+        self.task_id = task_id
+        self.name = name
+        self.graph = None if name == MAIN_CONTEXT else context_graphs[name]
+        self.call_stack = [] if stack is None else stack
+        self.timing_stack = [] if timings is None else timings
+        self.runs = 0  # RecursionRuns on call_stack
+        self.recorded = []  # Used by replay_events
+        self.active_functions = Counter()
+        self.active_edges = Counter()
+
+main_context = TraceContext(MAIN_CONTEXT, stack=call_stack, timings=timing_stack)
+thread_state = threading.local()  # .context: the TraceContext of a thread with calls in progress outside tasks
+contexts = {}  # id of a running asyncio task -> its TraceContext, while the task has calls in progress
+
+# With an event log (CALL_GRAPH_EVENT_LOG=path or start_tracing(..., event_log=path)) calls and returns are written
+# to a binary log instead of being counted in memory; call_graph_builder, or replay_events, builds graphs and timings
+# from it afterwards.
+EVENT_LOG = os.environ.get("CALL_GRAPH_EVENT_LOG")
+event_log = None
+
+# A process capture (--processes, or start_tracing(..., shard_dir=path)) also traces the Python processes the target
+# starts, each into its own event log shard (calls-<pid>.log in shard_dir). Forked children switch to a shard of their
+# own as they start; other child interpreters (spawn and forkserver multiprocessing workers, Python subprocesses)
+# find PROCESS_BOOTSTRAP/sitecustomize.py on their PYTHONPATH, which starts tracing them with the settings in
+# PROCESS_CAPTURE_VARIABLE. Children write out their shard whenever their stack empties, so a worker that is
+# terminated between tasks loses nothing. read_shards merges the shards, naming contexts after their process.
+PROCESS_BOOTSTRAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "process_bootstrap")
+PROCESS_CAPTURE_VARIABLE = "CALL_GRAPH_PROCESS_CAPTURE"
+PROCESS_SHARDS_DIR = "call_graph_shards"
+process_capture = None  # The settings of the capture this process is part of
+flush_when_idle = False
+fork_hooks_registered = False
+
+# monitoring: sys.monitoring (PEP 669, Python 3.12+) with events switched off for code outside the target.
+# settrace: a sys.settrace function called for every frame event. auto picks monitoring when it is available.
+# Choose one with --backend, or CALL_GRAPH_BACKEND for the default.
+TRACER_BACKENDS = ("auto", "monitoring", "settrace")
+TRACER_BACKEND = os.environ.get("CALL_GRAPH_BACKEND", "auto")
+
+def is_traced(code, target_file, include=(), exclude=()):
+    """Only functions inside the user script are traced; system, dunder and helper functions are not.
+
+    include and exclude are glob patterns matched against the full filename ("*/myapp/*", "*/site-packages/*"):
+    files matching an include pattern are traced as well, files matching an exclude pattern never are.
+    """
+    callee = code.co_name
+    if callee.startswith("__") or callee in EXCLUDED_FUNCTIONS:
+        return False
+    filename = code.co_filename
+    if matches_any(filename, exclude):
+        return False
+    return target_file in filename or matches_any(filename, include)
+
+def matches_any(filename, patterns):
+    return any(fnmatch.fnmatchcase(filename, pattern) for pattern in patterns)
+
+def create_function_filter(target_file, include=(), exclude=()):
+    """Returns traced_function(code): the function id of a traced code object, or None, decided once per code object.
+
+    Code objects compare by content and not by filename, so decisions are keyed by id(code); each entry keeps its
+    code object alive, which stops the id from being reused while the decision is cached.
+    """
+    decisions = {}
+
+    def traced_function(code):
+        try:
+            return decisions[id(code)][1]
+        except KeyError:
+            callee = function_id(code) if is_traced(code, target_file, include, exclude) else None
+            decisions[id(code)] = (code, callee)
+            return callee
+
+    return traced_function
+
+def function_id(code):
+    return (code.co_filename, code.co_firstlineno, getattr(code, "co_qualname", code.co_name))
+
+def current_context():
+    """The TraceContext of the running thread, or of its running asyncio task."""
+    global concurrent_threads
+    # asyncio is only looked at once the target has imported it.
+    asyncio = sys.modules.get("asyncio")
+    loop = asyncio._get_running_loop() if asyncio is not None else None
+    task = asyncio.current_task(loop) if loop is not None else None
+    if task is None:
+        context = getattr(thread_state, "context", None)
+        if context is None:
+            thread = threading.current_thread()
+            if thread is threading.main_thread():
+                context = main_context
+            else:
+                context = TraceContext(thread.name)
+                concurrent_threads = True
+            thread_state.context = context
+        return context
+    context = contexts.get(id(task))
+    if context is None:
+        context = contexts[id(task)] = TraceContext(f"{threading.current_thread().name}/{task.get_name()}", id(task))
+    return context
 
-        # Only trace functions inside the user script; ignore system functions.
-        if target_file not in filename:
+def enter_function(callee, context=None, now=None):
+    """Records a call from the function on top of the stack, folding it into a RecursionRun when it recurses.
+
+    now is the time of the call in ns when replaying a log; live calls are timed as they happen.
+    """
+    context = context or current_context()
+    stack = context.call_stack
+    caller = stack[-1] if stack else PROGRAM_START
+    run = caller if type(caller) is RecursionRun else None
+    if run is not None:
+        caller = run.function
+
+    if event_log is not None:
+        if concurrent_threads:
+            with graph_lock:
+                event_log.call(context.name, callee)
+        else:
+            event_log.call(context.name, callee)
+    else:
+        # Count call relationships.
+        if concurrent_threads:
+            with graph_lock:
+                call_graph[caller][callee] += 1
+        else:
+            call_graph[caller][callee] += 1
+        if context.graph is not None:
+            context.graph[caller][callee] += 1
+    timed = timing_enabled and event_log is None
+    if timed:
+        now = time.perf_counter_ns() if now is None else now
+
+    if run is not None and run.active.get(callee):
+        # The chain goes one frame deeper.
+        if timed:
+            timings = context.timing_stack[-1]
+            timings[3][run.slot] += now - timings[0] - timings[1]
+            timings[0], timings[1] = now, 0
+            if run.push(callee):
+                timings[2][run.depth - 1] = now
+        else:
+            run.push(callee)
+    else:
+        active = context.active_functions[callee]
+        if active and FOLD_RECURSION and fold_recursion(context, callee, caller, now if timed else None):
             return
+        context.active_functions[callee] = active + 1
+        stack.append(callee)
+        if timed:
+            context.active_edges[caller, callee] += 1
+            context.timing_stack.append([now, 0])
 
-        if event == "call":
-            caller = call_stack[-1] if call_stack else "Program Start"
-            callee = frame.f_code.co_name
+def fold_recursion(context, callee, caller, now=None):
+    """Folds the frames from the last call of callee to the top of the stack, and this call, into a RecursionRun.
+
+    RecursionRuns among the frames are taken apart into the run that holds that call, or that starts with it. Returns
+    False, leaving the stack as it is, when callee is not on it. When timed (now is not None), the exclusive time the
+    folded frames have had so far is charged right away, and the run gets a single timing entry: [ns of its last call
+    or return, ns spent in callees since then, start ns of the frames that are the outermost active call of their
+    function or edge, exclusive ns and returns per slot]. Frames with the same slot share their function, incoming
+    edge and folded stack, so their time is added up there and charged once the chain returns to its first frame.
+    """
+    stack = context.call_stack
+    for back in range(1, len(stack) + 1):
+        frame = stack[-back]
+        if frame == callee or type(frame) is RecursionRun and frame.active.get(callee):
+            break
+    else:
+        return False
+
+    frames = stack[-back:]
+    run = frames[0]
+    if type(run) is not RecursionRun:
+        run = RecursionRun(run, (caller, callee), context.active_functions,
+                           None if now is None else context.active_edges)
+        context.runs += 1
+    if now is not None:
+        timings = context.timing_stack[-back:]
+        ends = [timing[0] if type(frame) is tuple else timing[2][0] for frame, timing in zip(frames[1:], timings[1:])]
+        ends.append(now)
+        key = stack_key(stack[:-back])
+        timing = timings[0]
+        if run is frames[0]:
+            timing[3][run.slot] += ends[0] - timing[0] - timing[1]
+            key += run.keys[run.slot]
+        else:
+            below = stack[-back - 1] if len(stack) > back else PROGRAM_START
+            key += (frames[0],)
+            charge_own(below.function if type(below) is RecursionRun else below, frames[0],
+                       ends[0] - timing[0] - timing[1], key)
+            timing = [now, 0, {0: timing[0]}, Counter(), Counter()]
+    for index, frame in enumerate(frames[1:], 1):
+        if type(frame) is RecursionRun:
+            if now is not None:
+                last, in_callees, starts, owns, returns = timings[index]
+                owns[frame.slot] += ends[index] - last - in_callees
+                if concurrent_threads:
+                    with graph_lock:
+                        charge_recursion(frame, owns, returns, key)
+                else:
+                    charge_recursion(frame, owns, returns, key)
+                key += frame.keys[frame.slot]
+            for depth, slot in enumerate(frame.path):
+                function, caller = frame.slots[slot]
+                uncount(context, caller if depth else run.function, function, now is not None)
+            for depth, slot in enumerate(frame.frames()):
+                if run.push(frame.slots[slot][0]) and now is not None:
+                    timing[2][run.depth - 1] = starts[depth]
+            context.runs -= 1
+        else:
+            if now is not None:
+                start, in_callees = timings[index]
+                key += (frame,)
+                charge_own(run.function, frame, ends[index] - start - in_callees, key)
+            uncount(context, run.function, frame, now is not None)
+            if run.push(frame) and now is not None:
+                timing[2][run.depth - 1] = start
+    if run.push(callee) and now is not None:
+        timing[2][run.depth - 1] = now
+    stack[-back:] = [run]
+    if now is not None:
+        timing[0], timing[1] = now, 0
+        context.timing_stack[-back:] = [timing]
+    return True
+
+def uncount(context, caller, callee, timed):
+    """Stops counting a frame as active in its context, as it goes into a RecursionRun that counts it again."""
+    context.active_functions[callee] -= 1
+    if timed:
+        context.active_edges[caller, callee] -= 1
+
+def leave_function(context=None, now=None):
+    context = context or current_context()
+    stack = context.call_stack
+    if not stack:
+        return
+    if event_log is not None:
+        if concurrent_threads:
+            with graph_lock:
+                event_log.ret(context.name)
+        else:
+            event_log.ret(context.name)
+    top = stack[-1]
+    if type(top) is RecursionRun:
+        frame, slot = top.depth - 1, top.slot
+        top.pop()
+        if timing_enabled and event_log is None and context.timing_stack:
+            record_recursive_time(context, top, frame, slot, now)
+        if top.depth == 1:
+            # Back to the chain's first frame: it is a plain frame again.
+            stack[-1] = top.slots[0][0]
+            context.runs -= 1
+            if event_log is None:
+                record_recursion(top)
+        return
+
+    context.active_functions[top] -= 1
+    if timing_enabled and event_log is None and context.timing_stack:
+        record_time(context, now)
+    stack.pop()
+    if not stack:
+        # A thread or task that returned to untraced code forgets its context; the main thread keeps it.
+        if context is not main_context:
+            if context.task_id is None:
+                thread_state.context = None
+            else:
+                contexts.pop(context.task_id, None)
+        if flush_when_idle and event_log is not None:
+            with graph_lock:
+                event_log.flush()
+
+def record_time(context=None, now=None):
+    """Charges the time since the top of the stack was entered to its function, its incoming edge and its stack."""
+    context = context or current_context()
+    end = time.perf_counter_ns() if now is None else now
+    stack, timings = context.call_stack, context.timing_stack
+    start, in_callees = timings.pop()
+    elapsed = end - start
+    own = elapsed - in_callees
+    if timings:
+        timings[-1][1] += elapsed
+
+    callee = stack[-1]
+    caller = stack[-2] if len(stack) > 1 else PROGRAM_START
+    if type(caller) is RecursionRun:
+        caller = caller.function
+    context.active_edges[caller, callee] -= 1
+    key = stack_key(stack) if context.runs else tuple(stack)
+    if concurrent_threads:
+        with graph_lock:
+            charge_time(context, caller, callee, elapsed, own, key)
+    else:
+        charge_time(context, caller, callee, elapsed, own, key)
+
+def record_recursive_time(context, run, frame, slot, now=None):
+    """Times a frame of a RecursionRun that has just returned, given its index and slot, like record_time does.
+
+    Its inclusive time is only needed when it was the outermost active call of its function or edge, so the start
+    times of those frames are all the run keeps.
+    """
+    end = time.perf_counter_ns() if now is None else now
+    timings = context.timing_stack[-1]
+    last, in_callees, starts, owns, returns = timings
+    callee, caller = run.slots[slot]
+    owns[slot] += end - last - in_callees
+    returns[slot] += 1
+    timings[0], timings[1] = end, 0
+    start = starts.pop(frame, None)
+    if start is not None and (not context.active_functions[callee] or not context.active_edges[caller, callee]):
+        if concurrent_threads:
+            with graph_lock:
+                charge_inclusive(context, caller, callee, end - start)
+        else:
+            charge_inclusive(context, caller, callee, end - start)
+    if frame == 1:
+        # The chain is back to its first frame, which is timed as a plain frame from now on.
+        below = stack_key(context.call_stack[:-1])
+        if concurrent_threads:
+            with graph_lock:
+                charge_recursion(run, owns, returns, below)
+        else:
+            charge_recursion(run, owns, returns, below)
+        context.timing_stack[-1] = [starts[0], end - starts[0]]
 
-            # Exclude built-in and unwanted functions.
-            if callee.startswith("__") or callee in {"decode", "encode", "display_call_graph", "visualize_call_graph"}:
-                return
+def charge_time(context, caller, callee, elapsed, own, stack):
+    times = function_times[callee]
+    times[0] += 1
+    times[2] += own
+    if not context.active_functions[callee]:
+        times[1] += elapsed
+    edge = edge_times[caller, callee]
+    edge[1] += own
+    if not context.active_edges[caller, callee]:
+        edge[0] += elapsed
+    stack_times[stack] += own
 
-            # Prevent infinite recursion.
-            if len(call_stack) >= MAX_DEPTH:
-                print(f"Maximum recursion depth ({MAX_DEPTH}) reached. Possible infinite loop in {callee}.")
-                return
+def charge_own(caller, callee, own, stack):
+    """Charges exclusive time to a frame that is folded into a RecursionRun."""
+    if concurrent_threads:
+        with graph_lock:
+            add_own_time(caller, callee, own, stack)
+    else:
+        add_own_time(caller, callee, own, stack)
 
-            # Store call relationships (preserving duplicates).
-            call_graph[caller].append(callee)
-            call_stack.append(callee)
+def add_own_time(caller, callee, own, stack):
+    function_times[callee][2] += own
+    edge_times[caller, callee][1] += own
+    stack_times[stack] += own
+
+def charge_inclusive(context, caller, callee, elapsed):
+    if not context.active_functions[callee]:
+        function_times[callee][1] += elapsed
+    if not context.active_edges[caller, callee]:
+        edge_times[caller, callee][0] += elapsed
+
+def charge_recursion(run, owns, returns, below):
+    """Charges the exclusive time and returns of a chain added up per slot; below is the folded stack under it."""
+    for slot, own in owns.items():
+        callee, caller = run.slots[slot]
+        add_own_time(caller, callee, own, below + run.keys[slot])
+    for slot, count in returns.items():
+        function_times[run.slots[slot][0]][0] += count
+
+def record_recursion(run):
+    """Adds a finished chain to recursion_depths, under the edge that first closed it."""
+    if concurrent_threads:
+        with graph_lock:
+            add_recursion(run)
+    else:
+        add_recursion(run)
+
+def add_recursion(run):
+    depths = recursion_depths[run.edge]
+    depths[0] += 1
+    depths[1] += run.deepest
+    depths[2] = max(depths[2], run.deepest)
+
+def stack_key(stack):
+    """The functions on a call stack, with each RecursionRun as the folded stack of its current frame."""
+    key = []
+    for frame in stack:
+        if type(frame) is RecursionRun:
+            key.extend(frame.keys[frame.slot])
+        else:
+            key.append(frame)
+    return tuple(key)
+
+def reset_call_graph():
+    """Forgets every recorded call, edge, timing and context."""
+    global concurrent_threads
+    for state in (call_graph, function_times, edge_times, stack_times, recursion_depths, context_graphs, contexts,
+                  main_context.active_functions, main_context.active_edges):
+        state.clear()
+    del call_stack[:]
+    del timing_stack[:]
+    del main_context.recorded[:]
+    main_context.runs = 0
+    thread_state.context = None
+    concurrent_threads = False
+
+def replay_events(events, include=(), exclude=(), context_names=None):
+    """Rebuilds call_graph, the per-context graphs and the timings from (kind, context, function, ns) log events.
+
+    Functions in files matching an exclude pattern, or none of the include patterns when there are some, are left
+    out and their callees are attached to the nearest caller that was kept. context_names keeps only those threads
+    and tasks. Whether each running frame was kept is run-length encoded, so deep recursion replays in as
+    little memory as it is traced in.
+    """
+    global timing_enabled
+    reset_call_graph()
+    timing_enabled = True
+    kept = {}
+    replayed = {}
+    for kind, name, function, now in events:
+        if context_names and name not in context_names:
+            continue
+        context = replayed.get(name)
+        if context is None:
+            context = replayed[name] = main_context if name == MAIN_CONTEXT else TraceContext(name)
+        if kind == CALL:
+            keep = kept.get(function)
+            if keep is None:
+                filename = function[0]
+                keep = kept[function] = (not matches_any(filename, exclude) and
+                                         (not include or matches_any(filename, include)))
+            if keep:
+                enter_function(function, context, now)
+            recorded = context.recorded
+            if recorded and recorded[-1][0] == keep:
+                recorded[-1][1] += 1
+            else:
+                recorded.append([keep, 1])
+        elif context.recorded:
+            keep, frames = context.recorded[-1]
+            if frames == 1:
+                context.recorded.pop()
+            else:
+                context.recorded[-1][1] -= 1
+            if keep:
+                leave_function(context, now)
+
+def calls_by_context():
+    """The call graph of each thread and asyncio task, keyed by context name."""
+    graphs = {}
+    main = defaultdict(Counter)
+    for caller, callees in call_graph.items():
+        own = Counter(callees)
+        for graph in context_graphs.values():
+            if caller in graph:
+                own.subtract(graph[caller])
+        own = +own
+        if own:
+            main[caller] = own
+    if main:
+        graphs[MAIN_CONTEXT] = main
+    graphs.update((name, graph) for name, graph in context_graphs.items() if graph)
+    return graphs
+
+def create_trace_calls(target_file, include=(), exclude=()):
+    """Creates a trace function with a bound TARGET_FILE."""
+    traced_function = create_function_filter(target_file, include, exclude)
+
+    def trace_calls(frame, event, arg):
+        """Tracks function calls and constructs the call graph dynamically."""
+        if event == "call":
+            # Only trace functions inside the user script; system, built-in and unwanted functions get no local
+            # trace function, so none of their other events are delivered.
+            callee = traced_function(frame.f_code)
+            if callee is None:
+                return None
+            enter_function(callee)
+            # Only the return of a traced frame matters, not its lines.
+            frame.f_trace_lines = False
 
         elif event == "return":
-            if call_stack:
-                call_stack.pop()
+            leave_function()
 
         return trace_calls
-    
+
     return trace_calls
 
+class MonitoringTracer:
+    """Builds the same call graph as create_trace_calls through sys.monitoring instead of sys.settrace.
+
+    Only function starts, resumptions, returns and yields are watched. The first event from a code object outside
+    the target (or one that is excluded) returns DISABLE, so the interpreter stops reporting that code object and
+    it runs at full speed from then on. Exceptions unwinding a frame and generator throws are not per-code-object
+    events and cannot be disabled, but they are rare. Monitoring covers every thread, including threads that were
+    already running when tracing started.
+    """
+    LOCAL_EVENTS = ("PY_START", "PY_RESUME", "PY_RETURN", "PY_YIELD")
+    TOOL_IDS = (2, 3, 4)  # PROFILER_ID first, then the ids CPython leaves unassigned
+    # Code objects an earlier run disabled. DISABLE outlives the tool id, so the next run re-arms these itself
+    # rather than calling restart_events, which would also undo every other tool's DISABLEs.
+    disabled_code = weakref.WeakSet()
+
+    def __init__(self, target_file, include=(), exclude=()):
+        self.target_file = target_file
+        self.traced_function = create_function_filter(target_file, include, exclude)
+        self.tool_id = None
+
+    def start(self):
+        monitoring = sys.monitoring
+        for tool_id in self.TOOL_IDS:
+            try:
+                monitoring.use_tool_id(tool_id, "call-graph")
+            except ValueError:
+                continue
+            self.tool_id = tool_id
+            break
+        else:
+            raise RuntimeError("Every sys.monitoring tool id the call graph can use is taken")
+
+        events = monitoring.events
+        for event, callback in ((events.PY_START, self.on_start), (events.PY_RESUME, self.on_start),
+                                (events.PY_THROW, self.on_throw), (events.PY_RETURN, self.on_return),
+                                (events.PY_YIELD, self.on_return), (events.PY_UNWIND, self.on_unwind)):
+            monitoring.register_callback(self.tool_id, event, callback)
+        # Code objects disabled by an earlier run (for another target) must report again. Changing a code object's
+        # local events re-instruments it, which drops the DISABLE.
+        local_events = 0
+        for event in self.LOCAL_EVENTS:
+            local_events |= getattr(events, event)
+        for code in list(MonitoringTracer.disabled_code):
+            monitoring.set_local_events(self.tool_id, code, local_events)
+            monitoring.set_local_events(self.tool_id, code, events.NO_EVENTS)
+        MonitoringTracer.disabled_code.clear()
+        monitoring.set_events(self.tool_id, events.PY_START | events.PY_RESUME | events.PY_RETURN | events.PY_YIELD |
+                              events.PY_THROW | events.PY_UNWIND)
+
+    def stop(self):
+        if self.tool_id is None:
+            return
+        monitoring = sys.monitoring
+        monitoring.set_events(self.tool_id, monitoring.events.NO_EVENTS)
+        for event in (monitoring.events.PY_START, monitoring.events.PY_RESUME, monitoring.events.PY_THROW,
+                      monitoring.events.PY_RETURN, monitoring.events.PY_YIELD, monitoring.events.PY_UNWIND):
+            monitoring.register_callback(self.tool_id, event, None)
+        monitoring.free_tool_id(self.tool_id)
+        self.tool_id = None
+
+    def on_start(self, code, instruction_offset):
+        callee = self.traced_function(code)
+        if callee is None:
+            self.disabled_code.add(code)
+            return sys.monitoring.DISABLE
+        self.enter(callee)
+
+    def on_return(self, code, instruction_offset, retval):
+        if self.traced_function(code) is None:
+            self.disabled_code.add(code)
+            return sys.monitoring.DISABLE
+        self.leave()
+
+    def on_throw(self, code, instruction_offset, exception):
+        callee = self.traced_function(code)
+        if callee is not None:
+            self.enter(callee)
+
+    def on_unwind(self, code, instruction_offset, exception):
+        if self.traced_function(code) is not None:
+            self.leave()
+
+    def enter(self, callee):
+        enter_function(callee, current_context())
+
+    def leave(self):
+        # Frames that were already running when tracing started return once the stack is empty, and are ignored.
+        leave_function(current_context())
+
+def start_tracing(target_file, backend=None, timing=None, include=(), exclude=(), event_log=None, shard_dir=None):
+    """Starts building the call graph of target_file (timing calls if asked) and returns a function that stops it.
+
+    include and exclude are filename glob patterns that widen or narrow what is traced, as in is_traced. With an
+    event_log path, calls are written to that log instead of the in-memory graph; stopping closes the log. With a
+    shard_dir, the Python processes the target starts are traced too, each into its own log in that directory.
+    """
+    global timing_enabled
+    if shard_dir:
+        return start_process_capture(target_file, shard_dir, backend, include, exclude)
+    timing_enabled = TIMING if timing is None else timing
+    log_path = event_log or EVENT_LOG
+    if not log_path:
+        return start_tracer(target_file, backend, include, exclude)
+
+    open_event_log(log_path)
+    try:
+        stop = start_tracer(target_file, backend, include, exclude)
+    except Exception:
+        close_event_log()
+        raise
+
+    def stop_tracing():
+        stop()
+        close_event_log()
+    return stop_tracing
+
+def start_process_capture(target_file, shard_dir, backend=None, include=(), exclude=()):
+    """Traces this process and every Python process it starts into shards in shard_dir, replacing earlier shards."""
+    shard_dir = os.path.abspath(shard_dir)
+    os.makedirs(shard_dir, exist_ok=True)
+    for path in shard_paths(shard_dir):
+        os.remove(path)
+    capture = {"target_file": target_file, "shard_dir": shard_dir, "backend": backend, "include": list(include),
+               "exclude": list(exclude)}
+    saved = {name: os.environ.get(name) for name in (PROCESS_CAPTURE_VARIABLE, "PYTHONPATH")}
+    os.environ[PROCESS_CAPTURE_VARIABLE] = json.dumps(capture)
+    os.environ["PYTHONPATH"] = os.pathsep.join([PROCESS_BOOTSTRAP] + [saved["PYTHONPATH"]] * bool(saved["PYTHONPATH"]))
+    stop = trace_process(capture)
+
+    def stop_capture():
+        global process_capture
+        stop()
+        process_capture = None
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return stop_capture
+
+def trace_process(capture, child=False):
+    """Traces this process into its own shard of a process capture and returns the function that stops it."""
+    global process_capture, flush_when_idle
+    process_capture = capture
+    flush_when_idle = child
+    register_fork_hooks()
+    return start_tracing(capture["target_file"], capture["backend"], include=capture["include"],
+                         exclude=capture["exclude"], event_log=shard_path(capture["shard_dir"], os.getpid()))
+
+def trace_child_process():
+    """Called by the process bootstrap as a child interpreter of a process capture starts; it is traced until exit."""
+    trace_process(json.loads(os.environ[PROCESS_CAPTURE_VARIABLE]), child=True)
+
+def trace_forked_child():
+    """Moves a child forked during a process capture to its own shard, leaving the parent's calls to the parent."""
+    global event_log, flush_when_idle
+    if process_capture is None or event_log is None:
+        return
+    event_log = None  # Its buffer holds calls the parent will write out
+    reset_call_graph()
+    flush_when_idle = True
+    open_event_log(shard_path(process_capture["shard_dir"], os.getpid()))
+
+def register_fork_hooks():
+    global fork_hooks_registered
+    if fork_hooks_registered:
+        return
+    fork_hooks_registered = True
+    atexit.register(close_event_log)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=trace_forked_child)
+    # Forked multiprocessing workers leave through os._exit, skipping atexit, but they run their finalizers.
+    from multiprocessing import util
+    util.register_after_fork(close_event_log, close_at_worker_exit)
+
+def close_at_worker_exit(close):
+    from multiprocessing import util
+    util.Finalize(None, close, exitpriority=-100)
+
+def open_event_log(path):
+    global event_log
+    close_event_log()
+    event_log = CallEventWriter(path)
+
+def close_event_log():
+    """Writes out and closes the event log, if one is open; returns the number of events it holds."""
+    global event_log
+    if event_log is None:
+        return 0
+    log, event_log = event_log, None
+    log.close()
+    return log.events
+
+def start_tracer(target_file, backend, include, exclude):
+    backend = backend or TRACER_BACKEND
+    if backend not in TRACER_BACKENDS:
+        raise ValueError(f"Unknown tracer backend '{backend}'. Choose from: {', '.join(TRACER_BACKENDS)}")
+    if backend == "auto":
+        backend = "monitoring" if hasattr(sys, "monitoring") else "settrace"
+
+    if backend == "monitoring":
+        if not hasattr(sys, "monitoring"):
+            raise RuntimeError("The monitoring backend requires Python 3.12 or newer")
+        tracer = MonitoringTracer(target_file, include, exclude)
+        tracer.start()
+        return tracer.stop
+
+    trace_calls = create_trace_calls(target_file, include, exclude)
+    if hasattr(threading, "settrace_all_threads"):
+        threading.settrace_all_threads(trace_calls)
+        return lambda: threading.settrace_all_threads(None)
+
+    # Before Python 3.12, threads that are already running are not traced; threads started while tracing are.
+    threading.settrace(trace_calls)
+    sys.settrace(trace_calls)
+
+    def stop_tracing():
+        threading.settrace(None)
+        sys.settrace(None)
+    return stop_tracing
+
 def display_call_graph(graph):
     """Displays the function call graph in text format."""
     print("\nTrace-Based Call Graph:")
-    for caller, callees in graph.items():
-        if caller == "<module>":
-            continue
-        for callee in callees:
-            if callee != "<module>":
-                print(f"  {caller} -> {callee}")
+    print(call_graph_to_text(graph), end="")
 
 def visualize_call_graph(graph):
-    """Generates and displays a function call graph using Graphviz for automatic centering."""
+    """Generates and displays a function call graph using Graphviz for automatic centering.
+
+    Needs networkx, pygraphviz and a display; headless runs write the graph with save_call_graph instead.
+    """
+    import networkx as nx
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    # Ensure Matplotlib uses the TkAgg backend for visualization in VS Code
+    matplotlib.use("TkAgg")
+
     G = nx.DiGraph()
 
-    for caller, callees in graph.items():
-        if caller == "<module>":
-            continue
-        for callee in callees:
-            if callee != "<module>":
-                G.add_edge(caller, callee)
+    for caller, callee, calls in labeled_edges(graph, skip_module=True):
+        G.add_edge(caller, callee, label=str(calls), weight=calls)
 
     if "Program Start" in G.nodes:
         G.remove_node("Program Start")
@@ -86,34 +896,117 @@ def visualize_call_graph(graph):
     plt.title("Program Call Graph", fontsize=15, fontweight="bold", pad=30)
     plt.show()
 
-def run_program(target_script):
-    """Runs the target script with tracing enabled and generates the call graph."""
-    trace_function = create_trace_calls(target_script)
-    sys.settrace(trace_function)
+def run_program(target_script, backend=None, include=(), exclude=(), event_log=None, shard_dir=None, timing=None):
+    """Runs the target script with tracing enabled and generates the call graph.
+
+    Event logs and process shards are always timed when they are replayed, so timing only matters for in-memory runs.
+
+    With a shard_dir the script runs as __main__ from its full path, like the workers multiprocessing starts by
+    importing it again, so the functions of every process are the same.
+    """
+    if shard_dir:
+        stop_tracing = start_tracing(target_script, backend, include=include, exclude=exclude, shard_dir=shard_dir)
+        try:
+            runpy.run_path(os.path.abspath(target_script), run_name="__main__")
+        finally:
+            stop_tracing()
+        return
+
     with open(target_script) as f:
         code = compile(f.read(), target_script, 'exec')
+    stop_tracing = start_tracing(target_script, backend, timing, include=include, exclude=exclude, event_log=event_log)
+    try:
         exec(code, {})
+    finally:
+        stop_tracing()
+
+def add_export_arguments(parser):
+    """The output options shared by this command and call_graph_builder."""
+    parser.add_argument("--output", help="Write the graph here instead of opening a window; .dot, .json, .graphml "
+                                         "and .svg select those formats, anything else is text")
+    parser.add_argument("--format", choices=sorted(CALL_GRAPH_FORMATS), help="Override the format implied by --output")
+    parser.add_argument("--level", choices=CALL_GRAPH_LEVELS, default="function",
+                        help="Merge functions into their class or module before exporting")
+    parser.add_argument("--top", type=int, help="Keep only this many edges, those with the most calls")
+    parser.add_argument("--no-window", action="store_true", help="Do not open the graph window")
+
+def parse_args(argv=None):
+    """Parses the command line; the two positional arguments are accepted for compatibility and ignored."""
+    parser = argparse.ArgumentParser(description="Trace test_code.py and build its call graph.")
+    parser.add_argument("input_file", nargs="?")
+    parser.add_argument("output_file", nargs="?")
+    add_export_arguments(parser)
+    parser.add_argument("--backend", choices=TRACER_BACKENDS, default=TRACER_BACKEND,
+                        help="How calls are traced: sys.monitoring (Python 3.12+), sys.settrace, or auto to pick "
+                             "monitoring where it is available")
+    parser.add_argument("--timing", action="store_true", default=TIMING,
+                        help="Time every call: hotspots, flame graph stacks and timed exports (CALL_GRAPH_TIMING=1)")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="Also trace files matching this pattern, e.g. '*/myapp/*' (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Never trace files matching this pattern, e.g. '*/myapp/vendor/*' (repeatable)")
+    parser.add_argument("--event-log", default=EVENT_LOG, metavar="PATH",
+                        help="Stream calls to this binary log and build the graph from it afterwards")
+    parser.add_argument("--processes", nargs="?", const=PROCESS_SHARDS_DIR, metavar="DIR",
+                        help="Also trace the Python processes the program starts, each into its own event log in "
+                             f"DIR (default: {PROCESS_SHARDS_DIR}), and merge them into one graph")
+    args = parser.parse_args(argv)
+    if args.processes and args.event_log:
+        parser.error("--processes writes one event log per process; it cannot be combined with --event-log")
+    return args
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python script.py <input_file> <output_file>")
+def report(args, collapsed_path=COLLAPSED_STACKS_PATH):
+    """Displays the recorded call graph and hotspots, then writes or shows the graph as the command line asks."""
+    # Display the call graph in text format.
+    display_call_graph(call_graph)
+    if recursion_depths:
+        print("\nRecursion (frames per chain):")
+        print(recursion_table(recursion_depths), end="")
+    graphs_by_context = calls_by_context()
+    if len(graphs_by_context) > 1:
+        for name, graph in sorted(graphs_by_context.items()):
+            print(f"\nCalls in {name}:")
+            print(call_graph_to_text(graph), end="")
+
+    if timing_enabled:
+        print("\nHotspots (exclusive time):")
+        print(hotspot_table(function_times), end="")
+        with open(collapsed_path, "w") as f:
+            f.write(collapsed_stacks(stack_times))
+        print(f"Collapsed stacks for flame graphs written to {collapsed_path}")
 
-    # The two system arguments are ignored here for compatibility
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    graph = prune_call_graph(aggregate_call_graph(call_graph, args.level), args.top)
+    if args.output:
+        # Timings and contexts are per function, so they are only exported with function-level graphs.
+        details = {}
+        if args.level == "function":
+            details.update(context_graphs=graphs_by_context, recursion=recursion_depths)
+            if timing_enabled and args.top is None:
+                details.update(function_timing=function_times, edge_timing=edge_times)
+        save_call_graph(graph, args.output, args.format, **details)
+        print(f"Call graph written to {args.output}")
+    elif not args.no_window:
+        # Visualize the call graph.
+        visualize_call_graph(graph)
 
+def main(argv=None):
+    args = parse_args(argv)
 
     # Target Python file to analyze.
     target_file = "test_code.py"
 
     # Run the program to generate the trace-based call graph.
-    run_program(target_file)
-
-    # Display the call graph in text format.
-    display_call_graph(call_graph)
+    run_program(target_file, args.backend, include=args.include, exclude=args.exclude, event_log=args.event_log,
+                shard_dir=args.processes, timing=args.timing)
+    if args.processes:
+        shards = shard_paths(args.processes)
+        print(f"Call events of {len(shards)} processes written to {args.processes}")
+        replay_events(read_shards(shards))
+    elif args.event_log:
+        print(f"Call events written to {args.event_log} ({os.path.getsize(args.event_log)} bytes)")
+        replay_events(read_events(args.event_log))
 
-    # Visualize the call graph.
-    visualize_call_graph(call_graph)
+    report(args)
 
     print("Call graph generation complete!")
 
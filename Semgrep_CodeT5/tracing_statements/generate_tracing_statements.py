@@ -1,90 +1,50 @@
-import re
-from transformers import AutoModel, AutoTokenizer
+import argparse
+import filecmp
+import fnmatch
 import os
-import subprocess
+import shutil
 import sys
-
-checkpoint = "Salesforce/codet5p-220m-bimodal"
-device = "cpu"
-
-tokenizer = AutoTokenizer.from_pretrained(checkpoint, trust_remote_code=True)
-model = AutoModel.from_pretrained(checkpoint, trust_remote_code=True).to(device)
-
-def install_semgrep():
-    """Install Semgrep using pip if it is not already installed."""
-    print("Semgrep is not installed. Installing Semgrep...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "semgrep"])
-    print("Semgrep installed successfully.")
-
-def get_semgrep_path():
-    """Get the path to the Semgrep executable."""
-    scripts_dir = os.path.join(os.path.dirname(sys.executable), "Scripts")
-    semgrep_path = os.path.join(scripts_dir, "semgrep.exe")
-    return semgrep_path if os.path.isfile(semgrep_path) else "semgrep"
-
-def run_semgrep(rule_file, target_file):
-    """Run Semgrep with the specified rule file on the given Python file and return the raw output."""
-    semgrep_path = get_semgrep_path()
-
-    try:
-        subprocess.run([semgrep_path, "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except FileNotFoundError:
-        install_semgrep()
-        semgrep_path = get_semgrep_path()
-    except subprocess.CalledProcessError:
-        print("Warning: Semgrep version check failed. Attempting to run Semgrep anyway.")
-
-    if not os.path.isfile(rule_file) or not os.path.isfile(target_file):
-        print(f"Error: Missing files: rule_file='{rule_file}', target_file='{target_file}'")
-        return ""
-
-    print(f"Running Semgrep on {target_file}")
-    result = subprocess.run(
-        [semgrep_path, "--config", rule_file, target_file],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-    )
-
-    return result.stdout
-
-def extract_first_last_line_numbers(semgrep_output):
-    """Extracts first and last line numbers from the Semgrep output, including support for nested blocks."""
-    blocks = []
-    current_stack = []
-    in_block = False
-
-    for line in semgrep_output.splitlines():
-        if "Semgrep found" in line:
-            if current_stack:
-                first_line_number, last_line_number = current_stack.pop()
-                if first_line_number and last_line_number:
-                    blocks.append((first_line_number, last_line_number))
-            current_stack.clear()
-            in_block = True
-
-        elif "┆----------------------------------------" in line:
-            if current_stack:
-                first_line_number, last_line_number = current_stack.pop()
-                if first_line_number and last_line_number:
-                    blocks.append((first_line_number, last_line_number))
-            in_block = False
-
-        elif in_block and re.match(r"^(\d+)┆", line.strip()):
-            match = re.match(r"^(\d+)┆", line.strip())
-            if match:
-                line_number = int(match.group(1))
-
-                if not current_stack:
-                    current_stack.append((line_number, line_number))
-                else:
-                    first_line_number, last_line_number = current_stack[-1]
-                    current_stack[-1] = (first_line_number, line_number)
-
-    if current_stack:
-        first_line_number, last_line_number = current_stack.pop()
-        if first_line_number and last_line_number:
-            blocks.append((first_line_number, last_line_number))
-
-    return blocks
+import time
+from block_locator import (LOCATORS, DEFAULT_RULE_FILE, get_block_locator, find_python_files, locate_function_blocks,
+                           install_semgrep, get_semgrep_path, run_semgrep, extract_first_last_line_numbers,
+                           enclosing_blocks)
+from source_rewriter import condense_block, instrument_source
+from static_call_graph import module_name
+from instrumentation_manifest import Manifest, function_hash, function_names, manifest_path
+from generation_policy import GenerationPolicy, GenerationStats, token_counts
+from model_provider import BACKENDS, CHECKPOINT, DEFAULT_BACKEND, DEVICE, get_provider
+from summary_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES, SummaryCache, summary_key
+import summary_server
+from trace_runtime import parse_policy
+
+checkpoint = CHECKPOINT
+device = DEVICE
+BACKEND = os.environ.get("TRACING_INFERENCE_BACKEND", DEFAULT_BACKEND)  # torch, int8 or onnx
+BATCH_SIZE = 8  # Number of blocks summarized by a single model.generate call
+# How much of each block the model reads and how long it may write; see generation_policy.GenerationPolicy.
+GENERATION_POLICY = GenerationPolicy()
+generation_stats = GenerationStats()  # Latencies and lengths of every model.generate call made by this process
+
+# Summaries are cached on disk across runs; set CACHE_PATH to None to always run the model.
+CACHE_PATH = os.environ.get("TRACING_SUMMARY_CACHE", DEFAULT_CACHE_PATH)
+CACHE_MAX_BYTES = DEFAULT_MAX_BYTES
+summary_cache = None
+
+# Summarize inner functions first and show each parent its inner functions' summaries instead of their code, so
+# nested code is encoded once and parents stay within the model context (--hierarchical).
+HIERARCHICAL = False
+
+# How often instrumented functions log their calls (see trace_runtime.parse_policy): TRACE_POLICY applies to every
+# function except those whose qualified name matches one of the (glob, policy) pairs in TRACE_POLICIES.
+TRACE_POLICY = "all"
+TRACE_POLICIES = []
+
+# Instrumented code logs through this module; a copy is placed next to the outputs so they can import it.
+RUNTIME_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trace_runtime.py")
+
+# Loaded on first use by load_model(), so importing this module never pays for the model.
+tokenizer = None
+model = None
 
 def get_blocks_from_file(file_path, line_number_blocks):
     """Get the content of each block based on line number ranges and store each block as a string in a list."""
@@ -93,99 +53,366 @@ def get_blocks_from_file(file_path, line_number_blocks):
 
     return ["".join(lines[first - 1:last]) for first, last in line_number_blocks]
 
+def load_model():
+    """Returns the tokenizer and model, loading them through the shared model provider on first use."""
+    global tokenizer, model
+    if model is None:
+        tokenizer, model = get_provider(checkpoint, device, BACKEND).load()
+    return tokenizer, model
+
+def get_summary_cache():
+    """Opens the process-wide summary cache on first use, or returns None when caching is disabled."""
+    global summary_cache
+    if not CACHE_PATH:
+        return None
+    if summary_cache is None or summary_cache.path != CACHE_PATH:
+        summary_cache = SummaryCache(CACHE_PATH, CACHE_MAX_BYTES)
+    return summary_cache
+
 def generate_summary(block_code):
     """Generates a basic LLM-generated summary of the given function."""
-    input_ids = tokenizer(block_code, return_tensors="pt").input_ids.to(device)
-    generated_ids = model.generate(input_ids, max_length=300)
-    summary = tokenizer.decode(generated_ids[0], skip_special_tokens=True)
-
-    return summary
-
-def apply_summaries_and_tracing_to_file(file_path, line_number_blocks, summaries):
-    """Inserts LLM-generated summaries as docstrings inside functions and adds enhanced TRACE logs at the beginning of each function."""
-    
-    log_file = "trace_log.txt"  # Define the log file
-
-    with open(file_path, "r") as f:
-        lines = f.readlines()
-
-    insertions = {}
-    for (first, _), summary in zip(line_number_blocks, summaries):
-        indent = " " * (len(lines[first - 1]) - len(lines[first - 1].lstrip()))  # Match function indentation
-        insertions[first] = f'{indent}"""\n{indent}{summary.strip()}\n{indent}"""\n'
-
-    updated_lines = []
-    for i, line in enumerate(lines, start=1):
-        stripped_line = line.strip()
-
-        if i in insertions:
-            updated_lines.append(insertions[i])  # Insert docstring with correct indentation
-
-        updated_lines.append(line)
-
-        # Inject enhanced entry trace logs **inside** the function with correct indentation
-        if line.strip().startswith("def "):
-            function_name_match = re.match(r"def (\w+)\((.*?)\)", line.strip())
-            if function_name_match:
-                function_name = function_name_match.group(1)
-                params = function_name_match.group(2).strip()
-                
-                indent = " " * (len(line) - len(line.lstrip()) + 4)
-
-                if params:
-                    param_list = [p.split('=')[0].strip() for p in params.split(', ') if p.split('=')[0].strip() != 'self']
-                    if param_list:
-                        param_values = ', '.join([f'{p}={{ {p} }}' for p in param_list])
-                        trace_code = f'{indent}print(f"TRACE: Entering {function_name} function with parameters: {param_values}")\n'
-                    else:
-                        trace_code = f'{indent}print(f"TRACE: Entering {function_name} function with no parameters")\n'
-                else:
-                    trace_code = f'{indent}print(f"TRACE: Entering {function_name} function with no parameters")\n'
-                
-                updated_lines.append(trace_code)
-
-    with open(file_path, "w") as f:
-        f.writelines(updated_lines)
-
-def save_to_new_file(source_file, output_file):
-    """Copies the content of the source file to the output file, overwriting or creating the file."""
-
-    # Check if the output file already exists
+    return generate_summaries([block_code], batch_size=1)[0]
+
+def generate_summaries(blocks, batch_size=BATCH_SIZE, cache=None):
+    """Generates summaries for many blocks, only running the model for blocks missing from the summary cache."""
+    if not blocks:
+        return []
+
+    cache = cache if cache is not None else get_summary_cache()
+    if cache is None:
+        return summarize_blocks(blocks, batch_size)
+
+    # Quantized and ONNX backends can word summaries differently, so the backend is part of the key.
+    settings = dict(GENERATION_POLICY.settings(), backend=BACKEND)
+    keys = [summary_key(block, checkpoint, settings) for block in blocks]
+    cached = cache.get_many(keys)
+
+    # Identical blocks share a key, so each distinct miss is summarized once.
+    missing = {key: block for key, block in zip(keys, blocks) if key not in cached}
+    if missing:
+        generated = dict(zip(missing, summarize_blocks(list(missing.values()), batch_size)))
+        cache.put_many(generated)
+        cached.update(generated)
+
+    return [cached[key] for key in keys]
+
+def model_settings():
+    """Everything besides the block that decides what summary the model produces."""
+    return {"checkpoint": checkpoint, "backend": BACKEND, "generation": GENERATION_POLICY.settings()}
+
+def summarize_blocks(blocks, batch_size=BATCH_SIZE):
+    """Uses the summary server when one is running with the same model settings, else runs the model in-process."""
+    summaries = summary_server.request_summaries(blocks, model_settings())
+    if summaries is None:
+        summaries = run_model(blocks, batch_size)
+    return summaries
+
+def run_model(blocks, batch_size=BATCH_SIZE):
+    """Runs one model.generate call per group of similar-length blocks and returns summaries in input order."""
+    tokenizer, model = load_model()
+
+    # Tokenize once without padding, window blocks longer than the model context, then sort by length so each group
+    # only pads up to its own longest block and gets a decode budget sized for blocks of that length.
+    full = tokenizer(blocks).input_ids
+    encoded = [GENERATION_POLICY.fit_input(ids) for ids in full]
+    order = sorted(range(len(blocks)), key=lambda i: len(encoded[i]))
+
+    summaries = [None] * len(blocks)
+    for start in range(0, len(order), batch_size):
+        group = order[start:start + batch_size]
+        lengths = [len(encoded[i]) for i in group]
+        batch = tokenizer.pad({"input_ids": [encoded[i] for i in group]}, return_tensors="pt").to(device)
+        began = time.perf_counter()
+        generated_ids = model.generate(batch.input_ids, attention_mask=batch.attention_mask,
+                                       **GENERATION_POLICY.generate_kwargs(tokenizer, lengths))
+        generation_stats.record(time.perf_counter() - began, lengths, token_counts(generated_ids, tokenizer.pad_token_id),
+                                windowed=sum(len(full[i]) > len(encoded[i]) for i in group))
+
+        for index, summary in zip(group, tokenizer.batch_decode(generated_ids, skip_special_tokens=True)):
+            summaries[index] = summary
+
+    return summaries
+
+def write_output(output_file, content):
+    """Writes instrumented source to the output file, overwriting or creating the file."""
     if os.path.exists(output_file):
         print(f"{output_file} exists. Overwriting the file.")
     else:
         print(f"{output_file} does not exist. Creating a new file.")
 
-    # Copy content from source_file (test_code.py) to output_file
-    with open(source_file, "r") as source:
-        content = source.read()
-
     with open(output_file, "w") as dest:
         dest.write(content)
 
-    print(f"Contents copied to {output_file}")
-
-
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python script.py <input_file> <output_file>")
-        sys.exit(1)
-
-    output_file = sys.argv[1]
+    print(f"Contents written to {output_file}")
+
+def install_runtime(directory):
+    """Copies trace_runtime.py into a directory of instrumented code unless an identical copy is already there."""
+    destination = os.path.join(directory, os.path.basename(RUNTIME_MODULE))
+    if os.path.isfile(destination) and filecmp.cmp(RUNTIME_MODULE, destination, shallow=False):
+        return
+    shutil.copyfile(RUNTIME_MODULE, destination)
+
+def manifest_settings():
+    """Everything besides the source that decides what instrumentation looks like; a manifest made with other settings is ignored."""
+    return dict(model_settings(), hierarchical=HIERARCHICAL,
+                trace_policy=[TRACE_POLICY, [list(rule) for rule in TRACE_POLICIES]])
+
+def trace_policy_for(qualname):
+    """Returns the sampling policy of a function: the first matching TRACE_POLICIES glob, else TRACE_POLICY."""
+    for pattern, policy in TRACE_POLICIES:
+        if fnmatch.fnmatchcase(qualname, pattern):
+            return policy
+    return TRACE_POLICY
+
+def ast_function_hashes(source):
+    """Returns [(first_line, hash)] for every function in the source, or None if it does not parse."""
+    try:
+        line_number_blocks = locate_function_blocks(source)
+    except SyntaxError:
+        return None
+    lines = source.splitlines(keepends=True)
+    return [(first, function_hash("".join(lines[first - 1:last]))) for first, last in line_number_blocks]
+
+def plan_file(file_path, locator, manifest, module=None):
+    """Works out which located functions of a file still need a docstring and a trace statement.
+
+    Functions whose text matches an instrumented output in the manifest are left alone. The others are pending:
+    unchanged ones reuse the summary recorded for their source hash, new or modified ones get None and need the model.
+    module names the file's functions in its traces (see instrument_source).
+    """
+    with open(file_path, "r") as f:
+        source = f.read()
+    lines = source.splitlines(keepends=True)
+
+    line_number_blocks = locator.locate_source(source, file_path)
+    contents = ["".join(lines[first - 1:last]) for first, last in line_number_blocks]
+    ast_hashes = ast_function_hashes(source) or []
+    hash_at = dict(ast_hashes)
+    hashes = [hash_at.get(first) or function_hash(content) for (first, _), content in zip(line_number_blocks, contents)]
+
+    pending = [i for i, block_hash in enumerate(hashes) if not manifest.is_instrumented(block_hash)]
+    return {
+        "source": source,
+        "module": module,
+        "blocks": line_number_blocks,
+        "contents": contents,
+        "hashes": hashes,
+        "function_order": [first for first, _ in ast_hashes],
+        "pending": pending,
+        "summaries": {i: manifest.summary_for(hashes[i]) for i in pending},
+        "recorded": {i: manifest.outputs[block_hash]["summary"] for i, block_hash in enumerate(hashes)
+                     if manifest.is_instrumented(block_hash)},
+    }
+
+def summarize_plans(plans, batch_size=BATCH_SIZE):
+    """Fills in the summaries that no manifest could provide, batching the model calls across all files."""
+    if HIERARCHICAL:
+        return summarize_plans_hierarchically(plans, batch_size)
+    missing = [(plan, i) for plan in plans for i in plan["pending"] if plan["summaries"][i] is None]
+    summaries = generate_summaries([plan["contents"][i] for plan, i in missing], batch_size=batch_size)
+    for (plan, i), summary in zip(missing, summaries):
+        plan["summaries"][i] = summary
+    return len(missing)
+
+def summarize_plans_hierarchically(plans, batch_size=BATCH_SIZE):
+    """Like summarize_plans, but deepest functions first, one batched round per nesting level.
+
+    A parent is summarized from its own code with each directly nested function reduced to its def line and
+    summary, so every line of nested code goes through the model once and closure- or method-heavy parents stay short.
+    """
+    levels = {}
+    for plan in plans:
+        parents = enclosing_blocks(plan["blocks"])
+        children = {}
+        for child, parent in parents.items():
+            children.setdefault(parent, []).append(child)
+        plan["children"] = children
+        for i in plan["pending"]:
+            depth, parent = 0, parents.get(i)
+            while parent is not None:
+                depth, parent = depth + 1, parents.get(parent)
+            levels.setdefault(depth, []).append((plan, i))
+
+    generated = 0
+    for depth in sorted(levels, reverse=True):
+        missing = [(plan, i) for plan, i in levels[depth] if plan["summaries"][i] is None]
+        inputs = [condensed_contents(plan, i) for plan, i in missing]
+        for (plan, i), summary in zip(missing, generate_summaries(inputs, batch_size=batch_size)):
+            plan["summaries"][i] = summary
+        generated += len(missing)
+    return generated
+
+def condensed_contents(plan, i):
+    """The block's code with the bodies of its directly nested functions replaced by their known summaries."""
+    inner = []
+    for child in plan["children"].get(i, []):
+        summary = plan["summaries"].get(child) or plan["recorded"].get(child)
+        if summary:
+            inner.append((*plan["blocks"][child], summary))
+    return condense_block(plan["contents"][i], plan["blocks"][i][0], inner)
+
+def apply_plan(plan):
+    """Returns the planned file's source with every pending function instrumented."""
+    summaries = {plan["blocks"][i][0]: plan["summaries"][i] for i in plan["pending"]}
+    return instrument_source(plan["source"], summaries, policy_for=trace_policy_for, module=plan.get("module"))
+
+def record_manifest(output_file, output_source, plan, manifest):
+    """Writes the manifest for an instrumented output, pairing each input function with its instrumented form.
+
+    Instrumentation only inserts statements, so the n-th function of the output is the n-th function of the input.
+    """
+    output_hashes = ast_function_hashes(output_source)
+    if output_hashes is None or len(output_hashes) != len(plan["function_order"]):
+        print(f"Warning: Could not match the functions of {output_file}; no manifest written.")
+        return
+
+    names = function_names(output_source)
+    position = {first: index for index, first in enumerate(plan["function_order"])}
+    functions = []
+    for i, ((first, _), block_hash) in enumerate(zip(plan["blocks"], plan["hashes"])):
+        if first not in position:
+            continue
+        output_first, output_hash = output_hashes[position[first]]
+        if i in plan["summaries"]:
+            source_hash, summary = block_hash, plan["summaries"][i]
+        else:
+            recorded = manifest.outputs[block_hash]
+            source_hash, summary = recorded["source_hash"], recorded["summary"]
+        functions.append({"name": names.get(output_first, ""), "source_hash": source_hash,
+                          "output_hash": output_hash, "summary": summary})
+
+    Manifest(manifest.settings, functions).save(manifest_path(output_file))
+
+def load_manifest(output_file, incremental=True):
+    """Returns the manifest recorded next to output_file, or an empty one for a full (non-incremental) run."""
+    if not incremental:
+        return Manifest(manifest_settings())
+    return Manifest.load(manifest_path(output_file), manifest_settings())
+
+def instrument_file(target_file, output_file, locator, batch_size=BATCH_SIZE, incremental=True):
+    """Instruments target_file in place and writes the result to output_file, only summarizing new or modified functions."""
+    manifest = load_manifest(output_file, incremental)
+    plan = plan_file(target_file, locator, manifest)
+    generated = summarize_plans([plan], batch_size)
+
+    instrumented = apply_plan(plan)
+    if instrumented != plan["source"]:
+        with open(target_file, "w") as f:
+            f.write(instrumented)
+    write_output(output_file, instrumented)
+    install_runtime(os.path.dirname(os.path.abspath(output_file)))
+    record_manifest(output_file, instrumented, plan, manifest)
+
+    print(f"Instrumented {len(plan['pending'])} of {len(plan['blocks'])} functions ({generated} newly summarized)")
+    if generation_stats.latencies:
+        print(generation_stats.report())
+
+def instrument_project(project_dir, output_dir, locator, batch_size=BATCH_SIZE, incremental=True):
+    """Instruments every Python file under project_dir into output_dir, leaving the originals untouched.
+
+    The locator gets one prefetch over the whole directory (a single Semgrep run for the semgrep backend), and the
+    blocks of all files are summarized together so batches fill up even when individual files are small. Traces
+    name each function after its module, e.g. "pkg.util:Config.__init__". The trace runtime is copied to the top of
+    output_dir; modules run from elsewhere fall back to printing their traces.
+    """
+    source_files = find_python_files(project_dir)
+    locator.prefetch(project_dir)
+
+    jobs = []
+    for source_file in source_files:
+        output_file = os.path.join(output_dir, os.path.relpath(source_file, project_dir))
+        manifest = load_manifest(output_file, incremental)
+        plan = plan_file(source_file, locator, manifest, module_name(source_file, project_dir))
+        jobs.append((source_file, output_file, manifest, plan))
+
+    generated = summarize_plans([plan for _, _, _, plan in jobs], batch_size)
+
+    for source_file, output_file, manifest, plan in jobs:
+        instrumented = apply_plan(plan)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, "w") as f:
+            f.write(instrumented)
+        record_manifest(output_file, instrumented, plan, manifest)
+    if jobs:
+        install_runtime(output_dir)
+
+    print(f"Instrumented {len(jobs)} files into {output_dir} ({generated} functions newly summarized)")
+    if generation_stats.latencies:
+        print(generation_stats.report())
+
+def parse_args(argv=None):
+    """Parse the command line; the two positional files keep the original calling convention."""
+    parser = argparse.ArgumentParser(description="Insert LLM-generated summaries and TRACE statements into a Python file.")
+    parser.add_argument("input_file", nargs="?")
+    parser.add_argument("output_file", nargs="?")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"Number of functions summarized per model call (default: {BATCH_SIZE})")
+    parser.add_argument("--cache-path", default=CACHE_PATH,
+                        help="SQLite file used to cache summaries between runs")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the model, ignoring cached summaries")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND,
+                        help="Inference backend: fp32 PyTorch, int8 dynamic quantization, or ONNX Runtime")
+    parser.add_argument("--locator", choices=sorted(LOCATORS), default="ast",
+                        help="How functions are found: in-process AST walk (default) or a Semgrep scan")
+    parser.add_argument("--rule-file", dest="rule_files", action="append",
+                        help=f"Semgrep rule file used by --locator semgrep; repeat for several (default: {DEFAULT_RULE_FILE})")
+    parser.add_argument("--jobs", type=int, help="Number of parallel Semgrep jobs")
+    parser.add_argument("--project", help="Instrument every Python file under this directory")
+    parser.add_argument("--output-dir", help="Where --project writes the instrumented copies")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifests next to the outputs and re-instrument every function")
+    parser.add_argument("--hierarchical", action="store_true",
+                        help="Summarize nested functions first and give their parents only those summaries")
+    parser.add_argument("--summary-server", default=summary_server.SERVER_ADDRESS, metavar="HOST:PORT",
+                        help="Summary server to use when it is running; pass an empty string to always run the model here")
+    parser.add_argument("--trace-policy", default=TRACE_POLICY,
+                        help="Which calls are traced: all (default), every:N, first:K or rate:R[/BURST] per second")
+    parser.add_argument("--trace-policy-for", dest="trace_policies", action="append", default=[], metavar="GLOB=POLICY",
+                        help="Policy for functions whose qualified name matches GLOB, e.g. 'Parser.*=every:100'; "
+                             "repeat for several, the first match wins")
+    args = parser.parse_args(argv)
+
+    if args.project and not args.output_dir:
+        parser.error("--project requires --output-dir")
+    if not args.project and not (args.input_file and args.output_file):
+        parser.error("the following arguments are required: input_file, output_file")
+    args.rule_files = args.rule_files or [DEFAULT_RULE_FILE]
+
+    rules = []
+    for rule in args.trace_policies:
+        pattern, separator, policy = rule.rpartition("=")
+        if not separator or not pattern:
+            parser.error(f"--trace-policy-for expects GLOB=POLICY, got '{rule}'")
+        rules.append((pattern, policy))
+    for policy in [args.trace_policy] + [policy for _, policy in rules]:
+        try:
+            parse_policy(policy)
+        except ValueError as error:
+            parser.error(str(error))
+    args.trace_policies = rules
+    return args
+
+def main(argv=None):
+    global CACHE_PATH, BACKEND, HIERARCHICAL, TRACE_POLICY, TRACE_POLICIES
+    args = parse_args(argv)
+    CACHE_PATH = None if args.no_cache else args.cache_path
+    BACKEND = args.backend
+    HIERARCHICAL = args.hierarchical
+    TRACE_POLICY = args.trace_policy
+    TRACE_POLICIES = args.trace_policies
+    summary_server.SERVER_ADDRESS = args.summary_server
+
+    locator = get_block_locator(args.locator, rule_files=args.rule_files, jobs=args.jobs)
+
+    if args.project:
+        instrument_project(args.project, args.output_dir, locator, batch_size=args.batch_size, incremental=not args.full)
+        return
+
+    output_file = args.input_file
 
     print("Testing automated instrumentation...")
-    rule_file = "rule.yaml"
     target_file = "test_code.py"
 
-    findings = run_semgrep(rule_file, target_file)
-    print("Semgrep Findings:\n", findings)
-
-    line_number_blocks = extract_first_last_line_numbers(findings)
-    blocks_content = get_blocks_from_file(target_file, line_number_blocks)
-
-    summaries = [generate_summary(block) for block in blocks_content]
-
-    apply_summaries_and_tracing_to_file(target_file, line_number_blocks, summaries)
-    save_to_new_file(target_file, output_file)
+    instrument_file(target_file, output_file, locator, batch_size=args.batch_size, incremental=not args.full)
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+# CodeT5+ 220m saw at most 512 input tokens in training; longer blocks are cut down to a window of that size.
+MAX_INPUT_TOKENS = 512
+HEAD_FRACTION = 0.75  # Share of a window kept from the start of a long block; the rest comes from its end
+MIN_NEW_TOKENS = 16
+MAX_NEW_TOKENS = 128
+NEW_TOKENS_PER_INPUT_TOKEN = 0.25
+SENTENCE_END_TOKENS = (".", "!", "?")
+
+class GenerationPolicy:
+    """Decides how much of a block the model reads and how many tokens it may write about it.
+
+    The decode budget grows with the block: a one-line helper gets MIN_NEW_TOKENS, a long function up to
+    MAX_NEW_TOKENS. Blocks beyond the model context keep their head (signature, docstring, setup) and their tail
+    (return paths) instead of being silently cut off. With stop_at_sentence_end, sentence-ending punctuation counts
+    as an end-of-sequence token, so generation stops after the first sentence instead of running to the budget.
+    """
+
+    def __init__(self, max_input_tokens=MAX_INPUT_TOKENS, min_new_tokens=MIN_NEW_TOKENS,
+                 max_new_tokens=MAX_NEW_TOKENS, new_tokens_per_input_token=NEW_TOKENS_PER_INPUT_TOKEN,
+                 stop_at_sentence_end=True):
+        if not 0 < min_new_tokens <= max_new_tokens:
+            raise ValueError("Generation budgets need 0 < min_new_tokens <= max_new_tokens")
+        if max_input_tokens < 2:
+            raise ValueError("max_input_tokens must leave room for the start and end tokens")
+        self.max_input_tokens = max_input_tokens
+        self.min_new_tokens = min_new_tokens
+        self.max_new_tokens = max_new_tokens
+        self.new_tokens_per_input_token = new_tokens_per_input_token
+        self.stop_at_sentence_end = stop_at_sentence_end
+
+    def settings(self):
+        """Everything that changes the produced summaries, for cache keys and summary server handshakes."""
+        return {"max_input_tokens": self.max_input_tokens, "min_new_tokens": self.min_new_tokens,
+                "max_new_tokens": self.max_new_tokens, "new_tokens_per_input_token": self.new_tokens_per_input_token,
+                "stop_at_sentence_end": self.stop_at_sentence_end}
+
+    def fit_input(self, input_ids):
+        """Returns input_ids, or a head-and-tail window of them when they exceed the model context."""
+        if len(input_ids) <= self.max_input_tokens:
+            return input_ids
+        head = int(self.max_input_tokens * HEAD_FRACTION)
+        tail = self.max_input_tokens - head
+        return input_ids[:head] + input_ids[len(input_ids) - tail:]
+
+    def new_token_budget(self, input_length):
+        budget = self.min_new_tokens + int(input_length * self.new_tokens_per_input_token)
+        return max(self.min_new_tokens, min(self.max_new_tokens, budget))
+
+    def stop_token_ids(self, tokenizer):
+        """The end-of-sequence id, plus the ids of sentence-ending punctuation when stopping at sentence end."""
+        stop_ids = [tokenizer.eos_token_id]
+        if self.stop_at_sentence_end:
+            unknown = getattr(tokenizer, "unk_token_id", None)
+            for token in SENTENCE_END_TOKENS:
+                token_id = tokenizer.convert_tokens_to_ids(token)
+                if token_id is not None and token_id != unknown and token_id not in stop_ids:
+                    stop_ids.append(token_id)
+        return stop_ids
+
+    def generate_kwargs(self, tokenizer, input_lengths):
+        """Keyword arguments for model.generate on a batch; the longest input decides the batch's budget."""
+        return {"max_new_tokens": self.new_token_budget(max(input_lengths)),
+                "eos_token_id": self.stop_token_ids(tokenizer)}
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def token_counts(sequences, pad_token_id):
+    """Non-padding tokens in each generated sequence (tensors or lists)."""
+    rows = sequences.tolist() if hasattr(sequences, "tolist") else sequences
+    return [sum(1 for token in row if token != pad_token_id) for row in rows]
+
+class GenerationStats:
+    """Collects latencies and lengths of model.generate calls and reports their distributions."""
+
+    def __init__(self):
+        self.latencies = []
+        self.input_lengths = []
+        self.output_lengths = []
+        self.windowed = 0
+
+    def record(self, seconds, input_lengths, output_lengths, windowed=0):
+        self.latencies.append(seconds)
+        self.input_lengths.extend(input_lengths)
+        self.output_lengths.extend(output_lengths)
+        self.windowed += windowed
+
+    def report(self):
+        if not self.latencies:
+            return "No summaries generated"
+        latency = " ".join(f"p{int(p * 100)} {percentile(self.latencies, p):.2f}s" for p in (0.5, 0.9, 0.99))
+        outputs = self.output_lengths
+        return (f"Generated {len(outputs)} summaries in {len(self.latencies)} model calls "
+                f"({self.windowed} inputs windowed to the model context). Latency per call: {latency}. "
+                f"Input tokens: p50 {percentile(self.input_lengths, 0.5)} max {max(self.input_lengths)}. "
+                f"Output tokens: p50 {percentile(outputs, 0.5)} p90 {percentile(outputs, 0.9)} max {max(outputs)}.")
@@ -0,0 +1,73 @@
+import ast
+import hashlib
+import json
+
+from summary_cache import normalize_source
+
+MANIFEST_SUFFIX = ".trace-manifest.json"
+MANIFEST_VERSION = 1
+
+def manifest_path(output_file):
+    """The manifest lives next to the instrumented output it describes."""
+    return output_file + MANIFEST_SUFFIX
+
+def function_hash(block_code):
+    """Hashes a function's normalized source, so reformatting does not count as a change."""
+    return hashlib.sha256(normalize_source(block_code).encode("utf-8")).hexdigest()
+
+def function_names(source):
+    """Maps each function's first line to its qualified name (Class.method, outer.inner)."""
+    names = {}
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{prefix}{child.name}"
+                if not isinstance(child, ast.ClassDef):
+                    names[child.lineno] = qualname
+                visit(child, qualname + ".")
+            else:
+                visit(child, prefix)
+
+    try:
+        visit(ast.parse(source), "")
+    except SyntaxError:
+        pass
+    return names
+
+class Manifest:
+    """Records, per instrumented function, the hash of its source, the hash of its instrumented form and its summary.
+
+    A function whose current text matches a recorded source hash can reuse the recorded summary without running
+    the model; one that matches a recorded output hash is already instrumented and is left exactly as it is.
+    """
+
+    def __init__(self, settings=None, functions=None):
+        self.settings = settings or {}
+        self.functions = functions or []
+        self.summaries = {entry["source_hash"]: entry["summary"] for entry in self.functions}
+        self.outputs = {entry["output_hash"]: entry for entry in self.functions}
+
+    @classmethod
+    def load(cls, path, settings):
+        """Reads a manifest, returning an empty one if it is missing, unreadable or was made with other settings."""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(settings)
+
+        if data.get("version") != MANIFEST_VERSION or data.get("settings") != settings:
+            return cls(settings)
+        return cls(settings, data.get("functions", []))
+
+    def summary_for(self, source_hash):
+        return self.summaries.get(source_hash)
+
+    def is_instrumented(self, block_hash):
+        return block_hash in self.outputs
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "functions": self.functions}, f, indent=2)
+            f.write("\n")
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+
+CHECKPOINT = "Salesforce/codet5p-220m-bimodal"
+DEVICE = "cpu"
+
+# torch: the fp32 PyTorch model. int8: the same model with its Linear layers dynamically quantized to int8.
+# onnx: encoder and decoder (with KV cache) exported once to ONNX and run through ONNX Runtime.
+BACKENDS = ("torch", "int8", "onnx")
+DEFAULT_BACKEND = "torch"
+ONNX_EXPORT_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "automated-instrumentation", "onnx")
+
+class ModelProvider:
+    """Loads a CodeT5+ tokenizer and model the first time they are needed and shares them across threads."""
+
+    def __init__(self, checkpoint=CHECKPOINT, device=DEVICE, backend=DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+        if backend != "torch" and device != "cpu":
+            raise ValueError(f"The {backend} backend only runs on the CPU")
+        self.checkpoint = checkpoint
+        self.device = device
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.tokenizer = None
+        self.model = None
+
+    def is_loaded(self):
+        return self.model is not None
+
+    def load(self):
+        """Returns (tokenizer, model), loading them once; concurrent callers wait for the same load."""
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    # transformers (and torch) are only imported here so that importing callers stays cheap.
+                    from transformers import AutoModel, AutoTokenizer
+
+                    print(f"Loading {self.checkpoint} on {self.device} ({self.backend} backend)...")
+                    tokenizer = AutoTokenizer.from_pretrained(self.checkpoint, trust_remote_code=True)
+                    if self.backend == "onnx":
+                        model = load_onnx_model(self.checkpoint, tokenizer)
+                    else:
+                        model = AutoModel.from_pretrained(self.checkpoint, trust_remote_code=True).to(self.device)
+                        if self.backend == "int8":
+                            model = quantize_int8(model)
+
+                    self.tokenizer = tokenizer
+                    self.model = model
+        return self.tokenizer, self.model
+
+    def warm_up(self):
+        """Loads the model and runs one tiny generation so the first real request only pays for inference."""
+        tokenizer, model = self.load()
+        input_ids = tokenizer("def warm_up():\n    pass\n", return_tensors="pt").input_ids.to(self.device)
+        model.generate(input_ids, max_length=8)
+
+def quantize_int8(model):
+    """Returns a copy of the model whose Linear layers use int8 weights with dynamically quantized activations."""
+    import torch
+
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def onnx_export_dir(checkpoint):
+    return os.path.join(ONNX_EXPORT_ROOT, checkpoint.replace("/", "--"))
+
+def load_onnx_model(checkpoint, tokenizer):
+    """Returns an ONNX Runtime seq2seq model for the checkpoint, exporting it on first use.
+
+    The bimodal checkpoint is a custom model class that exporters do not know, but its generation path is a plain
+    T5 encoder-decoder. Its weights are therefore copied into a T5ForConditionalGeneration, which optimum exports
+    as encoder, decoder and decoder-with-past graphs so generation reuses the KV cache.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        raise ImportError("The onnx backend needs the optional packages 'optimum[onnxruntime]' and 'onnxruntime'")
+
+    export_dir = onnx_export_dir(checkpoint)
+    if not os.path.isfile(os.path.join(export_dir, "config.json")):
+        from transformers import AutoModel, T5Config, T5ForConditionalGeneration
+
+        print(f"Exporting {checkpoint} to ONNX in {export_dir} (one-off)...")
+        model = AutoModel.from_pretrained(checkpoint, trust_remote_code=True)
+        settings = {k: v for k, v in model.config.to_dict().items() if k not in ("auto_map", "architectures", "model_type")}
+        t5_model = T5ForConditionalGeneration(T5Config(**settings))
+        missing, _ = t5_model.load_state_dict(model.state_dict(), strict=False)
+        missing = [key for key in missing if not (key == "lm_head.weight" and t5_model.config.tie_word_embeddings)]
+        if missing:
+            raise RuntimeError(f"Cannot map {checkpoint} onto a T5 model for export; missing weights: {missing[:5]}")
+
+        with tempfile.TemporaryDirectory() as staging_dir:
+            t5_model.save_pretrained(staging_dir)
+            tokenizer.save_pretrained(staging_dir)
+            ORTModelForSeq2SeqLM.from_pretrained(staging_dir, export=True, use_cache=True).save_pretrained(export_dir)
+
+    return ORTModelForSeq2SeqLM.from_pretrained(export_dir, use_cache=True)
+
+providers = {}
+providers_lock = threading.Lock()
+
+def get_provider(checkpoint=CHECKPOINT, device=DEVICE, backend=DEFAULT_BACKEND):
+    """Returns the process-wide provider for a checkpoint, device and backend, creating it (but not loading it) if needed."""
+    with providers_lock:
+        key = (checkpoint, device, backend)
+        if key not in providers:
+            providers[key] = ModelProvider(checkpoint, device, backend)
+        return providers[key]
+
+def warm_up(checkpoint=CHECKPOINT, device=DEVICE, backend=DEFAULT_BACKEND):
+    """Loads and exercises the shared model ahead of time, e.g. from a background thread while a UI starts."""
+    get_provider(checkpoint, device, backend).warm_up()
@@ -0,0 +1,38 @@
+"""Starts tracing the child interpreters of a call-graph process capture, see generate_call_graph.
+
+The capture puts this directory first on PYTHONPATH, so every Python process it starts imports this module as it
+starts up, whether spawned by multiprocessing or run by subprocess. Interpreters started with -S or -I skip it.
+"""
+import importlib
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_tracing():
+    if "CALL_GRAPH_PROCESS_CAPTURE" not in os.environ:
+        return
+    sys.path.append(os.path.dirname(HERE))
+    try:
+        import generate_call_graph
+        generate_call_graph.trace_child_process()
+    except Exception as error:
+        print(f"Call graph: not tracing process {os.getpid()}: {error}", file=sys.stderr)
+
+
+def run_next_sitecustomize():
+    """Runs the sitecustomize this one shadows, if any (a virtualenv's or a distribution's)."""
+    path = sys.path[:]
+    this = sys.modules.pop("sitecustomize")
+    sys.path[:] = [entry for entry in path if os.path.abspath(entry or os.curdir) != HERE]
+    try:
+        importlib.import_module("sitecustomize")
+    except ImportError:
+        sys.modules["sitecustomize"] = this
+    finally:
+        sys.path[:] = path + [entry for entry in sys.path if entry not in path]
+
+
+start_tracing()
+run_next_sitecustomize()
@@ -0,0 +1,322 @@
+import ast
+import io
+import textwrap
+import tokenize
+from collections import defaultdict
+
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+SKIPPED_PARAMETERS = {"self", "cls"}
+
+# Added once per instrumented module. Traces go to the buffered trace_runtime log; a program run somewhere
+# trace_runtime.py cannot be imported from still works and prints its traces instead. The fallback is a lambda so
+# that block locators never mistake it for one of the program's functions.
+RUNTIME_IMPORT = "from trace_runtime import trace_call as _trace_call, sampler as _trace_sampler"
+RUNTIME_PREAMBLE = [
+    "try:",
+    f"    {RUNTIME_IMPORT}",
+    "except ImportError:",
+    "    _trace_call = lambda function, names, *values, **options: print(f\"TRACE: Entering {function}\", dict(zip(names, values)))",
+    "    _trace_sampler = lambda policy: lambda: True",
+]
+SAMPLER_PREFIX = "_trace_admit_"
+
+def parameter_names(arguments):
+    """Returns every parameter name of a signature in order: positional-only, regular, *args, keyword-only, **kwargs."""
+    params = list(arguments.posonlyargs) + list(arguments.args)
+    if arguments.vararg is not None:
+        params.append(arguments.vararg)
+    params += list(arguments.kwonlyargs)
+    if arguments.kwarg is not None:
+        params.append(arguments.kwarg)
+    return [param.arg for param in params if param.arg not in SKIPPED_PARAMETERS]
+
+def trace_statement(function_name, names, sampler=None):
+    """Builds the entry trace call; the names tuple is a constant, so each call only passes the argument values.
+
+    With a sampler (see sampler_statement) the call is guarded by it, so a skipped call never builds its arguments.
+    """
+    quoted = [f'"{name}"' for name in names]
+    names_tuple = f"({quoted[0]},)" if len(quoted) == 1 else f"({', '.join(quoted)})"
+    values = "".join(f", {name}" for name in names)
+    call = f'_trace_call("{function_name}", {names_tuple}{values})'
+    return f"if {sampler}(): {call}" if sampler else call
+
+def sampler_statement(sampler, policy):
+    """Builds the module-level assignment that creates the sampler of one function's trace call."""
+    return f'{sampler} = _trace_sampler("{policy}")'
+
+def sampler_assignments(tree):
+    """Maps each sampler name assigned at module level by an earlier run to its assignment."""
+    assignments = {}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) and
+                node.targets[0].id.startswith(SAMPLER_PREFIX) and isinstance(node.value, ast.Call) and
+                isinstance(node.value.func, ast.Name) and node.value.func.id == "_trace_sampler"):
+            assignments[node.targets[0].id] = node
+    return assignments
+
+def is_trace_statement(node):
+    """Recognizes an entry trace added by an earlier run, in its current form or as the older print(f"TRACE: ...")."""
+    if (isinstance(node, ast.If) and not node.orelse and len(node.body) == 1 and isinstance(node.test, ast.Call) and
+            isinstance(node.test.func, ast.Name) and node.test.func.id.startswith(SAMPLER_PREFIX)):
+        node = node.body[0]
+    if not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name)):
+        return False
+    call = node.value
+    if call.func.id == "_trace_call":
+        return True
+    if call.func.id != "print" or not call.args or not isinstance(call.args[0], ast.JoinedStr):
+        return False
+    parts = call.args[0].values
+    return bool(parts) and isinstance(parts[0], ast.Constant) and str(parts[0].value).startswith("TRACE: Entering")
+
+def docstring_statement(summary):
+    """Builds a one-line docstring from a summary, or returns None for an empty summary."""
+    text = " ".join((summary or "").split()).replace("\\", "\\\\").replace('"""', '\\"\\"\\"')
+    if not text:
+        return None
+    if text.endswith('"'):
+        text = text[:-1] + '\\"'
+    return f'"""{text}"""'
+
+def has_docstring(node):
+    first = node.body[0]
+    return isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str)
+
+def statement_start(node):
+    """Returns (line, byte column) where a statement begins, counting decorators as part of a decorated definition."""
+    decorators = getattr(node, "decorator_list", None)
+    if decorators:
+        return decorators[0].lineno, node.col_offset
+    return node.lineno, node.col_offset
+
+def char_column(line, byte_column):
+    """ast reports UTF-8 byte offsets; convert one to a character offset within the line."""
+    if line.isascii():
+        return byte_column
+    return len(line.encode("utf-8")[:byte_column].decode("utf-8", errors="ignore"))
+
+def functions_by_qualname(tree):
+    """Yields (qualname, node) for every function, e.g. "Client.connect" or "outer.inner"."""
+    pending = [(tree, "")]
+    while pending:
+        node, prefix = pending.pop()
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, FUNCTION_NODES + (ast.ClassDef,)):
+                qualname = prefix + child.name
+                if not isinstance(child, ast.ClassDef):
+                    yield qualname, child
+                pending.append((child, qualname + "."))
+            else:
+                pending.append((child, prefix))
+
+def preamble_position(tree):
+    """Returns the (line, byte column) where the runtime import goes: after the module docstring and __future__ imports.
+
+    Only called for modules with a function to instrument, so there is always a statement left to go in front of.
+    """
+    body = tree.body
+    index = 1 if body and has_docstring(tree) else 0
+    while index < len(body) and isinstance(body[index], ast.ImportFrom) and body[index].module == "__future__":
+        index += 1
+    return statement_start(body[index])
+
+def leading_whitespace(line):
+    return line[:len(line) - len(line.lstrip(" \t"))]
+
+def body_continues_header(lines, node):
+    """Whether a function's body is on a line its header continues onto with a backslash ("def f(): \\")."""
+    first = node.body[0]
+    first_line = lines[first.lineno - 1]
+    if first.lineno == node.lineno or first_line[:char_column(first_line, first.col_offset)].strip():
+        return False
+    if not lines[first.lineno - 2].rstrip("\r\n").endswith("\\"):
+        return False
+    header = iter(lines[node.lineno - 1:first.lineno])
+    try:
+        for token in tokenize.generate_tokens(lambda: next(header, "")):
+            if token.type == tokenize.NEWLINE:
+                return False  # The backslash ended a comment, not the header
+            if token.start[0] > first.lineno - node.lineno:
+                return True
+    except (tokenize.TokenError, IndentationError):
+        pass
+    return False
+
+def split_continued_headers(lines, nodes):
+    """Ends each header that a body continues with a backslash, moving that body onto a line of its own.
+
+    Statements added after such a header would otherwise land inside its continuation. Only backslashes and the
+    indentation of the body's first line change, so line numbers stay valid.
+    """
+    for node in nodes:
+        first = node.body[0]
+        header_end = lines[first.lineno - 2]
+        ending = header_end[len(header_end.rstrip("\r\n")):]
+        lines[first.lineno - 2] = header_end.rstrip("\r\n")[:-1].rstrip() + ending
+        body = lines[first.lineno - 1]
+        def_indent = leading_whitespace(lines[node.lineno - 1])
+        indent = leading_whitespace(body)
+        if len(indent) <= len(def_indent) or not indent.startswith(def_indent):
+            lines[first.lineno - 1] = def_indent + ("\t" if "\t" in def_indent else "    ") + body.lstrip(" \t")
+
+def instrument_source(source, summaries_by_line, policy_for=None, module=None):
+    """Returns the source with docstrings and entry traces added to the functions whose def line has a summary.
+
+    Modules that gain a trace call also gain the RUNTIME_PREAMBLE import, placed before their first statement.
+    policy_for maps a function's qualified name to its sampling policy (see trace_runtime.parse_policy); by default
+    every call is traced. A sampled function gets a sampler of its own, created by a module-level assignment placed
+    before the top-level statement that holds the function, and its trace call only runs when the sampler admits it.
+    With a module name, traces name functions "module:qualname", so the same function name in several modules of a
+    project can be told apart in a shared log. A trace left by an earlier run is replaced rather than duplicated, so
+    re-instrumenting a file with different policies updates it in place.
+
+    The file is parsed once with ast, whose positions say exactly where each function body starts. New statements
+    are then spliced into the original text, so signatures spanning several lines, async functions, decorators,
+    comments and the author's formatting all survive untouched. Each edit only touches text at or after its own
+    position, so applying them from the end of the file backwards keeps every earlier position valid.
+    """
+    if not summaries_by_line:
+        return source
+
+    tree = ast.parse(source)
+    lines = io.StringIO(source, newline="").readlines()
+    newline = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+    continued = [node for _, node in functions_by_qualname(tree)
+                 if node.lineno in summaries_by_line and body_continues_header(lines, node)]
+    if continued:
+        split_continued_headers(lines, continued)
+        tree = ast.parse("".join(lines))
+
+    top_level = {function: statement for statement in tree.body for function in ast.walk(statement)
+                 if isinstance(function, FUNCTION_NODES)}
+    old_samplers = sampler_assignments(tree)
+    new_samplers = defaultdict(list)
+    used_samplers = set()
+    edits = []
+    # In source order, so a sampler name that clashes gets the same suffix on every run
+    for qualname, node in sorted(functions_by_qualname(tree), key=lambda function: function[1].lineno):
+        if node.lineno not in summaries_by_line:
+            continue
+
+        first = node.body[0]
+        first_line = lines[first.lineno - 1]
+        first_column = char_column(first_line, first.col_offset)
+        inline = first_line[:first_column].strip() != ""
+        if inline:
+            # "def f(): body" -- the body moves onto its own lines under the def.
+            def_indent = leading_whitespace(lines[node.lineno - 1])
+            body_indent = def_indent + ("\t" if "\t" in def_indent else "    ")
+        else:
+            body_indent = first_line[:first_column]
+
+        anchor = (node.body[1] if len(node.body) > 1 else None) if has_docstring(node) else first
+        replaced = anchor is not None and is_trace_statement(anchor)
+        # The sampler of the trace being replaced goes too; a new one is created if the function is still sampled.
+        old_sampler = anchor.test.func.id if replaced and isinstance(anchor, ast.If) else None
+        if old_sampler in old_samplers:
+            assignment = old_samplers[old_sampler]
+            end = (assignment.end_lineno, char_column(lines[assignment.end_lineno - 1], assignment.end_col_offset))
+            edits.append((assignment.lineno, char_column(lines[assignment.lineno - 1], assignment.col_offset),
+                          "delete", "", [], end))
+
+        policy = policy_for(qualname) if policy_for else None
+        sampler = None
+        if policy and policy != "all":
+            sampler = base = SAMPLER_PREFIX + qualname.replace(".", "_")
+            count = 1
+            while sampler in used_samplers or (sampler in old_samplers and sampler != old_sampler):
+                count += 1
+                sampler = f"{base}_{count}"
+            used_samplers.add(sampler)
+            new_samplers[top_level[node]].append((node.lineno, sampler_statement(sampler, policy)))
+        trace_id = f"{module}:{qualname}" if module else qualname
+        statements = [trace_statement(trace_id, parameter_names(node.args), sampler)]
+        if anchor is first:
+            docstring = docstring_statement(summaries_by_line[node.lineno])
+            statements = ([docstring] if docstring else []) + statements
+        if inline and anchor is not first:
+            edits.append((first.lineno, first_column, "split", body_indent, [], None))
+
+        if replaced:
+            end_column = char_column(lines[anchor.end_lineno - 1], anchor.end_col_offset)
+            end = (anchor.end_lineno, end_column)
+            edits.append((anchor.lineno, char_column(lines[anchor.lineno - 1], anchor.col_offset), "replace",
+                          body_indent, statements, end))
+        elif anchor is None:
+            # The docstring is the whole body: the new statements go on the lines after it.
+            edits.append((first.end_lineno, float("inf"), "append", body_indent, statements, None))
+        else:
+            line, byte_column = statement_start(anchor)
+            edits.append((line, char_column(lines[line - 1], byte_column), "insert", body_indent, statements, None))
+
+    for statement, samplers in new_samplers.items():
+        line, byte_column = statement_start(statement)
+        edits.append((line, char_column(lines[line - 1], byte_column), "insert", "",
+                      [assignment for _, assignment in sorted(samplers)], None))
+
+    if edits and RUNTIME_IMPORT not in source:
+        line, byte_column = preamble_position(tree)
+        edits.append((line, char_column(lines[line - 1], byte_column), "insert", "", RUNTIME_PREAMBLE + [""], None))
+
+    for line, column, kind, body_indent, statements, end in sorted(edits, key=lambda edit: edit[:2], reverse=True):
+        text = lines[line - 1]
+        new_lines = "".join(f"{body_indent}{statement}{newline}" for statement in statements)
+        if kind == "append":
+            if not text.endswith(("\n", "\r")):
+                text += newline
+            lines[line - 1] = text + new_lines
+        elif kind == "replace":
+            end_line, end_column = end
+            prefix = text[:column] if text[:column].strip() == "" else f"{text[:column].rstrip()}{newline}{body_indent}"
+            replacement = f"{newline}{body_indent}".join(statements)
+            lines[line - 1] = f"{prefix}{replacement}{lines[end_line - 1][end_column:]}"
+            for index in range(line, end_line):
+                lines[index] = ""
+        elif kind == "delete":
+            end_line, end_column = end
+            rest = lines[end_line - 1][end_column:]
+            lines[line - 1] = "" if not (text[:column] + rest).strip() else text[:column] + rest
+            for index in range(line, end_line):
+                lines[index] = ""
+        elif kind == "insert" and text[:column].strip() == "":
+            lines[line - 1] = new_lines + text
+        else:
+            lines[line - 1] = f"{text[:column].rstrip()}{newline}{new_lines}{body_indent}{text[column:]}"
+
+    return "".join(lines)
+
+def body_range(block_code):
+    """Returns the block-relative (first, last) lines of the body of the function a block defines.
+
+    Returns None when the block does not parse on its own or its body starts on the def line.
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(block_code))
+    except SyntaxError:
+        return None
+    if not tree.body or not isinstance(tree.body[0], FUNCTION_NODES):
+        return None
+    function = tree.body[0]
+    first, _ = statement_start(function.body[0])
+    if first == function.lineno:
+        return None
+    return first, function.end_lineno
+
+def condense_block(block_code, first_line, inner_summaries):
+    """Returns a block with the body of each inner function replaced by its summary as a docstring.
+
+    inner_summaries holds (first_line, last_line, summary) for functions inside the block, in file line numbers.
+    Inner functions without a summary, or whose body cannot be told apart from their def line, are kept as they are.
+    """
+    lines = block_code.splitlines(keepends=True)
+    for first, last, summary in sorted(inner_summaries, reverse=True):
+        docstring = docstring_statement(summary)
+        offset = first - first_line
+        body = body_range("".join(lines[offset:last - first_line + 1]))
+        if docstring is None or body is None:
+            continue
+        start, end = offset + body[0] - 1, offset + body[1]
+        newline = "\r\n" if lines[start].endswith("\r\n") else "\n"
+        lines[start:end] = [f"{leading_whitespace(lines[start])}{docstring}{newline}"]
+    return "".join(lines)
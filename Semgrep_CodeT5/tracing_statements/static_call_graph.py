@@ -0,0 +1,348 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from block_locator import find_python_files
+from call_graph_export import CALL_GRAPH_FORMATS, CALL_GRAPH_LEVELS, aggregate_call_graph, prune_call_graph, save_call_graph
+from summary_cache import SummaryCache
+
+# Builds a call graph from source alone, for projects that cannot or should not be run. Each module is parsed into
+# a small summary (its functions, classes, imports and call sites); summaries are cached by content hash and only
+# parsed again when the module changes. Calls are then resolved across the whole project:
+#   helper()          a function of the same module, an enclosing function, or an imported name
+#   mod.func()        through `import pkg.mod as mod`, including package re-exports and Class.method
+#   self.method()     the enclosing class or, failing that, its bases within the project
+# Calls on other values (obj.method() for a local obj), builtins and third-party code cannot be resolved and are
+# left out, as are dunder methods, like the dynamic tracer does. Calls inside lambdas and comprehensions count for
+# the enclosing function. Functions are identified by (filename, first line, qualified name), as in
+# generate_call_graph, so both graphs share the export formats in call_graph_export.
+ANALYZER_VERSION = 1  # Bump when the module summary format or its extraction changes
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "automated-instrumentation", "static_call_graph.sqlite3")
+POOL_THRESHOLD = 64  # Fewer modules than this are parsed in-process; a process pool costs more than it saves
+MAX_ALIAS_HOPS = 8  # Re-exports followed before giving up on a name
+
+def module_name(path, root):
+    """Dotted module name of a file under root; a package's __init__.py is named after the package."""
+    parts = os.path.splitext(os.path.relpath(path, root))[0].split(os.sep)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+class ModuleSummarizer(ast.NodeVisitor):
+    """Collects what call resolution needs from one module's AST."""
+
+    def __init__(self, module, is_package):
+        self.module = module
+        self.package = module if is_package else module.rpartition(".")[0]
+        self.functions = {}  # qualname -> first line (the first decorator's line, like co_firstlineno)
+        self.classes = {}  # qualname -> dotted names of its bases
+        self.imports = {}  # local name -> dotted target
+        self.calls = Counter()  # (caller qualname, kind, target, class qualname) -> call sites
+        self.scopes = []  # ("function" | "class", qualname) from the outermost in
+
+    def qualname(self, name):
+        if not self.scopes:
+            return name
+        kind, qualname = self.scopes[-1]
+        return f"{qualname}.<locals>.{name}" if kind == "function" else f"{qualname}.{name}"
+
+    def current_function(self):
+        for kind, qualname in reversed(self.scopes):
+            if kind == "function":
+                return qualname
+        return "<module>"
+
+    def current_class(self):
+        """The class whose method is running, for self.method() calls."""
+        for index in range(len(self.scopes) - 1, 0, -1):
+            if self.scopes[index][0] == "function" and self.scopes[index - 1][0] == "class":
+                return self.scopes[index - 1][1]
+        return None
+
+    def visit_FunctionDef(self, node):
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+        if node.returns:
+            self.visit(node.returns)
+
+        qualname = self.qualname(node.name)
+        self.functions[qualname] = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+        self.scopes.append(("function", qualname))
+        for statement in node.body:
+            self.visit(statement)
+        self.scopes.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        for expression in node.decorator_list + node.bases + [keyword.value for keyword in node.keywords]:
+            self.visit(expression)
+
+        qualname = self.qualname(node.name)
+        self.classes[qualname] = [dotted for dotted in map(dotted_name, node.bases) if dotted]
+        self.scopes.append(("class", qualname))
+        for statement in node.body:
+            self.visit(statement)
+        self.scopes.pop()
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname:
+                self.imports[alias.asname] = alias.name
+            else:
+                # `import a.b` binds a, through which a.b.c() is reached.
+                head = alias.name.partition(".")[0]
+                self.imports[head] = head
+
+    def visit_ImportFrom(self, node):
+        if node.level:
+            base = self.package.split(".") if self.package else []
+            base = base[:len(base) - (node.level - 1)] if node.level > 1 else base
+            source = ".".join(base + ([node.module] if node.module else []))
+        else:
+            source = node.module or ""
+        for alias in node.names:
+            if alias.name != "*":
+                self.imports[alias.asname or alias.name] = f"{source}.{alias.name}" if source else alias.name
+
+    def visit_Call(self, node):
+        caller = self.current_function()
+        func = node.func
+        if isinstance(func, ast.Name):
+            self.calls[caller, "name", func.id, None] += 1
+        elif isinstance(func, ast.Attribute):
+            value = func.value
+            if isinstance(value, ast.Name) and value.id in ("self", "cls") and self.current_class():
+                self.calls[caller, "self", func.attr, self.current_class()] += 1
+            elif (isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id == "super"
+                  and self.current_class()):
+                self.calls[caller, "super", func.attr, self.current_class()] += 1
+            else:
+                dotted = dotted_name(func)
+                if dotted:
+                    self.calls[caller, "attribute", dotted, None] += 1
+        self.generic_visit(node)
+
+    def summary(self):
+        return {"module": self.module, "functions": self.functions, "classes": self.classes, "imports": self.imports,
+                "calls": [[*reference, count] for reference, count in self.calls.items()]}
+
+def dotted_name(node):
+    """"a.b.c" for a chain of attributes on a name, else None."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+def summarize_module(job):
+    """Parses one module into its summary; runs in pool workers, so it takes and returns plain data."""
+    path, module, source = job
+    summarizer = ModuleSummarizer(module, os.path.basename(path) == "__init__.py")
+    try:
+        summarizer.visit(ast.parse(source, path))
+    except (SyntaxError, ValueError, RecursionError) as error:
+        return {"module": module, "error": f"{type(error).__name__}: {error}"}
+    return summarizer.summary()
+
+def cache_key(module, source):
+    payload = f"{ANALYZER_VERSION}\0{module}\0{source}"
+    return hashlib.sha256(payload.encode("utf-8", "surrogatepass")).hexdigest()
+
+def read_source(path):
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", "replace")
+
+def summarize_project(project_dir, jobs=None, cache=None):
+    """Returns ({path: module summary}, number of modules parsed), reusing cached summaries of unchanged modules."""
+    root = os.path.abspath(project_dir)
+    paths = find_python_files(root)
+    sources = {path: read_source(path) for path in paths}
+    keys = {path: cache_key(module_name(path, root), sources[path]) for path in paths}
+
+    cached = cache.get_many(list(keys.values())) if cache else {}
+    summaries = {path: json.loads(cached[keys[path]]) for path in paths if keys[path] in cached}
+    missing = [(path, module_name(path, root), sources[path]) for path in paths if path not in summaries]
+
+    if len(missing) < POOL_THRESHOLD or jobs == 1:
+        parsed = list(map(summarize_module, missing))
+    else:
+        workers = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(summarize_module, missing, chunksize=max(1, len(missing) // (4 * workers))))
+
+    for (path, _, _), summary in zip(missing, parsed):
+        summaries[path] = summary
+    if cache and missing:
+        cache.put_many({keys[path]: json.dumps(summary) for (path, _, _), summary in zip(missing, parsed)})
+    return summaries, len(missing)
+
+class ProjectIndex:
+    """Resolves the call sites of module summaries to the functions they call."""
+
+    def __init__(self, summaries):
+        self.summaries = summaries
+        self.paths = {summary["module"]: path for path, summary in summaries.items()}
+
+    def function(self, module, qualname):
+        path = self.paths.get(module)
+        if path is None:
+            return None
+        line = self.summaries[path].get("functions", {}).get(qualname)
+        if line is None or qualname.rpartition(".")[2].startswith("__"):
+            return None
+        return (path, line, qualname)
+
+    def resolve_dotted(self, dotted, table="functions", hops=0):
+        """Finds the (module, qualname) a fully qualified name refers to in the given table of module summaries.
+
+        Imports are followed when a module only re-exports the name, as package __init__ files often do.
+        """
+        if hops > MAX_ALIAS_HOPS:
+            return None
+        parts = dotted.split(".")
+        for split in range(len(parts) - 1, 0, -1):
+            module = ".".join(parts[:split])
+            if module not in self.paths:
+                continue
+            summary = self.summaries[self.paths[module]]
+            qualname = ".".join(parts[split:])
+            if qualname in summary.get(table, {}):
+                return module, qualname
+            target = summary.get("imports", {}).get(parts[split])
+            if target and target != dotted:
+                return self.resolve_dotted(".".join([target] + parts[split + 1:]), table, hops + 1)
+            return None
+        return None
+
+    def resolve_function(self, dotted):
+        found = self.resolve_dotted(dotted)
+        return self.function(*found) if found else None
+
+    def resolve_name(self, summary, caller, name):
+        module = summary["module"]
+        # Functions defined in the caller or in the functions around it come first, then the module's own names.
+        scopes = caller.split(".<locals>.") if caller != "<module>" else []
+        for depth in range(len(scopes), 0, -1):
+            found = self.function(module, ".<locals>.".join(scopes[:depth]) + f".<locals>.{name}")
+            if found:
+                return found
+        found = self.function(module, name)
+        if found:
+            return found
+        target = summary.get("imports", {}).get(name)
+        return self.resolve_function(target) if target else None
+
+    def resolve_attribute(self, summary, dotted):
+        head, _, rest = dotted.partition(".")
+        target = summary.get("imports", {}).get(head)
+        if target:
+            return self.resolve_function(f"{target}.{rest}")
+        # Class.method() on a class of the same module.
+        return self.function(summary["module"], dotted)
+
+    def resolve_method(self, module, class_qualname, method, skip_own=False, seen=None):
+        """Looks a method up on a class and then depth-first on its bases, as far as they are in the project."""
+        seen = seen if seen is not None else set()
+        if (module, class_qualname) in seen or module not in self.paths:
+            return None
+        seen.add((module, class_qualname))
+        if not skip_own:
+            found = self.function(module, f"{class_qualname}.{method}")
+            if found:
+                return found
+        summary = self.summaries[self.paths[module]]
+        for base in summary.get("classes", {}).get(class_qualname, []):
+            base_class = self.locate_class(summary, base)
+            if base_class:
+                found = self.resolve_method(*base_class, method, seen=seen)
+                if found:
+                    return found
+        return None
+
+    def locate_class(self, summary, dotted):
+        """Returns (module, class qualname) for a base class expression, if the class is part of the project."""
+        if dotted in summary.get("classes", {}):
+            return summary["module"], dotted
+        head, _, rest = dotted.partition(".")
+        target = summary.get("imports", {}).get(head)
+        if not target:
+            return None
+        return self.resolve_dotted(f"{target}.{rest}" if rest else target, "classes")
+
+    def resolve(self, summary, caller, kind, target, class_qualname):
+        if kind == "name":
+            return self.resolve_name(summary, caller, target)
+        if kind == "attribute":
+            return self.resolve_attribute(summary, target)
+        if kind == "self":
+            return self.resolve_method(summary["module"], class_qualname, target)
+        if kind == "super":
+            return self.resolve_method(summary["module"], class_qualname, target, skip_own=True)
+        return None
+
+def build_call_graph(summaries):
+    """Returns the call graph of a project: caller -> Counter of callees, counted in call sites."""
+    index = ProjectIndex(summaries)
+    graph = defaultdict(Counter)
+    for path, summary in summaries.items():
+        functions = summary.get("functions", {})
+        for caller, kind, target, class_qualname, count in summary.get("calls", []):
+            callee = index.resolve(summary, caller, kind, target, class_qualname)
+            if callee is None:
+                continue
+            caller_id = (path, 1, "<module>") if caller == "<module>" else (path, functions[caller], caller)
+            graph[caller_id][callee] += count
+    return graph
+
+def analyze_project(project_dir, jobs=None, cache_path=DEFAULT_CACHE_PATH):
+    """Summarizes every module under project_dir (in parallel, through the cache) and returns its call graph."""
+    cache = SummaryCache(cache_path) if cache_path else None
+    try:
+        summaries, parsed = summarize_project(project_dir, jobs, cache)
+    finally:
+        if cache:
+            cache.close()
+    for path, summary in summaries.items():
+        if "error" in summary:
+            print(f"Warning: Could not parse {path}: {summary['error']}")
+    return build_call_graph(summaries), len(summaries), parsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a call graph of a Python project without running it.")
+    parser.add_argument("project_dir")
+    parser.add_argument("--output", help="Write the graph here; .dot, .json, .graphml and .svg select those formats, "
+                                         "anything else is text")
+    parser.add_argument("--format", choices=sorted(CALL_GRAPH_FORMATS), help="Override the format implied by --output")
+    parser.add_argument("--level", choices=CALL_GRAPH_LEVELS, default="function",
+                        help="Merge functions into their class or module before exporting")
+    parser.add_argument("--top", type=int, help="Keep only this many edges, those with the most call sites")
+    parser.add_argument("--jobs", type=int, help="Worker processes used to parse modules (default: one per CPU)")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="SQLite file caching per-module results")
+    parser.add_argument("--no-cache", action="store_true", help="Parse every module again")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    graph, modules, parsed = analyze_project(args.project_dir, args.jobs, None if args.no_cache else args.cache_path)
+    edges = sum(len(callees) for callees in graph.values())
+    print(f"Analyzed {modules} modules ({parsed} parsed, {modules - parsed} cached) in "
+          f"{time.perf_counter() - start:.2f}s: {edges} call edges")
+    graph = prune_call_graph(aggregate_call_graph(graph, args.level), args.top)
+
+    if args.output:
+        save_call_graph(graph, args.output, args.format)
+        print(f"Call graph written to {args.output}")
+    else:
+        print(CALL_GRAPH_FORMATS[args.format or "text"](graph), end="")
+
+if __name__ == "__main__":
+    main()
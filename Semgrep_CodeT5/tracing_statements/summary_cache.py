@@ -0,0 +1,108 @@
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import textwrap
+import threading
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "automated-instrumentation", "summaries.sqlite3")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # Evict least recently used summaries beyond this size
+
+def normalize_source(block_code):
+    """Returns a position-free AST dump of the block so formatting, comments and indentation do not change its key."""
+    source = textwrap.dedent(block_code)
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        # Blocks that do not parse on their own fall back to their whitespace-trimmed text.
+        return "\n".join(line.rstrip() for line in source.strip().splitlines())
+    return ast.dump(tree, annotate_fields=False, include_attributes=False)
+
+def summary_key(block_code, checkpoint, settings):
+    """Hashes the normalized block together with everything else that affects the generated summary."""
+    payload = json.dumps({"source": normalize_source(block_code), "checkpoint": checkpoint, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SummaryCache:
+    """SQLite-backed map from summary keys to generated summaries with size-based LRU eviction."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, summary TEXT NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+        self.connection.commit()
+
+    def get_many(self, keys):
+        """Returns {key: summary} for the keys that are cached and marks them as recently used."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.connection.execute(f"SELECT key, summary FROM summaries WHERE key IN ({placeholders})", chunk)
+                found.update(rows.fetchall())
+            if found:
+                tick = self._next_tick()
+                self.connection.executemany("UPDATE summaries SET last_used = ? WHERE key = ?", [(tick, key) for key in found])
+                self.connection.commit()
+        return found
+
+    def put_many(self, items):
+        """Stores {key: summary} pairs and evicts the least recently used entries if the cache grew too large."""
+        if not items:
+            return
+
+        with self.lock:
+            tick = self._next_tick()
+            rows = [(key, summary, len(key) + len(summary.encode("utf-8")), tick) for key, summary in items.items()]
+            self.connection.executemany("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self.connection.commit()
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put(self, key, summary):
+        self.put_many({key: summary})
+
+    def size(self):
+        """Returns the number of bytes currently accounted to cached summaries."""
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+
+    def _next_tick(self):
+        # A counter stored in the table orders accesses exactly, even across processes sharing the file.
+        return self.connection.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM summaries").fetchone()[0]
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        victims = []
+        for key, size in self.connection.execute("SELECT key, size FROM summaries ORDER BY last_used").fetchall():
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.connection.executemany("DELETE FROM summaries WHERE key = ?", victims)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,184 @@
+import argparse
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A long-lived process that keeps the tokenizer and model in memory so editor commands and CLI runs only pay for
+# inference. Start it with `python summary_server.py`; generate_tracing_statements uses it whenever it answers on
+# SERVER_ADDRESS and runs the model in-process otherwise. Set TRACING_SUMMARY_SERVER to "" to never use it.
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+SERVER_ADDRESS = os.environ.get("TRACING_SUMMARY_SERVER", DEFAULT_ADDRESS)
+CONNECT_TIMEOUT = 0.5  # Seconds to wait for the server to accept; generation itself may take much longer
+BATCH_WINDOW = 0.02  # Seconds to wait for more requests after the first one before generating
+MAX_BATCH = 32  # Most blocks run through a single model.generate call
+
+class Batcher:
+    """Merges requests that arrive within a short window into one call of run(blocks) -> summaries.
+
+    Callers get a Future per request. A single worker thread drains the queue: it waits for a first request, keeps
+    collecting until the window closes or MAX_BATCH blocks are waiting, runs them together and hands each caller
+    its own slice of the results.
+    """
+
+    def __init__(self, run, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.run = run
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.thread = threading.Thread(target=self._work, name="summary-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, blocks):
+        future = Future()
+        self.requests.put((list(blocks), future))
+        return future
+
+    def _work(self):
+        while True:
+            pending = [self.requests.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                size += len(pending[-1][0])
+            self._run_batch(pending)
+
+    def _run_batch(self, pending):
+        blocks = [block for request_blocks, _ in pending for block in request_blocks]
+        self.batches += 1
+        try:
+            summaries = self.run(blocks) if blocks else []
+        except Exception as error:
+            for _, future in pending:
+                future.set_exception(error)
+            return
+
+        start = 0
+        for request_blocks, future in pending:
+            future.set_result(summaries[start:start + len(request_blocks)])
+            start += len(request_blocks)
+
+class SummaryRequestHandler(BaseHTTPRequestHandler):
+    """POST /summarize {"blocks": [...], "settings": {...}} -> {"summaries": [...]}; GET /health -> server settings."""
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"error": "not found"})
+            return
+        self.send_json(200, {"settings": self.server.settings, "batches": self.server.batcher.batches})
+
+    def do_POST(self):
+        if self.path != "/summarize":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            blocks = request["blocks"]
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {"error": "expected a JSON body with a list of blocks"})
+            return
+
+        # Summaries from another checkpoint, backend or generation setting would poison the caller's cache.
+        if request.get("settings") != self.server.settings:
+            self.send_json(409, {"error": "settings differ", "settings": self.server.settings})
+            return
+
+        try:
+            summaries = self.server.batcher.submit(blocks).result()
+        except Exception as error:
+            self.send_json(500, {"error": f"{type(error).__name__}: {error}"})
+            return
+        self.send_json(200, {"summaries": summaries})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class SummaryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, run, settings, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        super().__init__(address, SummaryRequestHandler)
+        self.settings = settings
+        self.batcher = Batcher(run, window, max_batch)
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def request_summaries(blocks, settings, address=None):
+    """Asks a running server for summaries; returns None if none is listening or it cannot serve these settings."""
+    address = SERVER_ADDRESS if address is None else address
+    if not address or not blocks:
+        return None
+
+    host, port = parse_address(address)
+    connection = http.client.HTTPConnection(host, port, timeout=CONNECT_TIMEOUT)
+    try:
+        connection.connect()
+        connection.sock.settimeout(None)  # Generation can take a while once the request is accepted
+        connection.request("POST", "/summarize", json.dumps({"blocks": blocks, "settings": settings}),
+                           {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+
+    if response.status != 200:
+        print(f"Summary server at {address} could not help ({payload.get('error')}); running the model here.")
+        return None
+    return payload["summaries"]
+
+def main(argv=None):
+    import generate_tracing_statements
+    from model_provider import BACKENDS
+
+    parser = argparse.ArgumentParser(description="Keep CodeT5+ loaded and serve batched summarization requests.")
+    parser.add_argument("--address", default=SERVER_ADDRESS or DEFAULT_ADDRESS, help=f"host:port (default: {DEFAULT_ADDRESS})")
+    parser.add_argument("--backend", choices=BACKENDS, default=generate_tracing_statements.BACKEND)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW * 1000,
+                        help="How long to gather concurrent requests before generating")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Most blocks per model.generate call")
+    args = parser.parse_args(argv)
+
+    generate_tracing_statements.BACKEND = args.backend
+    generate_tracing_statements.get_provider(generate_tracing_statements.checkpoint, generate_tracing_statements.device,
+                                             args.backend).warm_up()
+
+    def run(blocks):
+        return generate_tracing_statements.run_model(blocks, batch_size=args.max_batch)
+
+    server = SummaryServer(parse_address(args.address), run, generate_tracing_statements.model_settings(),
+                           args.window_ms / 1000, args.max_batch)
+    print(f"Serving summaries on {args.address} ({args.backend} backend). Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(generate_tracing_statements.generation_stats.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import atexit
+import collections
+import itertools
+import json
+import marshal
+import operator
+import os
+import reprlib
+import struct
+import sys
+import threading
+import time
+
+# Instrumented programs import this module and call trace_call() on every function entry. Records go into an
+# in-memory ring buffer; a background thread appends them to a binary log in marshalled batches, so traced functions
+# never wait on file or terminal I/O. The settings below can be overridden with environment variables or configure().
+# Read a log with read_log(), or print it as JSON lines with: python trace_runtime.py trace_log.bin
+LOG_PATH = os.environ.get("TRACE_LOG", "trace_log.bin")
+BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", 65536))  # Records kept in memory; the oldest are dropped when full
+FLUSH_INTERVAL = float(os.environ.get("TRACE_FLUSH_INTERVAL", 0.5))  # Seconds between background flushes
+MAX_LOG_BYTES = int(os.environ.get("TRACE_MAX_LOG_BYTES", 16 * 1024 * 1024))  # Rotate the log beyond this size
+BACKUP_COUNT = int(os.environ.get("TRACE_BACKUP_COUNT", 3))  # Rotated logs kept as trace_log.bin.1, .2, ...
+MAX_REPR = 80  # Characters kept from each argument's repr
+
+arg_repr = reprlib.Repr()
+arg_repr.maxstring = arg_repr.maxother = arg_repr.maxlong = MAX_REPR
+arg_repr.maxlevel = 2
+SMALL_TYPES = (bool, float, type(None))
+RAW_TYPES = frozenset((int, float, bool, type(None)))  # Stored as they are and only turned into text when read
+RECORD_BYTES = 80  # The most marshal takes for a record without its argument values
+MAX_VALUE_BYTES = 4 * MAX_REPR  # The room a batch may take per argument value before its large ints become reprs
+
+# The log is a series of frames, each a FRAME header (kind, body length) followed by a marshalled body. A DEFINITIONS
+# body lists the (function id, function, parameter names) of the functions first traced since the previous one; a
+# RECORDS body is a batch of records.
+FRAME = struct.Struct("<cI")
+DEFINITIONS, RECORDS = b"D", b"R"
+VALUES = operator.itemgetter(4)
+
+def bounded_repr(value):
+    """A repr that stays short however large the value is; objects whose repr fails do not break the program."""
+    # Short strings, small ints and the like are by far the most common arguments; repr them directly.
+    kind = type(value)
+    if kind in SMALL_TYPES or (kind is int and -10 ** 18 < value < 10 ** 18) or (kind is str and len(value) <= MAX_REPR):
+        return repr(value)
+    try:
+        return arg_repr.repr(value)
+    except Exception:
+        return f"<unrepresentable {type(value).__name__}>"
+
+def bounded_int(value):
+    """Returns an int beyond 64 bits as its bounded repr and any other value as it is."""
+    if type(value) is int and not -2 ** 63 <= value < 2 ** 63:
+        return bounded_repr(value)
+    return value
+
+class RotatingLog:
+    """Appends bytes to a log file, shifting it to .1, .2, ... once it would grow past max_bytes.
+
+    Each new file starts with the current preamble, so every file can be read on its own.
+    """
+
+    def __init__(self, path, max_bytes=MAX_LOG_BYTES, backup_count=BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.preamble = b""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "ab")
+        self.size = self.file.tell()
+
+    def write(self, data):
+        if self.max_bytes and self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+            data = self.preamble + data
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, "wb")
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+class TraceWriter:
+    """Ring buffer of trace records drained to a RotatingLog by a daemon thread.
+
+    A record is the fixed tuple (sequence number, wall-clock ns, thread id, function id, arg values). Functions get
+    their id on their first call and the next flush writes the definition out, so records never carry names.
+    Numbers and None are immutable and cheap to marshal, so calls passing only those store them untouched; any
+    other arguments are stored as bounded reprs taken at call time. Ints can be arbitrarily large, so a batch
+    whose values take more than MAX_VALUE_BYTES each on average is written with its ints beyond 64 bits as reprs.
+    Appending to a bounded deque is atomic, so producers take no lock; when the program outruns the writer the
+    oldest records are overwritten and show up as missing sequence numbers. self.dropped counts them as the
+    highest sequence number written so far, plus one, minus the records written, which stays right when threads
+    append out of order (a record still on its way to the buffer counts as dropped until it is written). Each
+    flush marshals its records as one list, which costs far less per record than pickling or formatting text.
+    """
+
+    def __init__(self, path=LOG_PATH, buffer_size=BUFFER_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_bytes=MAX_LOG_BYTES, backup_count=BACKUP_COUNT):
+        self.log = RotatingLog(path, max_bytes, backup_count)
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.wake_at = max(1, buffer_size // 2)
+        self.flush_interval = flush_interval
+        self.sequence = itertools.count()
+        self.function_ids = {}  # function -> (function id, parameter names) of its latest call site
+        self.definitions = {}  # (function, parameter names) -> function id
+        self.new_definitions = []
+        self.define_lock = threading.Lock()
+        self.highest = -1
+        self.dropped = 0
+        self.written = 0
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, function, names, values):
+        entry = self.function_ids.get(function)
+        if entry is None or entry[1] is not names:
+            entry = self.define(function, names)
+        if not RAW_TYPES.issuperset(map(type, values)):
+            values = tuple(map(bounded_repr, values))
+        buffer = self.buffer
+        buffer.append((next(self.sequence), time.time_ns(), threading.get_ident(), entry[0], values))
+        if len(buffer) >= self.wake_at:
+            self.wakeup.set()
+
+    def define(self, function, names):
+        """Hands out the id of a function's first call with these parameter names; the next flush writes it out."""
+        with self.define_lock:
+            key = (function, names)
+            function_id = self.definitions.get(key)
+            if function_id is None:
+                function_id = self.definitions[key] = len(self.definitions)
+                self.new_definitions.append((function_id, function, names))
+            entry = self.function_ids[function] = (function_id, names)
+        return entry
+
+    def flush(self):
+        """Writes every buffered record to the log; safe to call from any thread."""
+        with self.flush_lock:
+            buffer = self.buffer
+            records = list(itertools.starmap(buffer.popleft, itertools.repeat((), len(buffer))))
+            if not records:
+                return
+
+            data = b""
+            if self.new_definitions:
+                with self.define_lock:
+                    definitions, self.new_definitions = self.new_definitions, []
+                    everything = [(function_id, function, names) for (function, names), function_id
+                                  in self.definitions.items()]
+                data = frame(DEFINITIONS, marshal.dumps(definitions))
+                self.log.preamble = frame(DEFINITIONS, marshal.dumps(everything))
+            body = marshal.dumps(records)
+            if len(body) > RECORD_BYTES * len(records) + MAX_VALUE_BYTES * sum(map(len, map(VALUES, records))):
+                body = marshal.dumps([record[:4] + (tuple(map(bounded_int, record[4])),) for record in records])
+            self.log.write(data + frame(RECORDS, body))
+            self.highest = max(self.highest, max(records)[0])
+            self.written += len(records)
+            self.dropped = self.highest + 1 - self.written
+
+    def _run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Stops the background thread and writes whatever is still buffered."""
+        if self.stopped:
+            return
+        self.stopped = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+        self.log.close()
+
+class EveryN:
+    """Admits the first call and then every n-th one."""
+
+    def __init__(self, n):
+        self.n = n
+        self.calls = 0
+
+    def admit(self):
+        calls = self.calls
+        self.calls = calls + 1
+        return calls % self.n == 0
+
+class FirstK:
+    """Admits the first k calls and nothing after them."""
+
+    def __init__(self, k):
+        self.k = k
+        self.calls = 0
+
+    def admit(self):
+        if self.calls < self.k:
+            self.calls += 1
+            return True
+        return False
+
+class TokenBucket:
+    """Admits up to rate calls per second on average, with bursts of up to burst calls."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.last = clock()
+
+    def admit(self):
+        now = self.clock()
+        tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return True
+        self.tokens = tokens
+        return False
+
+def parse_policy(spec):
+    """Turns a policy spec into a sampler, or None for "all".
+
+    Specs: "all" traces every call, "every:N" one call in N, "first:K" the first K calls, and "rate:R" or "rate:R/B"
+    at most R calls per second with bursts of B (default: R, at least 1). Raises ValueError for anything else.
+    """
+    kind, _, value = spec.partition(":")
+    try:
+        if kind == "all" and not value:
+            return None
+        if kind == "every" and int(value) >= 1:
+            return EveryN(int(value))
+        if kind == "first" and int(value) >= 0:
+            return FirstK(int(value))
+        if kind == "rate":
+            rate, _, burst = value.partition("/")
+            rate = float(rate)
+            burst = float(burst) if burst else max(1.0, rate)
+            if rate > 0 and burst >= 1:
+                return TokenBucket(rate, burst)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid trace policy '{spec}': use all, every:N, first:K or rate:R[/B]")
+
+def sampler(spec):
+    """Returns the admit() of a new sampler for spec, or one that admits everything for "all".
+
+    Instrumented modules create one per sampled function when they are imported and test it before calling
+    trace_call, so a skipped call costs one counter check and never builds its arguments. Counters are not locked,
+    so with several threads calling the same function the sampled share is approximate.
+    """
+    policy = parse_policy(spec)
+    return policy.admit if policy else (lambda: True)
+
+# Samplers of trace_call(..., policy=...) calls written by hand, created on first use, one per (function, policy).
+samplers = {}
+
+writer = None
+writer_lock = threading.Lock()
+
+def get_writer():
+    """Starts the process-wide writer on the first traced call."""
+    global writer
+    with writer_lock:
+        if writer is None:
+            writer = TraceWriter()
+            atexit.register(writer.close)
+    return writer
+
+def configure(**settings):
+    """Replaces the process-wide writer, e.g. configure(path="run.bin", max_bytes=1 << 20); returns the new writer."""
+    global writer
+    with writer_lock:
+        if writer is not None:
+            writer.close()
+            atexit.unregister(writer.close)
+        writer = TraceWriter(**settings)
+        atexit.register(writer.close)
+    return writer
+
+def flush():
+    if writer is not None:
+        writer.flush()
+
+def trace_call(function, names, *values, policy=None):
+    """Called by instrumented code on function entry: trace_call("Class.method", ("a", "b"), a, b).
+
+    With a policy (e.g. policy="every:100") the sampler decides first. Instrumented code does not pass one: it
+    tests a sampler() of its own before calling, which is cheaper still.
+    """
+    if policy is not None:
+        admit = samplers.get((function, policy))
+        if admit is None:
+            sampler = parse_policy(policy)
+            admit = samplers.setdefault((function, policy), sampler.admit if sampler else (lambda: True))
+        if not admit():
+            return
+    (writer or get_writer()).record(function, names, values)
+
+def frame(kind, body):
+    return FRAME.pack(kind, len(body)) + body
+
+def read_log(path=LOG_PATH):
+    """Yields the records of a trace log as dictionaries. Only read logs you trust: marshal does not check its input."""
+    functions = {}
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            kind, size = FRAME.unpack(header)
+            body = f.read(size)
+            if kind == DEFINITIONS:
+                for function_id, function, names in marshal.loads(body):
+                    functions[function_id] = (function, names)
+                continue
+            for seq, time_ns, thread, function_id, values in marshal.loads(body):
+                function, names = functions[function_id]
+                values = [value if type(value) is str else bounded_repr(value) for value in values]
+                yield {"seq": seq, "time_ns": time_ns, "thread": thread, "function": function,
+                       "args": dict(zip(names, values))}
+
+if __name__ == "__main__":
+    for path in sys.argv[1:] or [LOG_PATH]:
+        for entry in read_log(path):
+            print(json.dumps(entry))